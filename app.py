@@ -1,24 +1,38 @@
 from __future__ import annotations
 
+import asyncio
 import os
-import time
 import json
 import logging
 from typing import Optional
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 
 # Features
-from src.features.ai_schedule.schedule_controller import GenSchedule
+from src.features.ai_schedule.schedule_controller import GenSchedule, prepare_schedule, schedule_mode
 from src.constant.ScheduleType import Schedule
+from src.utils.model_registry import get_registry, init_registry
+from src.utils.driver_pool import DriverPool
+from src.utils.roadmap_cache import find_cached_roadmap, normalize_target, roadmap_filter, save_roadmap
+from src.utils.single_flight import MongoLease, SingleFlight
+from src.utils.executors import run_blocking, shutdown_executors
+from src.utils.job_queue import JobQueue, JobWorkerPool, serialize_job
+from src.utils.mongo_indexes import ensure_indexes, ttl_expiry
+from src.utils.gemini_client import metrics as llm_metrics
+from src.utils.env import env_flag, get_env_var
+from src.utils.stream_events import QueueCallbackHandler, format_sse
+from src.utils.semantic_cache import SemanticCache
+from src.utils.schedule_templates import ScheduleTemplateStore, build_templates
+from src.utils.schedule_dates import duration_bucket, extract_schedule_json, format_date, parse_date, redate_result
 
 # MongoDB
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo.errors import BulkWriteError, ConnectionFailure
 
 # Selenium for crawling
 from selenium import webdriver
@@ -30,28 +44,19 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
 from webdriver_manager.chrome import ChromeDriverManager
 
+# Readiness layer (dùng chung với roadmap_crawler/)
+from roadmap_crawler.utils.PageReadiness import (
+    StageTimer,
+    install_mutation_tracker,
+    install_network_tracker,
+    wait_for_document_ready,
+    wait_for_generation_complete,
+    wait_for_url_change,
+)
+
 # -----------------------------
-# Helpers: env loader
+# Helpers
 # -----------------------------
-def get_env_var(key: str, default: Optional[str] = None) -> Optional[str]:
-    """
-    Lấy biến môi trường theo thứ tự:
-      1) os.environ (Render/Railway/Heroku đặt ở đây)
-      2) .env (nếu có python-dotenv và file tồn tại)
-      3) default
-    """
-    if key in os.environ:
-        return os.environ.get(key)
-    try:
-        from dotenv import dotenv_values  # optional import
-        vals = dotenv_values(".env")
-        if key in vals and vals[key]:
-            return vals[key]
-    except Exception:
-        pass
-    return default
-
-
 def utcnow_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
@@ -80,6 +85,17 @@ mongo_client: Optional[MongoClient] = None
 db = None
 roadmaps_collection = None
 learning_path_collection = None
+crawl_lease: Optional[MongoLease] = None
+job_queue: Optional[JobQueue] = None
+job_workers: Optional[JobWorkerPool] = None
+schedule_cache: Optional[SemanticCache] = None
+template_store: Optional[ScheduleTemplateStore] = None
+
+
+def _embed_cache_key(text: str):
+    """Embedding cho khoá semantic cache (dùng chung model của registry)."""
+    return get_registry().get_embeddings().embed_query(text)
+
 
 try:
     MONGODB_URI = get_env_var("MONGODB_URI")
@@ -95,6 +111,25 @@ try:
     db = mongo_client[DATABASE_NAME]
     roadmaps_collection = db["roadmaps"]
     learning_path_collection = db["learning_path"]
+    if env_flag("CRAWL_LEASE_ENABLED", True):
+        crawl_lease = MongoLease(db["crawl_leases"], ttl_seconds=float(get_env_var("CRAWL_LEASE_TTL", "180")))
+    job_queue = JobQueue(
+        db["jobs"],
+        max_attempts=int(get_env_var("JOB_MAX_ATTEMPTS", "3")),
+        backoff_base=float(get_env_var("JOB_BACKOFF_BASE", "5")),
+        retention_days=float(get_env_var("JOB_RETENTION_DAYS", "7")),
+    )
+    if env_flag("SEMANTIC_CACHE_ENABLED", True):
+        schedule_cache = SemanticCache(
+            db["schedule_cache"],
+            _embed_cache_key,
+            threshold=float(get_env_var("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+            ttl_seconds=float(get_env_var("SEMANTIC_CACHE_TTL_HOURS", "72")) * 3600,
+            max_entries=int(get_env_var("SEMANTIC_CACHE_MAX_ENTRIES", "5000")),
+            min_semantic_words=int(get_env_var("SEMANTIC_CACHE_MIN_WORDS", "5")),
+        )
+    if env_flag("SCHEDULE_TEMPLATES_ENABLED", True):
+        template_store = ScheduleTemplateStore(db["schedule_templates"])
     logger.info("✅ MongoDB connection established")
 except Exception as e:
     logger.error(f"❌ MongoDB connection failed: {e}")
@@ -108,15 +143,148 @@ class RoadmapRequest(BaseModel):
     target: str
     level: Optional[str] = "beginner"
     force_crawl: Optional[bool] = False
+    priority: Optional[int] = 0
+
+
+class ScheduleBatchRequest(BaseModel):
+    items: list[Schedule]
+    concurrency: Optional[int] = None  # số lần gọi LLM đồng thời (mặc định QUERY_BATCH_CONCURRENCY)
 
 
 class RoadmapResponse(BaseModel):
     success: bool
     message: str
     roadmap_id: Optional[str] = None
+    job_id: Optional[str] = None
     data: Optional[dict] = None
 
 
+# -----------------------------
+# Roadmap hierarchy builder (thuần Python, không đụng tới WebDriver)
+# -----------------------------
+_EXTRACT_NODES_JS = """
+return Array.from(document.querySelectorAll('[data-type]')).map(
+  n => [n.getAttribute('data-type') || '', n.innerText || '']
+);
+"""
+
+
+def extract_nodes_from_html(html: str) -> list[tuple[str, str]]:
+    """Parse offline 1 snapshot page_source → danh sách (data-type, text) theo thứ tự DOM."""
+    from bs4 import BeautifulSoup  # import lười, chỉ cần khi fallback
+
+    soup = BeautifulSoup(html or "", "html.parser")
+    return [
+        (node.get("data-type") or "", node.get_text(" ", strip=True))
+        for node in soup.select("[data-type]")
+    ]
+
+
+def build_roadmap_hierarchy(pairs) -> dict:
+    """
+    Dựng roadmap theo phân cấp từ danh sách (data-type, text):
+      title (Target) -> label (Skill) -> topic (Sub-skill) -> subtopic (Sub-sub-skill)
+    """
+    roadmap = {
+        "title": None,
+        "skills": []  # [{ "name": skill, "subskills": [{ "name": sub, "subsubskills": [...] }] }]
+    }
+
+    current_title: Optional[str] = None
+    current_skill: Optional[str] = None  # label
+    current_subskill: Optional[str] = None  # topic
+    pending_subsub: list[str] = []  # subtopic đợi đến khi có topic
+
+    PLACEHOLDER_SUBSKILL = "Khác"
+
+    skills_index: dict[str, dict] = {}
+    subskills_index: dict[tuple[str, str], dict] = {}
+
+    def ensure_skill(name: str) -> dict:
+        name = (name or "").strip() or "Untitled"
+        obj = skills_index.get(name)
+        if obj is None:
+            obj = {"name": name, "subskills": []}
+            skills_index[name] = obj
+            roadmap["skills"].append(obj)
+        return obj
+
+    def ensure_subskill(skill_name: Optional[str], sub_name: Optional[str]) -> dict:
+        skill_name = (skill_name or "").strip() or (current_title or "Untitled")
+        sub_name = (sub_name or "").strip() or PLACEHOLDER_SUBSKILL
+        key = (skill_name, sub_name)
+        obj = subskills_index.get(key)
+        if obj is None:
+            parent_skill = ensure_skill(skill_name)
+            obj = {"name": sub_name, "subsubskills": []}
+            parent_skill["subskills"].append(obj)
+            subskills_index[key] = obj
+        return obj
+
+    def flush_pending_to_placeholder():
+        nonlocal pending_subsub
+        if not pending_subsub:
+            return
+        parent_skill = current_skill or (current_title or "Untitled")
+        sub_obj = ensure_subskill(parent_skill, PLACEHOLDER_SUBSKILL)
+        for ss in pending_subsub:
+            if ss not in sub_obj["subsubskills"]:
+                sub_obj["subsubskills"].append(ss)
+        pending_subsub = []
+
+    for dtype, text in pairs:
+        try:
+            text = (text or "").strip()
+            if not text:
+                continue
+
+            dtype = (dtype or "").strip()
+            if not dtype:
+                continue
+
+            if dtype == "title":
+                flush_pending_to_placeholder()
+                current_title = text
+                roadmap["title"] = text
+                current_skill = None
+                current_subskill = None
+
+            elif dtype == "label":
+                flush_pending_to_placeholder()
+                current_skill = text
+                ensure_skill(current_skill)
+                current_subskill = None
+
+            elif dtype == "topic":
+                parent_skill = current_skill or (current_title or "Untitled")
+                ensure_skill(parent_skill)
+                sub_obj = ensure_subskill(parent_skill, text)
+                current_subskill = text
+
+                if pending_subsub:
+                    for ss in pending_subsub:
+                        if ss not in sub_obj["subsubskills"]:
+                            sub_obj["subsubskills"].append(ss)
+                    pending_subsub = []
+
+            elif dtype == "subtopic":
+                if current_subskill:
+                    parent_skill = current_skill or (current_title or "Untitled")
+                    sub_obj = ensure_subskill(parent_skill, current_subskill)
+                    if text not in sub_obj["subsubskills"]:
+                        sub_obj["subsubskills"].append(text)
+                else:
+                    pending_subsub.append(text)
+            else:
+                continue
+
+        except Exception:
+            continue
+
+    flush_pending_to_placeholder()
+    return roadmap
+
+
 # -----------------------------
 # Selenium Crawler
 # -----------------------------
@@ -168,19 +336,22 @@ class RoadmapCrawler:
             logger.info("⚠️ No roadmap credentials provided, using without login")
             return True
 
+        login_timeout = float(get_env_var("CRAWLER_LOGIN_TIMEOUT", "15"))
         try:
             self.driver.get("https://roadmap.sh/login")
-            time.sleep(3)
+            wait_for_document_ready(self.driver, timeout=login_timeout)
 
             # NOTE: Các ID có vẻ động — giữ nguyên theo code của bạn.
-            email_field = WebDriverWait(self.driver, 10).until(
+            email_field = WebDriverWait(self.driver, login_timeout).until(
                 EC.presence_of_element_located((By.ID, "form:«r9R3»"))
             )
             email_field.send_keys(email)
 
+            login_url = self.driver.current_url
             password_field = self.driver.find_element(By.ID, "form:«r9R3H1»")
             password_field.send_keys(password + Keys.RETURN)
-            time.sleep(5)
+            # Login xong roadmap.sh redirect khỏi /login
+            wait_for_url_change(self.driver, login_url, timeout=login_timeout)
 
             logger.info("✅ Successfully logged in to roadmap.sh")
             return True
@@ -190,175 +361,169 @@ class RoadmapCrawler:
 
     def crawl_roadmap(self, query: str):
         """Crawl roadmap data for a specific target."""
+        navigate_timeout = float(get_env_var("CRAWLER_NAVIGATE_TIMEOUT", "20"))
+        generate_timeout = float(get_env_var("CRAWLER_GENERATE_TIMEOUT", "90"))
+        settle_seconds = float(get_env_var("CRAWLER_SETTLE_SECONDS", "2"))
+        timer = StageTimer()
         try:
-            self.driver.get("https://roadmap.sh/ai/roadmap")
-            time.sleep(8)
-
-            input_box = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.ID, "«R5155»"))
-            )
-            input_box.clear()
-            input_box.send_keys(query)
-            input_box.send_keys(Keys.RETURN)
-            time.sleep(7)  # đợi AI gen
-
-            roadmap_data = self.parse_roadmap_content()
+            with timer.stage("navigate"):
+                self.driver.get("https://roadmap.sh/ai/roadmap")
+                wait_for_document_ready(self.driver, timeout=navigate_timeout)
+                input_box = WebDriverWait(self.driver, navigate_timeout).until(
+                    EC.element_to_be_clickable((By.ID, "«R5155»"))
+                )
+
+            with timer.stage("generate"):
+                install_network_tracker(self.driver)
+                install_mutation_tracker(self.driver)
+                input_box.clear()
+                input_box.send_keys(query)
+                input_box.send_keys(Keys.RETURN)
+                # Đợi AI gen xong: số node [data-type] ổn định, stream đã đọc hết, rồi DOM ngừng thay đổi
+                # (1 deadline chung CRAWLER_GENERATE_TIMEOUT cho cả 3)
+                wait_for_generation_complete(
+                    self.driver, "[data-type]", settle=settle_seconds, timeout=generate_timeout
+                )
+
+            with timer.stage("parse"):
+                roadmap_data = self.parse_roadmap_content()
+
+            timings = timer.as_dict()
+            logger.info(f"⏱️ Crawl timings for '{query}': {timings}")
             return {
                 "target": roadmap_data["title"],
                 "query": query,
                 "data": roadmap_data,
                 "crawled_at": utcnow_iso(),
+                "crawl_timings": timings,
                 "source": "roadmap.sh"
             }
         except Exception as e:
-            logger.error(f"❌ Error crawling roadmap: {e}")
+            logger.error(f"❌ Error crawling roadmap: {e} (timings: {timer.as_dict()})")
             return None
 
+    def extract_nodes(self) -> list[tuple[str, str]]:
+        """
+        Lấy toàn bộ cặp (data-type, text) trong 1 round-trip WebDriver (execute_script),
+        thay vì gọi node.text / node.get_attribute cho từng element.
+        Fallback: parse offline 1 snapshot page_source.
+        """
+        try:
+            rows = self.driver.execute_script(_EXTRACT_NODES_JS) or []
+            return [(row[0], row[1]) for row in rows]
+        except Exception as e:
+            logger.warning(f"⚠️ execute_script extraction failed, parsing page_source: {e}")
+            return extract_nodes_from_html(self.driver.page_source)
+
     def parse_roadmap_content(self):
         """
         Parse roadmap theo phân cấp:
           title (Target) -> label (Skill) -> topic (Sub-skill) -> subtopic (Sub-sub-skill)
         """
         try:
-            nodes = self.driver.find_elements(By.CSS_SELECTOR, "[data-type]")
-
-            roadmap = {
-                "title": None,
-                "skills": []  # [{ "name": skill, "subskills": [{ "name": sub, "subsubskills": [...] }] }]
-            }
-
-            current_title: Optional[str] = None
-            current_skill: Optional[str] = None  # label
-            current_subskill: Optional[str] = None  # topic
-            pending_subsub: list[str] = []  # subtopic đợi đến khi có topic
-
-            PLACEHOLDER_SUBSKILL = "Khác"
-
-            skills_index: dict[str, dict] = {}
-            subskills_index: dict[tuple[str, str], dict] = {}
-
-            def ensure_skill(name: str) -> dict:
-                name = (name or "").strip() or "Untitled"
-                obj = skills_index.get(name)
-                if obj is None:
-                    obj = {"name": name, "subskills": []}
-                    skills_index[name] = obj
-                    roadmap["skills"].append(obj)
-                return obj
-
-            def ensure_subskill(skill_name: Optional[str], sub_name: Optional[str]) -> dict:
-                skill_name = (skill_name or "").strip() or (current_title or "Untitled")
-                sub_name = (sub_name or "").strip() or PLACEHOLDER_SUBSKILL
-                key = (skill_name, sub_name)
-                obj = subskills_index.get(key)
-                if obj is None:
-                    parent_skill = ensure_skill(skill_name)
-                    obj = {"name": sub_name, "subsubskills": []}
-                    parent_skill["subskills"].append(obj)
-                    subskills_index[key] = obj
-                return obj
-
-            def flush_pending_to_placeholder():
-                nonlocal pending_subsub
-                if not pending_subsub:
-                    return
-                parent_skill = current_skill or (current_title or "Untitled")
-                sub_obj = ensure_subskill(parent_skill, PLACEHOLDER_SUBSKILL)
-                for ss in pending_subsub:
-                    if ss not in sub_obj["subsubskills"]:
-                        sub_obj["subsubskills"].append(ss)
-                pending_subsub = []
-
-            for node in nodes:
-                try:
-                    text = (node.text or "").strip()
-                    if not text:
-                        continue
-
-                    dtype = (node.get_attribute("data-type") or "").strip()
-                    if not dtype:
-                        continue
-
-                    if dtype == "title":
-                        flush_pending_to_placeholder()
-                        current_title = text
-                        roadmap["title"] = text
-                        current_skill = None
-                        current_subskill = None
-
-                    elif dtype == "label":
-                        flush_pending_to_placeholder()
-                        current_skill = text
-                        ensure_skill(current_skill)
-                        current_subskill = None
-
-                    elif dtype == "topic":
-                        parent_skill = current_skill or (current_title or "Untitled")
-                        ensure_skill(parent_skill)
-                        sub_obj = ensure_subskill(parent_skill, text)
-                        current_subskill = text
-
-                        if pending_subsub:
-                            for ss in pending_subsub:
-                                if ss not in sub_obj["subsubskills"]:
-                                    sub_obj["subsubskills"].append(ss)
-                            pending_subsub = []
-
-                    elif dtype == "subtopic":
-                        if current_subskill:
-                            parent_skill = current_skill or (current_title or "Untitled")
-                            sub_obj = ensure_subskill(parent_skill, current_subskill)
-                            if text not in sub_obj["subsubskills"]:
-                                sub_obj["subsubskills"].append(text)
-                        else:
-                            pending_subsub.append(text)
-                    else:
-                        continue
-
-                except Exception:
-                    continue
-
-            flush_pending_to_placeholder()
-            return roadmap
-
+            return build_roadmap_hierarchy(self.extract_nodes())
         except Exception as e:
             logger.error(f"❌ Error parsing roadmap content: {e}")
             return {"title": None, "skills": [], "learning_path": []}
 
+    def is_alive(self) -> bool:
+        """Health check rẻ: driver còn phản hồi (không crash / mất session)."""
+        if not self.driver:
+            return False
+        try:
+            _ = self.driver.current_url
+            return True
+        except Exception:
+            return False
+
     def close(self):
         if self.driver:
             self.driver.quit()
 
 
-# Global crawler instance
-crawler: Optional[RoadmapCrawler] = None
+# -----------------------------
+# Driver pool (mỗi crawl mượn 1 driver đã login sẵn)
+# -----------------------------
+def _new_logged_in_crawler() -> RoadmapCrawler:
+    instance = RoadmapCrawler()
+    if not instance.driver:
+        raise RuntimeError("Could not start Chrome driver")
+    # Login thất bại vẫn crawl được (như trước đây), login_roadmap đã tự log lỗi
+    instance.login_roadmap()
+    return instance
 
 
-def get_crawler() -> RoadmapCrawler:
-    global crawler
-    if crawler is None:
-        crawler = RoadmapCrawler()
-    return crawler
+driver_pool: Optional[DriverPool] = None
+
+
+def get_driver_pool() -> DriverPool:
+    global driver_pool
+    if driver_pool is None:
+        driver_pool = DriverPool(
+            factory=_new_logged_in_crawler,
+            size=int(get_env_var("CRAWLER_POOL_SIZE", "2")),
+            max_uses=int(get_env_var("CRAWLER_MAX_USES", "20")),
+            checkout_timeout=float(get_env_var("CRAWLER_CHECKOUT_TIMEOUT", "120")),
+            health_check=lambda c: c.is_alive(),
+        )
+    return driver_pool
+
+
+def _crawl_with_pool(target: str):
+    """Blocking: mượn 1 driver từ pool, crawl, trả driver về pool."""
+    with get_driver_pool().checkout() as crawler_instance:
+        return crawler_instance.crawl_roadmap(target)
 
 
 # -----------------------------
 # Background task
 # -----------------------------
+crawl_flight = SingleFlight()
+
+
 async def crawl_and_save_roadmap(target: str, level: str = "beginner"):
-    """Background task to crawl and save roadmap."""
+    """
+    Background task to crawl and save roadmap.
+    Các request đồng thời cùng (target, level) đã chuẩn hóa dùng chung 1 lần crawl.
+    """
+    key = (normalize_target(target), level or "")
+    return await crawl_flight.do(key, lambda: _crawl_and_save_leased(target, level))
+
+
+async def _crawl_and_save_leased(target: str, level: str):
+    """Giữ lease Mongo trong lúc crawl; nếu worker khác đang crawl cùng key thì đợi và đọc kết quả của nó."""
+    if crawl_lease is None:
+        return await _crawl_and_save(target, level)
+
+    lease_key = f"{normalize_target(target)}|{level or ''}"
+    if not await run_blocking("db", crawl_lease.acquire, lease_key):
+        logger.info(f"🔁 '{target}' ({level}) is being crawled by another worker, waiting")
+        await crawl_lease.wait_released(lease_key)
+        cached = await run_blocking("db", find_cached_roadmap, roadmaps_collection, target, level)
+        if cached:
+            return cached.get("data")
+        # Worker kia thất bại / lease hết hạn → tự crawl
+        if not await run_blocking("db", crawl_lease.acquire, lease_key):
+            return None
+
+    # Crawl có thể lâu hơn TTL (checkout driver + navigate + generate) → heartbeat gia hạn lease
+    heartbeat = asyncio.create_task(crawl_lease.keep_alive(lease_key))
     try:
-        crawler_instance = get_crawler()
-        crawler_instance.login_roadmap()
+        return await _crawl_and_save(target, level)
+    finally:
+        heartbeat.cancel()
+        await run_blocking("db", crawl_lease.release, lease_key)
 
-        roadmap_data = crawler_instance.crawl_roadmap(target)
+
+async def _crawl_and_save(target: str, level: str):
+    try:
+        # Selenium chạy trong pool "browser" để nhiều crawl song song (giới hạn bởi pool size)
+        roadmap_data = await run_blocking("browser", _crawl_with_pool, target)
 
         if roadmap_data and mongo_client:
-            result = roadmaps_collection.insert_one({
-                **roadmap_data,
-                "level": level,
-                "status": "completed"
-            })
-            logger.info(f"✅ Roadmap saved to MongoDB with ID: {result.inserted_id}")
+            roadmap_id = await run_blocking("db", save_roadmap, roadmaps_collection, roadmap_data, target, level)
+            logger.info(f"✅ Roadmap saved to MongoDB with ID: {roadmap_id}")
+            await schedule_template_refresh(target, level)
             return roadmap_data['data']
 
         return None
@@ -367,6 +532,82 @@ async def crawl_and_save_roadmap(target: str, level: str = "beginner"):
         return None
 
 
+async def crawl_roadmap_job(payload: dict) -> dict:
+    """Handler cho job "crawl_roadmap" trong hàng đợi bền vững."""
+    target = payload.get("target") or ""
+    level = payload.get("level") or "beginner"
+    data = await crawl_and_save_roadmap(target, level)
+    if not data:
+        raise RuntimeError(f"Crawl returned no data for '{target}'")
+    # Chỉ lưu tóm tắt vào job, dữ liệu đầy đủ nằm trong roadmaps_collection
+    return {"title": data.get("title"), "skills": len(data.get("skills") or [])}
+
+
+async def schedule_template_refresh(target: str, level: str) -> None:
+    """
+    Roadmap vừa crawl lại: nếu target đã có template (hoặc bật SCHEDULE_TEMPLATES_AUTO_BUILD)
+    mà template thiếu/cũ so với content_hash mới → enqueue job dựng lại.
+    """
+    if template_store is None or job_queue is None:
+        return
+    try:
+        doc = await run_blocking(
+            "db", roadmaps_collection.find_one, roadmap_filter(target, level), projection={"content_hash": 1}
+        )
+        if not doc or not doc.get("content_hash"):
+            return
+        auto_build = env_flag("SCHEDULE_TEMPLATES_AUTO_BUILD", False)
+        if not auto_build and not await run_blocking("db", template_store.has_templates, target, level):
+            return
+        missing = await run_blocking("db", template_store.missing_buckets, target, level, doc["content_hash"])
+        if missing:
+            await run_blocking(
+                "db",
+                job_queue.enqueue,
+                "refresh_templates",
+                {"target": target, "level": level},
+                priority=-1,
+                dedupe_key=f"templates:{normalize_target(target)}|{level or ''}",
+            )
+            logger.info(f"🔁 Template refresh queued for '{target}' ({level}): {missing}")
+    except Exception as e:
+        logger.warning(f"⚠️ Could not schedule template refresh for '{target}': {e}")
+
+
+async def refresh_templates_job(payload: dict) -> dict:
+    """Handler cho job "refresh_templates": dựng lại template của 1 roadmap theo content_hash hiện tại."""
+    target = payload.get("target") or ""
+    level = payload.get("level") or "beginner"
+    doc = await run_blocking(
+        "db",
+        roadmaps_collection.find_one,
+        roadmap_filter(target, level),
+        projection={"data": 1, "query": 1, "target": 1, "level": 1, "content_hash": 1},
+        sort=[("crawled_at", -1)],
+    )
+    if not doc or not doc.get("data"):
+        raise RuntimeError(f"No stored roadmap for '{target}' ({level})")
+    return await run_blocking(
+        "llm",
+        build_templates,
+        template_store,
+        doc,
+        GenSchedule,
+        mode=get_env_var("TEMPLATE_MODE"),
+    )
+
+
+async def get_or_crawl_roadmap(target: str, level: str = "beginner", force_crawl: bool = False):
+    """Read-through cache: trả roadmap còn hạn trong Mongo, chỉ crawl khi miss (hoặc force_crawl)."""
+    if not force_crawl and mongo_client:
+        cached = await run_blocking("db", find_cached_roadmap, roadmaps_collection, target, level)
+        if cached:
+            logger.info(f"✅ Roadmap cache hit for '{target}' ({level})")
+            return cached.get("data")
+
+    return await crawl_and_save_roadmap(target, level)
+
+
 # -----------------------------
 # Routes
 # -----------------------------
@@ -385,8 +626,18 @@ def health_check():
     }
 
 
+@app.get("/metrics")
+def metrics_endpoint():
+    """Runtime metrics: LLM calls (latency/tokens/retries) and browser pool usage."""
+    return {
+        "llm": llm_metrics.snapshot(),
+        "driver_pool": driver_pool.stats() if driver_pool else None,
+        "timestamp": utcnow_iso(),
+    }
+
+
 @app.post("/crawl-roadmap", response_model=RoadmapResponse)
-async def crawl_roadmap_endpoint(request: RoadmapRequest, background_tasks: BackgroundTasks):
+async def crawl_roadmap_endpoint(request: RoadmapRequest):
     """Crawl roadmap data from roadmap.sh and save to MongoDB."""
     if not mongo_client:
         raise HTTPException(status_code=500, detail="MongoDB not connected")
@@ -397,10 +648,7 @@ async def crawl_roadmap_endpoint(request: RoadmapRequest, background_tasks: Back
 
     # Check existing unless force_crawl
     if not request.force_crawl:
-        existing = roadmaps_collection.find_one({
-            "target": target,
-            "level": request.level
-        })
+        existing = await run_blocking("db", find_cached_roadmap, roadmaps_collection, target, request.level)
         if existing:
             return RoadmapResponse(
                 success=True,
@@ -409,21 +657,60 @@ async def crawl_roadmap_endpoint(request: RoadmapRequest, background_tasks: Back
                 data=existing.get("data")
             )
 
-    background_tasks.add_task(crawl_and_save_roadmap, target, request.level)
+    job = await run_blocking(
+        "db",
+        job_queue.enqueue,
+        "crawl_roadmap",
+        {"target": target, "level": request.level},
+        priority=request.priority or 0,
+        dedupe_key=f"crawl:{normalize_target(target)}|{request.level or ''}",
+    )
     return RoadmapResponse(
         success=True,
-        message=f"Roadmap crawling started for '{target}'. Check status with GET /roadmap/{target}",
-        roadmap_id=None
+        message=f"Roadmap crawling queued for '{target}'. Check status with GET /jobs/{job['_id']}",
+        roadmap_id=None,
+        job_id=str(job["_id"]),
     )
 
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get status of a queued crawl job."""
+    if not mongo_client:
+        raise HTTPException(status_code=500, detail="MongoDB not connected")
+
+    job = await run_blocking("db", job_queue.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, "data": serialize_job(job)}
+
+
+@app.get("/jobs")
+async def list_jobs(status: Optional[str] = None, kind: Optional[str] = None, limit: int = 50):
+    """List jobs, newest first (filter by status / kind)."""
+    if not mongo_client:
+        raise HTTPException(status_code=500, detail="MongoDB not connected")
+
+    jobs = await run_blocking("db", job_queue.list, status, kind, min(max(limit, 1), 500))
+    return {"success": True, "data": [serialize_job(job) for job in jobs]}
+
+
 @app.get("/roadmap/{target}")
-async def get_roadmap(target: str, level: str = "beginner"):
-    """Get roadmap data from MongoDB."""
+async def get_roadmap(target: str, level: str = "beginner", include_data: bool = True):
+    """Get roadmap data from MongoDB (include_data=false → chỉ metadata, bỏ cây `data`)."""
     if not mongo_client:
         raise HTTPException(status_code=500, detail="MongoDB not connected")
 
-    roadmap = roadmaps_collection.find_one({"target": target, "level": level})
+    projection = {"target_normalized": 0, "expires_at": 0}
+    if not include_data:
+        projection["data"] = 0
+    roadmap = await run_blocking(
+        "db",
+        roadmaps_collection.find_one,
+        roadmap_filter(target, level),
+        projection=projection,
+        sort=[("crawled_at", -1)],
+    )
     if not roadmap:
         raise HTTPException(status_code=404, detail="Roadmap not found")
 
@@ -431,6 +718,160 @@ async def get_roadmap(target: str, level: str = "beginner"):
     return {"success": True, "data": roadmap}
 
 
+def build_learning_path_doc(query: str, level: str, roadmap, result, source: str = "GenSchedule"):
+    """Chuẩn hóa kết quả GenSchedule thành (document lưu Mongo, payload trả về client)."""
+    if isinstance(result, dict):
+        if result.get("error"):
+            raise HTTPException(status_code=500, detail=f"Schedule generation failed: {result.get('error')}")
+        doc = {
+            "type": "schedule",
+            "format": "json",
+            "query": query,
+            "level": level,
+            "roadmap": roadmap,
+            "data": result,
+            "created_at": utcnow_iso(),
+            "source": source
+        }
+        response_payload = {"data": result}
+
+    elif isinstance(result, str):
+        doc = {
+            "type": "schedule",
+            "format": "text",
+            "query": query,
+            "level": level,
+            "roadmap": roadmap,
+            "text": result,
+            "created_at": utcnow_iso(),
+            "source": source
+        }
+        response_payload = {"text": result}
+
+    else:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Unsupported result type from GenSchedule: {type(result)}"
+        )
+
+    doc["expires_at"] = ttl_expiry("LEARNING_PATH_TTL_DAYS")
+    return doc, response_payload
+
+
+async def persist_learning_path(query: str, level: str, roadmap, result, source: str = "GenSchedule") -> dict:
+    """Lưu learning path vào learning_path_collection, trả về body response của /query."""
+    doc, response_payload = build_learning_path_doc(query, level, roadmap, result, source)
+    inserted = await run_blocking("db", learning_path_collection.insert_one, doc)
+    return {
+        "success": True,
+        "inserted_id": str(inserted.inserted_id),
+        "format": doc["format"],
+        **response_payload
+    }
+
+
+def _schedule_window(req: Schedule) -> tuple[date, Optional[date], str]:
+    """(ngày bắt đầu = hôm nay, deadline đã parse, duration bucket) của request."""
+    start = datetime.now(timezone.utc).date()
+    deadline = parse_date(req.deadline)
+    return start, deadline, duration_bucket(start, deadline)
+
+
+def _cache_bucket(req: Schedule, bucket: str) -> str:
+    """Bucket semantic cache: mode sinh lịch (planner/agent/scheduler) + bucket thời lượng."""
+    return f"{schedule_mode(req)}:{bucket}"
+
+
+async def lookup_cached_schedule(req: Schedule, query: str, level: str) -> Optional[dict]:
+    """
+    Semantic cache: tìm learning path đã sinh cho (query, level) gần giống + cùng bucket thời lượng.
+    Hit → dời deadline từng tuần theo deadline mới, lưu thành learning path riêng của request này
+    rồi trả body như /query; miss/lỗi → None.
+    """
+    if schedule_cache is None or req.force_crawl or req.use_cache is False:
+        return None
+
+    start, deadline, bucket = _schedule_window(req)
+    try:
+        entry = await run_blocking("db", schedule_cache.lookup, query, level, _cache_bucket(req, bucket))
+        if not entry:
+            return None
+        doc = await run_blocking(
+            "db",
+            learning_path_collection.find_one,
+            {"_id": entry["learning_path_id"]},
+            projection={"format": 1, "data": 1, "text": 1},
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Semantic cache lookup failed: {e}")
+        return None
+
+    # Learning path gốc đã bị TTL xoá → coi như miss
+    field = "data" if doc and doc.get("format") == "json" else "text"
+    if not doc or doc.get(field) is None:
+        return None
+
+    result = doc[field]
+    if deadline is not None and deadline >= start:
+        result = redate_result(result, start, deadline)
+
+    logger.info(f"♻️ Semantic cache hit for '{query}' ({level}), similarity={entry['similarity']:.3f}")
+    try:
+        body = await persist_learning_path(query, level, None, result, source="semantic_cache")
+    except Exception as e:
+        logger.warning(f"⚠️ Could not persist cached learning path: {e}")
+        return None
+    return {**body, "cached": True, "similarity": round(entry["similarity"], 4)}
+
+
+async def lookup_template(req: Schedule, query: str, level: str) -> Optional[dict]:
+    """
+    Template dựng sẵn cho (query, level, bucket thời lượng) → dời ngày theo start/deadline của user
+    và lưu thành learning path riêng. Không có template / không có deadline → None.
+    """
+    if template_store is None or req.force_crawl or req.use_cache is False:
+        return None
+
+    start, deadline, _ = _schedule_window(req)
+    if deadline is None:
+        return None
+    try:
+        schedule = await run_blocking("db", template_store.serve, query, level, start, deadline)
+        if not schedule:
+            return None
+        logger.info(f"📋 Serving schedule template for '{query}' ({level})")
+        body = await persist_learning_path(
+            query, level, None, json.dumps(schedule, ensure_ascii=False, indent=2), source="template"
+        )
+        return {**body, "cached": True, "template": True}
+    except Exception as e:
+        logger.warning(f"⚠️ Template lookup failed: {e}")
+        return None
+
+
+async def remember_schedule(req: Schedule, query: str, level: str, body: dict, result) -> None:
+    """Ghi learning path vừa sinh vào semantic cache (chỉ khi kết quả là JSON lịch học hợp lệ)."""
+    if schedule_cache is None or extract_schedule_json(result) is None:
+        return
+
+    from bson import ObjectId
+
+    start, _, bucket = _schedule_window(req)
+    try:
+        await run_blocking(
+            "db",
+            schedule_cache.store,
+            query,
+            level,
+            _cache_bucket(req, bucket),
+            ObjectId(body["inserted_id"]),
+            format_date(start),
+            req.deadline,
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Semantic cache store failed: {e}")
+
+
 @app.post("/query")
 async def query_schedule(req: Schedule):
     """Query: crawl roadmap if needed, then generate study schedule"""
@@ -440,54 +881,19 @@ async def query_schedule(req: Schedule):
     query = (req.query or "").strip()
     level = (req.level or "").strip()
 
-    # Crawl (và/hoặc lấy từ DB) roadmap gốc
-    roadmap = await crawl_and_save_roadmap(query, level)
-
-    try:
-        result = GenSchedule(req, roadmap)
-
-        # Chuẩn hóa tài liệu để lưu vào Mongo
-        if isinstance(result, dict):
-            if result.get("error"):
-                raise HTTPException(status_code=500, detail=f"Schedule generation failed: {result.get('error')}")
-            doc = {
-                "type": "schedule",
-                "format": "json",
-                "query": query,
-                "level": level,
-                "roadmap": roadmap,
-                "data": result,
-                "created_at": utcnow_iso(),
-                "source": "GenSchedule"
-            }
-            response_payload = {"data": result}
-
-        elif isinstance(result, str):
-            doc = {
-                "type": "schedule",
-                "format": "text",
-                "query": query,
-                "level": level,
-                "roadmap": roadmap,
-                "text": result,
-                "created_at": utcnow_iso(),
-                "source": "GenSchedule"
-            }
-            response_payload = {"text": result}
+    cached = await lookup_template(req, query, level) or await lookup_cached_schedule(req, query, level)
+    if cached:
+        return cached
 
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Unsupported result type from GenSchedule: {type(result)}"
-            )
+    # Lấy roadmap từ DB nếu còn hạn, chỉ crawl khi miss (hoặc force_crawl)
+    roadmap = await get_or_crawl_roadmap(query, level, force_crawl=bool(req.force_crawl))
 
-        inserted = learning_path_collection.insert_one(doc)
-        return {
-            "success": True,
-            "inserted_id": str(inserted.inserted_id),
-            "format": doc["format"],
-            **response_payload
-        }
+    try:
+        # GenSchedule (retrieval + agent.run) là blocking → pool "llm"
+        result = await run_blocking("llm", GenSchedule, req, roadmap)
+        body = await persist_learning_path(query, level, roadmap, result)
+        await remember_schedule(req, query, level, body, result)
+        return body
 
     except HTTPException:
         raise
@@ -495,24 +901,259 @@ async def query_schedule(req: Schedule):
         raise HTTPException(status_code=500, detail=f"Schedule generation failed: {str(e)}")
 
 
+@app.post("/query/stream")
+async def query_schedule_stream(req: Schedule):
+    """
+    Như /query nhưng stream qua Server-Sent Events:
+      progress (các bước + hành động của agent) → token (LLM) → result (đã lưu Mongo) → done
+    """
+    if not mongo_client:
+        raise HTTPException(status_code=500, detail="MongoDB not connected")
+
+    query = (req.query or "").strip()
+    level = (req.level or "").strip()
+
+    async def event_stream():
+        cached = await lookup_template(req, query, level) or await lookup_cached_schedule(req, query, level)
+        if cached:
+            yield format_sse("progress", {"stage": "cache_hit"})
+            yield format_sse("result", cached)
+            yield format_sse("done", {})
+            return
+
+        yield format_sse("progress", {"stage": "roadmap"})
+        roadmap = await get_or_crawl_roadmap(query, level, force_crawl=bool(req.force_crawl))
+
+        yield format_sse("progress", {"stage": "generate"})
+        events: asyncio.Queue = asyncio.Queue()
+        handler = QueueCallbackHandler(asyncio.get_running_loop(), events)
+        task = asyncio.ensure_future(run_blocking("llm", GenSchedule, req, roadmap, [handler]))
+        task.add_done_callback(lambda _: events.put_nowait(None))
+
+        while True:
+            item = await events.get()
+            if item is None:
+                break
+            yield format_sse(item["event"], item["data"])
+
+        try:
+            result = task.result()
+            body = await persist_learning_path(query, level, roadmap, result)
+            await remember_schedule(req, query, level, body, result)
+            yield format_sse("result", body)
+        except HTTPException as e:
+            yield format_sse("error", {"detail": e.detail})
+        except Exception as e:
+            yield format_sse("error", {"detail": f"Schedule generation failed: {str(e)}"})
+        yield format_sse("done", {})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _generate_group(
+    items: list[Schedule],
+    indices: list[int],
+    semaphore: asyncio.Semaphore,
+    results: list[Optional[dict]],
+) -> None:
+    """
+    1 nhóm (target, level) của /query/batch: lấy/crawl roadmap 1 lần, ingest + retrieval 1 lần,
+    mỗi (deadline, mode) khác nhau chỉ sinh 1 lần (template nếu có, không thì LLM).
+    Ghi {"result", "roadmap", "source"} hoặc {"error"} vào results[i].
+    """
+    first = items[indices[0]]
+    query = (first.query or "").strip()
+    level = (first.level or "").strip()
+
+    try:
+        roadmap = await get_or_crawl_roadmap(query, level, force_crawl=any(items[i].force_crawl for i in indices))
+    except Exception as e:
+        roadmap, error = None, f"Roadmap unavailable: {e}"
+    else:
+        error = "Roadmap unavailable"
+    if not roadmap:
+        for i in indices:
+            results[i] = {"error": error}
+        return
+
+    variants: dict[tuple, list[int]] = {}
+    for i in indices:
+        variants.setdefault((items[i].deadline or "", schedule_mode(items[i])), []).append(i)
+
+    prepared: Optional[dict] = None
+    prepare_lock = asyncio.Lock()
+
+    async def get_prepared() -> Optional[dict]:
+        nonlocal prepared
+        async with prepare_lock:
+            if prepared is None:
+                prepared = await run_blocking("llm", prepare_schedule, first, roadmap)
+        return prepared
+
+    async def run_variant(idxs: list[int]) -> None:
+        req = items[idxs[0]]
+        outcome: dict
+        try:
+            schedule = None
+            if template_store is not None and req.use_cache is not False and not req.force_crawl:
+                start, deadline, _ = _schedule_window(req)
+                if deadline is not None:
+                    schedule = await run_blocking("db", template_store.serve, query, level, start, deadline)
+            if schedule:
+                outcome = {"result": json.dumps(schedule, ensure_ascii=False, indent=2), "source": "template"}
+            else:
+                shared = None if schedule_mode(req) == "scheduler" else await get_prepared()
+                async with semaphore:
+                    result = await run_blocking("llm", GenSchedule, req, roadmap, None, shared)
+                if isinstance(result, str) and result.startswith("Error:"):
+                    outcome = {"error": result}
+                else:
+                    outcome = {"result": result, "source": "GenSchedule"}
+        except Exception as e:
+            outcome = {"error": f"Schedule generation failed: {e}"}
+        for i in idxs:
+            results[i] = {**outcome, "roadmap": roadmap}
+
+    await asyncio.gather(*(run_variant(idxs) for idxs in variants.values()))
+
+
+@app.post("/query/batch")
+async def query_schedule_batch(batch: ScheduleBatchRequest):
+    """
+    Sinh lịch học cho nhiều người (vd: cả lớp) trong 1 request:
+    gom theo (target, level) → roadmap/ingest/retrieval 1 lần mỗi nhóm, LLM chạy song song có giới hạn,
+    ghi learning_path_collection bằng insert_many, trả trạng thái từng item theo đúng thứ tự gửi lên.
+    """
+    if not mongo_client:
+        raise HTTPException(status_code=500, detail="MongoDB not connected")
+
+    items = batch.items
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one item")
+    max_items = int(get_env_var("QUERY_BATCH_MAX_ITEMS", "200"))
+    if len(items) > max_items:
+        raise HTTPException(status_code=400, detail=f"Batch too large ({len(items)} > {max_items} items)")
+
+    concurrency = max(1, batch.concurrency or int(get_env_var("QUERY_BATCH_CONCURRENCY", "4")))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    groups: dict[tuple[str, str], list[int]] = {}
+    for i, item in enumerate(items):
+        key = (normalize_target(item.query), (item.level or "").strip())
+        groups.setdefault(key, []).append(i)
+
+    results: list[Optional[dict]] = [None] * len(items)
+    await asyncio.gather(*(_generate_group(items, idxs, semaphore, results) for idxs in groups.values()))
+
+    statuses: list[dict] = []
+    docs: list[dict] = []
+    doc_positions: list[int] = []
+    for i, (item, outcome) in enumerate(zip(items, results)):
+        status = {"index": i, "query": item.query, "level": item.level}
+        outcome = outcome or {"error": "Not processed"}
+        if "error" in outcome:
+            statuses.append({**status, "success": False, "error": outcome["error"]})
+            continue
+        try:
+            doc, payload = build_learning_path_doc(
+                (item.query or "").strip(), (item.level or "").strip(), outcome["roadmap"], outcome["result"],
+                source=outcome["source"],
+            )
+        except HTTPException as e:
+            statuses.append({**status, "success": False, "error": e.detail})
+            continue
+        doc_positions.append(len(statuses))
+        docs.append(doc)
+        statuses.append({**status, "success": True, "format": doc["format"], "source": outcome["source"], **payload})
+
+    if docs:
+        # pymongo gán _id vào từng doc trước khi gửi; ordered=False → doc lỗi không chặn doc khác
+        failed_docs: dict[int, str] = {}
+        try:
+            await run_blocking("db", learning_path_collection.insert_many, docs, ordered=False)
+        except BulkWriteError as e:
+            logger.error(f"❌ Batch insert partially failed: {e}")
+            failed_docs = {err["index"]: err.get("errmsg", "write error") for err in e.details.get("writeErrors", [])}
+        except Exception as e:
+            logger.error(f"❌ Batch insert failed: {e}")
+            failed_docs = {j: str(e) for j in range(len(docs))}
+        for j, (pos, doc) in enumerate(zip(doc_positions, docs)):
+            if j in failed_docs:
+                statuses[pos].update({"success": False, "error": f"Persist failed: {failed_docs[j]}"})
+            else:
+                statuses[pos]["inserted_id"] = str(doc["_id"])
+
+    succeeded = sum(1 for st in statuses if st["success"])
+    return {
+        "success": succeeded == len(items),
+        "total": len(items),
+        "succeeded": succeeded,
+        "failed": len(items) - succeeded,
+        "groups": len(groups),
+        "results": statuses,
+    }
+
+
 @app.delete("/roadmap/{target}")
 async def delete_roadmap(target: str, level: str = "beginner"):
     """Delete a specific roadmap."""
     if not mongo_client:
         raise HTTPException(status_code=500, detail="MongoDB not connected")
 
-    result = roadmaps_collection.delete_one({"target": target, "level": level})
+    result = await run_blocking("db", roadmaps_collection.delete_many, roadmap_filter(target, level))
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Roadmap not found")
 
     return {"success": True, "message": f"Roadmap for '{target}' deleted successfully"}
 
 
+# Warm-up model registry on startup (embedding model, vector store, LLM client)
+@app.on_event("startup")
+def startup_event():
+    if mongo_client:
+        ensure_indexes(db)
+
+    if env_flag("MODEL_REGISTRY_WARMUP", True):
+        init_registry(warm=True)
+    else:
+        init_registry(warm=False)
+
+    if env_flag("CRAWLER_POOL_PREWARM", True):
+        created = get_driver_pool().prewarm()
+        logger.info(f"✅ Driver pool prewarmed with {created} driver(s)")
+
+
+# Start crawl job workers (số worker = giới hạn browser chạy đồng thời)
+@app.on_event("startup")
+async def start_job_workers():
+    global job_workers
+    if job_queue is None:
+        return
+    job_workers = JobWorkerPool(
+        job_queue,
+        {"crawl_roadmap": crawl_roadmap_job, "refresh_templates": refresh_templates_job},
+        concurrency=int(get_env_var("JOB_WORKERS", get_env_var("CRAWLER_POOL_SIZE", "2"))),
+        poll_interval=float(get_env_var("JOB_POLL_INTERVAL", "1")),
+        requeue_interval=float(get_env_var("JOB_REQUEUE_INTERVAL", "60")),
+    )
+    await job_workers.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    if job_workers:
+        await job_workers.stop()
+
+
 # Cleanup on shutdown
 @app.on_event("shutdown")
 def shutdown_event():
-    global crawler
-    if crawler:
-        crawler.close()
+    if driver_pool:
+        driver_pool.close()
+    shutdown_executors()
     if mongo_client:
         mongo_client.close()
@@ -3,9 +3,9 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from webdriver_manager.chrome import ChromeDriverManager
-import time
 import os
 from utils.DownloadTools import login
+from utils.PageReadiness import StageTimer, wait_for_document_ready, wait_for_node_count_stable
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
@@ -22,20 +22,23 @@ class PageDownloader:
         self.password = password
         self.driver = driver
 
-    def download_page(self, url, save_name, folder="roadmap"):
-        self.driver.get(url)
-        time.sleep(4)
+    def download_page(self, url, save_name, folder="roadmap", navigate_timeout=20, generate_timeout=90, settle=2.0):
+        timer = StageTimer()
+        with timer.stage("navigate"):
+            self.driver.get(url)
+            wait_for_document_ready(self.driver, timeout=navigate_timeout)
 
-        target = "Tôi muốn trở thành " + save_name
-
-        input_box = WebDriverWait(self.driver, 3).until(
-            EC.presence_of_element_located((By.ID, "«r8»"))
-        )
+            input_box = WebDriverWait(self.driver, navigate_timeout).until(
+                EC.element_to_be_clickable((By.ID, "«r8»"))
+            )
 
+        target = "Tôi muốn trở thành " + save_name
 
-        input_box.send_keys(target)
-        input_box.send_keys(Keys.RETURN)
-        time.sleep(10)
+        with timer.stage("generate"):
+            input_box.send_keys(target)
+            input_box.send_keys(Keys.RETURN)
+            # Đợi AI gen xong: số node [data-type] không đổi trong `settle` giây
+            wait_for_node_count_stable(self.driver, "[data-type]", settle=settle, timeout=generate_timeout)
 
 
         save_dir = f"html_pages/{folder}/{save_name}"
@@ -44,7 +47,7 @@ class PageDownloader:
 
         with open(file_path, "w", encoding="utf-8") as f:
             f.write(self.driver.page_source)
-            print(f"✅ Đã lưu HTML vào: {file_path}")
+            print(f"✅ Đã lưu HTML vào: {file_path} (timings: {timer.as_dict()})")
 
         return file_path
 
@@ -3,18 +3,20 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium import webdriver
-import time
+from utils.PageReadiness import wait_for_document_ready, wait_for_url_change
 
-def login(driver, url, email, password):
+def login(driver, url, email, password, timeout=15):
     driver.get(url)
-    time.sleep(2)
 
     try:
-        WebDriverWait(driver, 3).until(
+        wait_for_document_ready(driver, timeout=timeout)
+        WebDriverWait(driver, timeout).until(
             EC.presence_of_element_located((By.ID, "form:«r9R3»"))
         ).send_keys(email)
+        login_url = driver.current_url
         driver.find_element(By.ID, "form:«r9R3H1»").send_keys(password + Keys.RETURN)
-        time.sleep(3)
+        # Login xong sẽ redirect khỏi trang login
+        wait_for_url_change(driver, login_url, timeout=timeout)
         return True
     except:
         return False
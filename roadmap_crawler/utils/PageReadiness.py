@@ -0,0 +1,187 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# Timing metrics
+# =========================
+class StageTimer:
+    """Đo thời gian từng giai đoạn crawl (navigate, login, generate, parse...)."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - start, 3)
+
+    def as_dict(self):
+        out = dict(self.timings)
+        out["total"] = round(sum(self.timings.values()), 3)
+        return out
+
+
+# =========================
+# JS hooks (cài vào trang để theo dõi mạng / DOM)
+# =========================
+_INSTALL_NETWORK_TRACKER_JS = """
+if (!window.__netTracker) {
+  window.__netTracker = true;
+  window.__pendingRequests = 0;
+  const origFetch = window.fetch;
+  if (origFetch) {
+    window.fetch = function() {
+      window.__pendingRequests++;
+      let settled = false;
+      const done = () => { if (!settled) { settled = true; window.__pendingRequests--; } };
+      const promise = origFetch.apply(this, arguments);
+      // fetch() resolve khi có header; response stream (AI gen) chỉ xong khi đọc hết body
+      // → đọc bản clone đến cuối rồi mới giảm bộ đếm
+      promise.then((response) => {
+        if (!response.body) { done(); return; }
+        const reader = response.clone().body.getReader();
+        const pump = () => reader.read().then(({ done: finished }) => finished ? done() : pump());
+        return pump();
+      }).catch(done).finally(done);
+      return promise;
+    };
+  }
+  const origSend = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function() {
+    window.__pendingRequests++;
+    this.addEventListener('loadend', () => { window.__pendingRequests--; });
+    return origSend.apply(this, arguments);
+  };
+}
+"""
+
+_INSTALL_MUTATION_TRACKER_JS = """
+if (!window.__mutationTracker) {
+  window.__mutationTracker = new MutationObserver(() => { window.__lastMutationAt = performance.now(); });
+  window.__mutationTracker.observe(document, {childList: true, subtree: true, characterData: true, attributes: true});
+  window.__lastMutationAt = performance.now();
+}
+"""
+
+
+def install_network_tracker(driver):
+    """Đếm số fetch/XHR đang chạy (chỉ thấy các request bắt đầu sau khi cài)."""
+    driver.execute_script(_INSTALL_NETWORK_TRACKER_JS)
+
+
+def install_mutation_tracker(driver):
+    """Ghi lại thời điểm DOM thay đổi lần cuối (MutationObserver)."""
+    driver.execute_script(_INSTALL_MUTATION_TRACKER_JS)
+
+
+# =========================
+# Readiness conditions
+# =========================
+def wait_for_document_ready(driver, timeout=20):
+    """Đợi document.readyState == 'complete'."""
+    WebDriverWait(driver, timeout).until(
+        lambda d: d.execute_script("return document.readyState") == "complete"
+    )
+
+
+def wait_for_node_count_stable(driver, selector="[data-type]", min_count=1, settle=2.0, timeout=90, poll=0.25):
+    """
+    Đợi số node khớp `selector` ổn định (không đổi trong `settle` giây) và >= `min_count`.
+    Dùng cho trang AI-generate: node được render dần đến khi sinh xong.
+
+    Hết `timeout` mà đã có node → trả về số node hiện có (log cảnh báo);
+    chưa có node nào → raise TimeoutException.
+    """
+    script = "return document.querySelectorAll(arguments[0]).length"
+    deadline = time.monotonic() + timeout
+    last_count = -1
+    stable_since = time.monotonic()
+
+    while True:
+        count = driver.execute_script(script, selector) or 0
+        now = time.monotonic()
+        if count != last_count:
+            last_count = count
+            stable_since = now
+        elif count >= min_count and now - stable_since >= settle:
+            return count
+
+        if now >= deadline:
+            if last_count >= min_count:
+                logger.warning(f"⚠️ '{selector}' count still changing after {timeout}s, using {last_count} nodes")
+                return last_count
+            raise TimeoutException(f"No '{selector}' nodes after {timeout}s")
+        time.sleep(poll)
+
+
+def wait_for_network_idle(driver, idle=0.5, timeout=30, poll=0.1):
+    """Đợi không còn fetch/XHR nào đang chạy trong `idle` giây (cần install_network_tracker trước)."""
+    script = "return window.__pendingRequests || 0"
+    deadline = time.monotonic() + timeout
+    idle_since = None
+
+    while True:
+        pending = driver.execute_script(script) or 0
+        now = time.monotonic()
+        if pending == 0:
+            idle_since = idle_since or now
+            if now - idle_since >= idle:
+                return True
+        else:
+            idle_since = None
+
+        if now >= deadline:
+            raise TimeoutException(f"Network not idle after {timeout}s ({pending} pending)")
+        time.sleep(poll)
+
+
+def wait_for_dom_quiescence(driver, quiet=1.0, timeout=30, poll=0.1):
+    """Đợi DOM không đổi trong `quiet` giây (cần install_mutation_tracker trước)."""
+    script = "return performance.now() - (window.__lastMutationAt || 0)"
+    deadline = time.monotonic() + timeout
+
+    while True:
+        since_ms = driver.execute_script(script) or 0
+        if since_ms >= quiet * 1000:
+            return True
+        if time.monotonic() >= deadline:
+            raise TimeoutException(f"DOM still mutating after {timeout}s")
+        time.sleep(poll)
+
+
+def wait_for_generation_complete(driver, selector="[data-type]", min_count=1, settle=2.0, timeout=90):
+    """
+    Đợi trang AI-generate sinh xong với 1 deadline chung `timeout` cho cả 3 tín hiệu:
+    số node `selector` ổn định → không còn fetch/XHR (kể cả body stream) → DOM ngừng thay đổi.
+    Cần install_network_tracker + install_mutation_tracker trước khi submit.
+
+    Chưa có node nào khi hết giờ → raise TimeoutException; đã có node nhưng mạng/DOM chưa yên
+    → log cảnh báo và trả về số node hiện có.
+    """
+    deadline = time.monotonic() + timeout
+
+    def remaining():
+        return max(0.0, deadline - time.monotonic())
+
+    count = wait_for_node_count_stable(driver, selector, min_count=min_count, settle=settle, timeout=timeout)
+    try:
+        wait_for_network_idle(driver, idle=settle / 4, timeout=remaining())
+        wait_for_dom_quiescence(driver, quiet=settle / 2, timeout=remaining())
+    except TimeoutException as e:
+        logger.warning(f"⚠️ Generation not settled after {timeout}s, using {count} nodes: {e.msg}")
+    return count
+
+
+def wait_for_url_change(driver, old_url, timeout=15):
+    """Đợi URL đổi khỏi `old_url` (vd: redirect sau khi submit form login)."""
+    WebDriverWait(driver, timeout).until(lambda d: d.current_url != old_url)
@@ -3,4 +3,7 @@ from pydantic import BaseModel
 class Schedule(BaseModel):
     query: str
     level: str | None = None
-    deadline: str | None = None
\ No newline at end of file
+    deadline: str | None = None
+    force_crawl: bool | None = False
+    use_cache: bool | None = True
+    mode: str | None = None  # "planner" | "agent" | "scheduler" (mặc định theo SCHEDULE_MODE)
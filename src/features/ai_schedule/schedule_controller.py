@@ -1,37 +1,22 @@
 from __future__ import annotations
 
-import os
 import json
-from typing import Any, Optional
+import logging
+from typing import Any, Dict, List, Optional
 
 from src.utils.load_documents import load_document, crawler_roadmap_to_docs
-from src.utils.vector_store import load_vector_store, create_vector_store
-from src.utils.custom_emb import create_embeddings
-from src.utils.initialize_llms import initialize_llm
-from src.utils.create_agent import create_agent
-from src.utils.learning_path import create_learning_path
-from langchain.memory import ConversationBufferMemory
+from src.utils.model_registry import get_registry
+from src.utils.learning_path import LEARNING_PATH_FAILED, create_learning_path
+from src.utils.planner import plan_learning_path, retrieve_context
+from src.utils.skill_scheduler import build_schedule, phrase_objectives, schedule_to_text
+from src.utils.env import env_flag, get_env_var
 
+# "planner"  : retrieve (get_scoped_docs / hybrid_search) + 1 lần gọi LLM (JSON)
+# "agent"    : ReAct agent (nhiều bước, có Wikipedia)
+# "scheduler": chia tuần thuần thuật toán từ cây roadmap (LLM chỉ tuỳ chọn để diễn đạt objective)
+SCHEDULE_MODES = ("planner", "agent", "scheduler")
 
-def _get_env_var(key: str, default: Optional[str] = None) -> Optional[str]:
-    """
-    Lấy biến môi trường theo thứ tự:
-      1) os.environ (Render/Railway/Heroku…)
-      2) .env (nếu có python-dotenv và file tồn tại)
-      3) default
-    """
-    if key in os.environ:
-        return os.environ.get(key)
-
-    try:
-        from dotenv import dotenv_values  # optional
-        vals = dotenv_values(".env")
-        if key in vals and vals[key]:
-            return vals[key]
-    except Exception:
-        pass
-
-    return default
+logger = logging.getLogger(__name__)
 
 
 def _get(req: Any, name: str, default: Any = None) -> Any:
@@ -41,50 +26,127 @@ def _get(req: Any, name: str, default: Any = None) -> Any:
     return getattr(req, name, default)
 
 
-def GenSchedule(req: Any, roadmap_data=None):
+def _scheduled_learning_path(req: Any, roadmap_data, phrase: bool = False) -> str:
+    """Lịch học deterministic (không cần LLM); `phrase` → thêm 1 lần gọi LLM viết lại objective."""
+    schedule = build_schedule(
+        roadmap_data,
+        deadline=_get(req, "deadline"),
+        default_weeks=int(get_env_var("SCHEDULER_DEFAULT_WEEKS", "8")),
+    )
+    if phrase:
+        schedule = phrase_objectives(
+            get_registry().get_llm(), schedule, _get(req, "query", ""), _get(req, "level", "") or ""
+        )
+    return schedule_to_text(schedule)
+
+
+def _fallback(req: Any, roadmap_data, mode: str, reason: str) -> Optional[str]:
+    """Planner/agent lỗi (provider chậm/down) → lịch từ scheduler nếu bật SCHEDULER_FALLBACK."""
+    if not roadmap_data or not env_flag("SCHEDULER_FALLBACK", True):
+        return None
+    logger.warning(f"⚠️ {mode} mode failed ({reason}), falling back to algorithmic scheduler")
     try:
-        # --- Load documents ---
-        documents = crawler_roadmap_to_docs(roadmap_data)
-        if not documents:
-            return "No documents found to load."
+        return _scheduled_learning_path(req, roadmap_data)
+    except Exception:
+        logger.exception("Scheduler fallback failed")
+        return None
+
 
-        # --- Embeddings + Vector Store ---
-        embeddings = create_embeddings()
+def schedule_mode(req: Any) -> str:
+    return (_get(req, "mode") or get_env_var("SCHEDULE_MODE", "planner") or "planner").lower()
 
-        # Ưu tiên ENV → .env → mặc định
-        vectordb_path = _get_env_var("VECTORDB_PATH", "./chroma_db")
 
-        # Nếu thư mục đã tồn tại → load, ngược lại → tạo mới
-        if vectordb_path and os.path.exists(vectordb_path):
-            vector_store = load_vector_store(db_path=vectordb_path, embeddings=embeddings)
-        else:
-            vector_store = create_vector_store(documents, embeddings, db_path=vectordb_path)
+def prepare_schedule(req: Any, roadmap_data=None) -> Optional[Dict[str, Any]]:
+    """
+    Ingest roadmap vào vector store + retrieval (planner) 1 lần; kết quả dùng lại được cho nhiều
+    request cùng (target, level) — vd: /query/batch. Không có document → None.
+    """
+    target = _get(req, "query", "")
+    level = _get(req, "level", "") or ""
+    documents = crawler_roadmap_to_docs(roadmap_data, target=target, level=level)
+    if not documents:
+        return None
+
+    # Chunk mới của roadmap được upsert (theo content hash) vào store dùng chung
+    vector_store = get_registry().ingest(documents, target=target, level=level)
+    context = None
+    if schedule_mode(req) == "planner":
+        context = retrieve_context(
+            vector_store,
+            target,
+            _get(req, "level", "") or "",
+            k=int(get_env_var("PLANNER_TOP_K", "6")),
+            llm=get_registry().get_llm(),
+            roadmap=roadmap_data,
+        )
+    return {"vector_store": vector_store, "context": context}
+
+
+def GenSchedule(
+    req: Any,
+    roadmap_data=None,
+    callbacks: Optional[List[Any]] = None,
+    prepared: Optional[Dict[str, Any]] = None,
+):
+    """
+    Sinh learning path cho `req` từ roadmap đã crawl.
+    `callbacks`: LangChain callback handlers (vd: stream token/tiến trình agent qua SSE).
+    `prepared`: kết quả prepare_schedule dùng chung (bỏ qua ingest/retrieval).
+    """
+    mode = schedule_mode(req)
+    if mode not in SCHEDULE_MODES:
+        return f"Error: unsupported schedule mode '{mode}' (expected one of {', '.join(SCHEDULE_MODES)})"
 
-        # --- LLM, Agent ---
-        # Cho phép override loại LLM qua ENV LLM_TYPE (vd: "groq", "openai", "gemini", "local")
-        llm_type = _get_env_var("LLM_TYPE", "gemini")
-        llm = initialize_llm(llm_type=llm_type)
-        memory = ConversationBufferMemory(memory_key="chat_history", input_key="input")
-        agent = create_agent(llm, vector_store, memory)
+    if mode == "scheduler":
+        try:
+            return _scheduled_learning_path(req, roadmap_data, phrase=env_flag("SCHEDULER_LLM_PHRASING", False))
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    try:
+        # --- Documents → Embeddings + Vector Store (registry đã warm sẵn) ---
+        prepared = prepared or prepare_schedule(req, roadmap_data)
+        if not prepared:
+            return "No documents found to load."
+        registry = get_registry()
+        vector_store = prepared["vector_store"]
 
         # --- Create learning path ---
         learning_goal = _get(req, "query", "")
         user_knowledge = _get(req, "level", "")
         deadline = _get(req, "deadline", "")
 
+        if mode == "planner":
+            learning_path = plan_learning_path(
+                registry.get_llm(),
+                vector_store,
+                learning_goal,
+                deadline,
+                user_knowledge,
+                k=int(get_env_var("PLANNER_TOP_K", "6")),
+                callbacks=callbacks,
+                context=prepared.get("context"),
+            )
+            return learning_path or _fallback(req, roadmap_data, mode, "empty output") or "LLM returned empty learning path."
+
+        # --- Agent: tạo mới mỗi request (memory riêng) ---
+        agent = registry.new_agent(vector_store, target=learning_goal, level=user_knowledge)
+
         # Hàm create_learning_path của bạn có thể là (agent, goal, user_knowledge) hoặc có thêm deadline.
         # Nếu version của bạn CHƯA nhận deadline, chỉ cần bỏ tham số đó.
         try:
-            learning_path = create_learning_path(agent, learning_goal, deadline, user_knowledge)
+            learning_path = create_learning_path(
+                agent, learning_goal, deadline, user_knowledge, callbacks=callbacks
+            )
         except TypeError:
             # fallback cho phiên bản cũ chỉ có (agent, learning_goal, user_knowledge="")
             learning_path = create_learning_path(agent, learning_goal, user_knowledge)
 
-        if not learning_path:
-            return "LLM returned empty learning path."
+        if not learning_path or learning_path == LEARNING_PATH_FAILED:
+            return _fallback(req, roadmap_data, mode, "no learning path") or "LLM returned empty learning path."
 
         # ✅ Trả về câu trả lời gốc từ LLM/Agent (không ép JSON)
         return learning_path
 
     except Exception as e:
-        return f"Error: {str(e)}"
+        return _fallback(req, roadmap_data, mode, str(e)) or f"Error: {str(e)}"
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from src.utils.skill_scheduler import flatten_roadmap
+from src.utils.env import get_env_var
+
+# Ngân sách token cho phần context theo llm_type (phần còn lại dành cho hướng dẫn + output)
+DEFAULT_TOKEN_BUDGETS: Dict[str, int] = {
+    "local": 1200,
+    "google_palm": 2000,
+    "groq": 3000,
+    "openai": 4000,
+    "gemini": 6000,
+}
+FALLBACK_TOKEN_BUDGET = 2000
+
+# _llm_type của LangChain → llm_type của initialize_llm
+_LLM_TYPE_ALIASES = {
+    "gemini-rest": "gemini",
+    "openai-chat": "openai",
+    "groq-chat": "groq",
+    "llamacpp": "local",
+    "google_palm": "google_palm",
+}
+
+# Chunk bị cắt ở cuối ngân sách chỉ giữ nếu còn đủ chỗ cho ít nhất chừng này token
+MIN_TAIL_TOKENS = 64
+# Độ dài tối thiểu (ký tự) của phần chồng lấn đầu/cuối chunk để coi là overlap của text splitter
+MIN_OVERLAP_CHARS = 40
+
+
+# =========================
+# Token budget
+# =========================
+def estimate_tokens(text: str) -> int:
+    """Ước lượng nhanh ~4 ký tự / token (không phụ thuộc tokenizer của từng provider)."""
+    return (len(text or "") + 3) // 4
+
+
+def resolve_llm_type(llm_or_type: Any) -> str:
+    """Nhận llm_type ("gemini"…) hoặc instance LLM (đọc `_llm_type`)."""
+    if isinstance(llm_or_type, str):
+        name = llm_or_type
+    else:
+        name = getattr(llm_or_type, "_llm_type", "") or ""
+    return _LLM_TYPE_ALIASES.get(name, name)
+
+
+def token_budget(llm_or_type: Any = None) -> int:
+    """CONTEXT_TOKEN_BUDGET_<TYPE> > CONTEXT_TOKEN_BUDGET > mặc định theo llm_type."""
+    llm_type = resolve_llm_type(llm_or_type or get_env_var("LLM_TYPE", "gemini"))
+    raw = get_env_var(f"CONTEXT_TOKEN_BUDGET_{llm_type.upper()}") or get_env_var("CONTEXT_TOKEN_BUDGET")
+    if raw:
+        return int(raw)
+    return DEFAULT_TOKEN_BUDGETS.get(llm_type, FALLBACK_TOKEN_BUDGET)
+
+
+# =========================
+# Dedupe + pack chunk
+# =========================
+ScoredDoc = Tuple[Any, Optional[float]]
+
+
+def _as_scored(results: Iterable[Union[Any, Tuple[Any, float]]]) -> List[ScoredDoc]:
+    """retrieve / get_scoped_docs trả list[Document] hoặc list[(Document, score)]."""
+    scored: List[ScoredDoc] = []
+    for item in results or []:
+        if isinstance(item, tuple) and len(item) == 2:
+            scored.append((item[0], item[1]))
+        else:
+            scored.append((item, None))
+    return scored
+
+
+def _strip_overlap(kept: Sequence[str], text: str) -> str:
+    """Bỏ phần đầu `text` trùng với phần cuối 1 chunk đã giữ (CHUNK_OVERLAP của splitter)."""
+    head = text[:MIN_OVERLAP_CHARS]
+    if len(head) < MIN_OVERLAP_CHARS:
+        return text
+    for prev in kept:
+        # Quét từ trái → overlap dài nhất được cắt trước
+        pos = prev.find(head)
+        while pos >= 0:
+            tail = prev[pos:]
+            if text.startswith(tail):
+                return text[len(tail):].lstrip()
+            pos = prev.find(head, pos + 1)
+    return text
+
+
+def dedupe_chunks(results: Iterable[Union[Any, Tuple[Any, float]]]) -> List[str]:
+    """
+    Bỏ chunk trùng/nằm trọn trong chunk đã giữ và cắt phần overlap giữa 2 chunk liền kề.
+    Giữ nguyên thứ tự đầu vào: get_scoped_docs đặt phạm vi hẹp (target/level) trước phạm vi rộng,
+    mỗi phạm vi đã xếp theo score — sắp lại theo score sẽ để chunk phạm vi rộng chiếm ngân sách token.
+    """
+    scored = _as_scored(results)
+
+    kept: List[str] = []
+    for doc, _ in scored:
+        text = (getattr(doc, "page_content", doc) or "").strip()
+        if not text or any(text in prev for prev in kept):
+            continue
+        # Chunk mới chứa trọn chunk cũ → thay thế chunk cũ (giữ vị trí của nó)
+        covered = [i for i, prev in enumerate(kept) if prev in text]
+        if covered:
+            kept[covered[0]] = text
+            for i in reversed(covered[1:]):
+                kept.pop(i)
+            continue
+        text = _strip_overlap(kept, text)
+        if text:
+            kept.append(text)
+    return kept
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cắt theo ngân sách, ưu tiên dừng ở cuối dòng."""
+    limit = max_tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit)
+    return text[: cut if cut > limit // 2 else limit].rstrip() + " …"
+
+
+def pack_chunks(chunks: Sequence[str], budget: int, separator: str = "\n---\n") -> str:
+    """Ghép chunk theo thứ tự tới khi hết `budget` token (chunk cuối có thể bị cắt)."""
+    parts: List[str] = []
+    used = 0
+    sep_tokens = estimate_tokens(separator)
+    for chunk in chunks:
+        cost = estimate_tokens(chunk) + (sep_tokens if parts else 0)
+        if used + cost <= budget:
+            parts.append(chunk)
+            used += cost
+            continue
+        remaining = budget - used - (sep_tokens if parts else 0)
+        if remaining >= MIN_TAIL_TOKENS:
+            parts.append(_truncate_to_tokens(chunk, remaining))
+        break
+    return separator.join(parts)
+
+
+# =========================
+# Roadmap outline
+# =========================
+def roadmap_outline(roadmap: Any, max_topics: int = 4) -> str:
+    """
+    Cây roadmap thu gọn, 1 dòng / skill:
+      Skill: Sub1 (t1, t2, +3), Sub2
+    """
+    lines: List[str] = []
+    current: Optional[str] = None
+    labels: List[str] = []
+    for unit in flatten_roadmap(roadmap):
+        if unit["skill"] != current:
+            if current is not None:
+                lines.append(f"{current}: {', '.join(labels)}" if labels else current)
+            current, labels = unit["skill"], []
+        if unit["subskill"]:
+            topics = unit["topics"]
+            label = unit["subskill"]
+            if topics:
+                shown = ", ".join(topics[:max_topics])
+                extra = f", +{len(topics) - max_topics}" if len(topics) > max_topics else ""
+                label = f"{label} ({shown}{extra})"
+            labels.append(label)
+    if current is not None:
+        lines.append(f"{current}: {', '.join(labels)}" if labels else current)
+    return "\n".join(lines)
+
+
+# =========================
+# Entry point
+# =========================
+def build_context(
+    results: Iterable[Union[Any, Tuple[Any, float]]],
+    llm_or_type: Any = None,
+    roadmap: Any = None,
+    budget: Optional[int] = None,
+    outline_share: float = 0.35,
+) -> str:
+    """
+    Context cho prompt trong ngân sách token của LLM:
+      outline roadmap (tối đa `outline_share` ngân sách) + chunk retrieve đã dedupe, theo score.
+    """
+    budget = budget or token_budget(llm_or_type)
+    sections: List[str] = []
+
+    if roadmap:
+        outline = roadmap_outline(roadmap)
+        if outline:
+            outline = _truncate_to_tokens(outline, int(budget * outline_share))
+            sections.append(f"Roadmap outline:\n{outline}")
+            budget -= estimate_tokens(sections[-1])
+
+    chunks = pack_chunks(dedupe_chunks(results), max(budget, 0))
+    if chunks:
+        sections.append(chunks)
+    return "\n\n".join(sections)
@@ -1,14 +1,21 @@
 # LangChain Agents & Memory
 from langchain.agents import AgentType, initialize_agent, Tool
 from langchain.memory import ConversationBufferMemory
-from typing import List, Union, Dict, Any
+from typing import List, Union, Dict, Any, Optional
 from langchain_community.vectorstores import Chroma
 from langchain_community.utilities import WikipediaAPIWrapper
-from src.utils.vector_store import get_similar_docs
+from src.utils.hybrid_retrieval import retrieve
+from src.utils.context_builder import build_context, token_budget
 import sys
 
 
-def create_agent(llm: Any, vector_store: Chroma, memory: ConversationBufferMemory) -> Any:
+def create_agent(
+    llm: Any,
+    vector_store: Chroma,
+    memory: ConversationBufferMemory,
+    target: Optional[str] = None,
+    level: Optional[str] = None,
+) -> Any:
     """
     Creates an agent that can answer questions about the documents in the vector store
     and carry on a conversation.
@@ -17,6 +24,8 @@ def create_agent(llm: Any, vector_store: Chroma, memory: ConversationBufferMemor
         llm: The language model.
         vector_store: The vector store containing the document embeddings.
         memory: Conversation buffer.
+        target: Restrict retrieval to chunks of this roadmap target (widened if too few match).
+        level: Optional roadmap level used as an extra retrieval filter.
 
     Returns:
         An agent.
@@ -25,10 +34,17 @@ def create_agent(llm: Any, vector_store: Chroma, memory: ConversationBufferMemor
         # Khởi tạo Wikipedia wrapper
         wiki = WikipediaAPIWrapper()
 
+        # Observation tích luỹ trong scratchpad qua nhiều bước → mỗi lần chỉ dùng 1/3 ngân sách context
+        observation_budget = max(256, token_budget(llm) // 3)
+
         # Định nghĩa các tool
         tools = [
             Tool.from_function(
-                func=lambda q: get_similar_docs(q, vector_store),
+                func=lambda q: build_context(
+                    retrieve(q, vector_store, with_score=True, target=target, level=level),
+                    llm,
+                    budget=observation_budget,
+                ),
                 name="learning_material_qa",
                 description="Useful for answering questions about the learning materials."
             ),
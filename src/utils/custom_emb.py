@@ -1,8 +1,11 @@
 from __future__ import annotations
 
-import os
+import logging
 from typing import List, Optional, Union
 
+from src.utils.embedding_engine import EmbeddingCache, EmbeddingEngine, QueryMicroBatcher
+from src.utils.env import env_flag, get_env_var
+
 try:
     from sentence_transformers import SentenceTransformer
 except Exception as e:
@@ -11,50 +14,90 @@ except Exception as e:
     ) from e
 
 
-def _get_env_var(key: str, default: Optional[str] = None) -> Optional[str]:
-    """
-    Lấy biến môi trường theo thứ tự:
-    1) os.environ
-    2) .env (nếu có python-dotenv và file tồn tại)
-    3) default
-    """
-    if key in os.environ:
-        return os.environ.get(key)
-    try:
-        from dotenv import dotenv_values  # optional
-        vals = dotenv_values(".env")
-        if key in vals and vals[key]:
-            return vals[key]
-    except Exception:
-        pass
-    return default
+logger = logging.getLogger(__name__)
 
 
 class CustomEmbeddings:
-    def __init__(self, model_name: str, device: Optional[str] = None):
+    def __init__(
+        self,
+        model_name: str,
+        device: Optional[str] = None,
+        *,
+        batch_size: int = 32,
+        normalize: bool = False,
+        cache: Optional[EmbeddingCache] = None,
+        micro_batch_wait_ms: float = 0.0,
+        micro_batch_max: int = 64,
+        backend: str = "torch",
+        onnx_dir: Optional[str] = None,
+    ):
         """
         Args:
             model_name: tên model HF (vd: 'sentence-transformers/all-MiniLM-L6-v2')
             device: 'cpu' | 'cuda' | None (None để auto theo sentence-transformers)
+            batch_size: số text mỗi lần encode (bucket theo độ dài)
+            normalize: L2-normalize vector đầu ra
+            cache: cache vector trên đĩa (None = tắt)
+            micro_batch_wait_ms: > 0 → gộp các embed_query đồng thời thành 1 lần encode
+            backend: 'torch' | 'onnx' | 'onnx-int8' (ONNX lỗi → tự fallback về torch)
         """
-        # SentenceTransformer tự chọn device nếu None
-        self.model = SentenceTransformer(model_name, device=device)
+        self.model = None
+        self.onnx_encoder = None
+        self.backend = "torch"
+        if backend in ("onnx", "onnx-int8"):
+            try:
+                from src.utils.onnx_embedding import OnnxSentenceEncoder
+
+                self.onnx_encoder = OnnxSentenceEncoder(
+                    model_name, quantize=(backend == "onnx-int8"), onnx_dir=onnx_dir
+                )
+                self.backend = backend
+            except Exception as e:
+                logger.warning(f"⚠️ ONNX embedding backend unavailable, falling back to PyTorch: {e}")
+
+        if self.onnx_encoder is None:
+            # SentenceTransformer tự chọn device nếu None
+            self.model = SentenceTransformer(model_name, device=device)
+
+        self.engine = EmbeddingEngine(
+            self._encode,
+            # Vector int8 khác float → tách khoá cache theo backend
+            model_key=f"{model_name}|{self.backend}",
+            batch_size=batch_size,
+            normalize=normalize,
+            cache=cache,
+        )
+        self._query_batcher = (
+            QueryMicroBatcher(self.engine, max_batch=micro_batch_max, max_wait_ms=micro_batch_wait_ms)
+            if micro_batch_wait_ms > 0 else None
+        )
+
+    def _encode(self, texts: List[str]):
+        if self.onnx_encoder is not None:
+            return self.onnx_encoder.encode(texts)
+        # Engine đã chia bucket theo độ dài → encode nguyên bucket trong 1 batch
+        return self.model.encode(
+            texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False
+        )
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         if not isinstance(texts, list):
             raise TypeError("texts phải là List[str]")
-        return self.model.encode(texts, convert_to_numpy=True).tolist()
+        return self.engine.embed(texts)
 
     def embed_query(self, text: str) -> List[float]:
         if not isinstance(text, str):
             raise TypeError("text phải là str")
-        return self.model.encode(text, convert_to_numpy=True).tolist()
+        if self._query_batcher is not None:
+            return self._query_batcher.submit(text)
+        return self.engine.embed([text])[0]
 
 
 def create_embeddings(
     model_name: Optional[str] = None,
     *,
     device: Optional[str] = None,
+    use_cache: bool = True,
 ) -> CustomEmbeddings:
     """
     Tạo CustomEmbeddings dùng sentence-transformers.
@@ -63,13 +106,36 @@ def create_embeddings(
       1) Tham số `model_name`
       2) ENV EMBEDDING_MODEL_NAME (os hoặc .env nếu có)
       3) Mặc định: 'sentence-transformers/all-MiniLM-L6-v2'
+
+    Cấu hình engine qua ENV:
+      EMBEDDING_BATCH_SIZE (32), EMBEDDING_NORMALIZE (0),
+      EMBEDDING_CACHE_PATH ('./embedding_cache/embeddings.sqlite3'; rỗng = tắt cache),
+      EMBEDDING_CACHE_MAX_ENTRIES (200000),
+      EMBEDDING_MICROBATCH_WAIT_MS (5; 0 = tắt), EMBEDDING_MICROBATCH_MAX (64),
+      EMBEDDING_BACKEND ('torch' | 'onnx' | 'onnx-int8'), EMBEDDING_ONNX_DIR ('./onnx_models')
+    `use_cache=False` → bỏ qua cache trên đĩa bất kể EMBEDDING_CACHE_PATH (vd: benchmark).
     """
     try:
         name = (
             model_name
-            or _get_env_var("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+            or get_env_var("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+        )
+        cache_path = get_env_var("EMBEDDING_CACHE_PATH", "./embedding_cache/embeddings.sqlite3") if use_cache else None
+        cache = (
+            EmbeddingCache(cache_path, max_entries=int(get_env_var("EMBEDDING_CACHE_MAX_ENTRIES", "200000")))
+            if cache_path else None
+        )
+        return CustomEmbeddings(
+            model_name=name,
+            device=device,
+            batch_size=int(get_env_var("EMBEDDING_BATCH_SIZE", "32")),
+            normalize=env_flag("EMBEDDING_NORMALIZE", False),
+            cache=cache,
+            micro_batch_wait_ms=float(get_env_var("EMBEDDING_MICROBATCH_WAIT_MS", "5")),
+            micro_batch_max=int(get_env_var("EMBEDDING_MICROBATCH_MAX", "64")),
+            backend=(get_env_var("EMBEDDING_BACKEND", "torch") or "torch").lower(),
+            onnx_dir=get_env_var("EMBEDDING_ONNX_DIR", "./onnx_models"),
         )
-        return CustomEmbeddings(model_name=name, device=device)
     except Exception as e:
         # Không sys.exit(); để caller xử lý
         raise RuntimeError(f"Error creating embeddings: {e}") from e
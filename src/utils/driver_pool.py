@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledItem:
+    """Bọc 1 instance (vd: RoadmapCrawler) kèm thông tin vòng đời để quyết định recycle."""
+
+    def __init__(self, instance: Any):
+        self.instance = instance
+        self.uses = 0
+        self.created_at = time.monotonic()
+
+
+class DriverPool:
+    """
+    Pool có giới hạn cho các tài nguyên trình duyệt (Selenium driver đã login sẵn).
+
+    - checkout()/checkin qua context manager `with pool.checkout() as item: ...`
+    - tối đa `size` instance tồn tại cùng lúc; request thứ size+1 phải đợi (tối đa `checkout_timeout`)
+    - health check khi lấy ra và khi trả về; instance hỏng bị đóng và tạo lại
+    - recycle sau `max_uses` lần dùng hoặc khi code bên trong ném exception
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        size: int = 2,
+        *,
+        max_uses: int = 20,
+        checkout_timeout: float = 120.0,
+        health_check: Optional[Callable[[Any], bool]] = None,
+        closer: Optional[Callable[[Any], None]] = None,
+    ):
+        if size < 1:
+            raise ValueError("Pool size phải >= 1")
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.checkout_timeout = checkout_timeout
+        self.health_check = health_check
+        self.closer = closer
+
+        self._idle: "queue.LifoQueue[_PooledItem]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # Thống kê đơn giản để debug / expose qua endpoint nếu cần
+        self._created = 0
+        self._recycled = 0
+        self._in_use = 0
+
+    # ---------- Lifecycle ----------
+    def prewarm(self, count: Optional[int] = None) -> int:
+        """Tạo sẵn `count` instance (mặc định = size). Lỗi chỉ log, trả về số instance tạo được."""
+        count = self.size if count is None else min(count, self.size)
+        created = 0
+        for _ in range(count):
+            try:
+                self._idle.put(self._create())
+                created += 1
+            except Exception as e:
+                logger.error(f"❌ Driver pool prewarm failed: {e}")
+                break
+        return created
+
+    def close(self) -> None:
+        """Đóng toàn bộ instance đang rảnh; instance đang được dùng sẽ bị đóng khi checkin."""
+        self._closed = True
+        while True:
+            try:
+                item = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._destroy(item)
+
+    # ---------- Checkout / checkin ----------
+    @contextmanager
+    def checkout(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        item = self._acquire(timeout)
+        failed = False
+        try:
+            yield item.instance
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._release(item, failed=failed)
+
+    def _acquire(self, timeout: Optional[float]) -> _PooledItem:
+        if self._closed:
+            raise RuntimeError("Driver pool đã đóng")
+
+        wait = self.checkout_timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=wait):
+            raise TimeoutError(f"Không lấy được driver trong {wait}s (pool size={self.size})")
+
+        try:
+            item = self._take_healthy_idle() or self._create()
+        except Exception:
+            self._slots.release()
+            raise
+
+        item.uses += 1
+        with self._lock:
+            self._in_use += 1
+        return item
+
+    def _release(self, item: _PooledItem, failed: bool = False) -> None:
+        try:
+            if self._closed or failed or item.uses >= self.max_uses or not self._is_healthy(item):
+                self._destroy(item)
+            else:
+                self._idle.put(item)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def _take_healthy_idle(self) -> Optional[_PooledItem]:
+        while True:
+            try:
+                item = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if self._is_healthy(item):
+                return item
+            self._destroy(item)
+
+    # ---------- Helpers ----------
+    def _create(self) -> _PooledItem:
+        instance = self.factory()
+        with self._lock:
+            self._created += 1
+        return _PooledItem(instance)
+
+    def _destroy(self, item: _PooledItem) -> None:
+        with self._lock:
+            self._recycled += 1
+        try:
+            if self.closer is not None:
+                self.closer(item.instance)
+            elif hasattr(item.instance, "close"):
+                item.instance.close()
+        except Exception as e:
+            logger.warning(f"⚠️ Error closing pooled driver: {e}")
+
+    def _is_healthy(self, item: _PooledItem) -> bool:
+        if self.health_check is None:
+            return True
+        try:
+            return bool(self.health_check(item.instance))
+        except Exception:
+            return False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "in_use": self._in_use,
+                "created": self._created,
+                "recycled": self._recycled,
+            }
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# encode_fn: nhận list[str], trả ndarray (n, dim) — SentenceTransformer, ONNX, ...
+EncodeFn = Callable[[List[str]], np.ndarray]
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# =========================
+# On-disk cache (SQLite, LRU)
+# =========================
+class EmbeddingCache:
+    """
+    Cache vector trên đĩa, khoá = (model_key, sha256(text)).
+    Vượt `max_entries` thì xoá các entry lâu không dùng nhất (LRU theo last_used).
+    """
+
+    def __init__(self, path: str, max_entries: int = 200_000):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text_hash TEXT NOT NULL, vec BLOB NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Trả {text_hash: vector} cho các text đã có trong cache."""
+        hashes = list({_text_hash(t) for t in texts})
+        found: Dict[str, np.ndarray] = {}
+        if not hashes:
+            return found
+
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(hashes), 500):  # giới hạn số tham số SQLite
+                chunk = hashes[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vec FROM embeddings WHERE model = ? AND text_hash IN ({marks})",
+                    [model, *chunk],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, model: str, items: Sequence[Tuple[str, np.ndarray]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (model, _text_hash(text), np.asarray(vec, dtype=np.float32).tobytes(), now)
+            for text, vec in items
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vec, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN"
+                " (SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# =========================
+# Batched engine
+# =========================
+class EmbeddingEngine:
+    """
+    Bọc 1 hàm encode:
+      - tra cache trước, chỉ encode text chưa có (và chỉ 1 lần cho text trùng)
+      - sắp theo độ dài rồi chia bucket `batch_size` → giảm padding trong mỗi batch
+      - tuỳ chọn L2-normalize
+    """
+
+    def __init__(
+        self,
+        encode_fn: EncodeFn,
+        model_key: str,
+        *,
+        batch_size: int = 32,
+        normalize: bool = False,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        self.encode_fn = encode_fn
+        self.model_key = f"{model_key}|norm={int(normalize)}"
+        self.batch_size = max(1, batch_size)
+        self.normalize = normalize
+        self.cache = cache
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        vectors: Dict[str, np.ndarray] = {}
+        if self.cache is not None:
+            try:
+                vectors.update(self.cache.get_many(self.model_key, texts))
+            except Exception as e:
+                logger.warning(f"⚠️ Embedding cache read failed: {e}")
+
+        # Text chưa có vector (mỗi text chỉ encode 1 lần dù xuất hiện nhiều lần)
+        pending: Dict[str, str] = {}
+        for text in texts:
+            h = _text_hash(text)
+            if h not in vectors and h not in pending:
+                pending[h] = text
+
+        if pending:
+            computed = self._encode_bucketed(list(pending.items()))
+            vectors.update(computed)
+            if self.cache is not None:
+                try:
+                    self.cache.put_many(self.model_key, [(pending[h], v) for h, v in computed.items()])
+                except Exception as e:
+                    logger.warning(f"⚠️ Embedding cache write failed: {e}")
+
+        return [vectors[_text_hash(t)].tolist() for t in texts]
+
+    def _encode_bucketed(self, items: List[Tuple[str, str]]) -> Dict[str, np.ndarray]:
+        # Sắp theo độ dài để các câu dài/ngắn nằm chung batch với nhau
+        items = sorted(items, key=lambda kv: len(kv[1]))
+        out: Dict[str, np.ndarray] = {}
+        for start in range(0, len(items), self.batch_size):
+            bucket = items[start:start + self.batch_size]
+            matrix = np.asarray(self.encode_fn([text for _, text in bucket]), dtype=np.float32)
+            if matrix.ndim == 1:
+                matrix = matrix.reshape(1, -1)
+            if self.normalize:
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                matrix = matrix / np.clip(norms, 1e-12, None)
+            for (h, _), vec in zip(bucket, matrix):
+                out[h] = vec
+        return out
+
+
+# =========================
+# Micro-batcher cho embed_query
+# =========================
+class QueryMicroBatcher:
+    """
+    Gộp các embed_query đồng thời (từ nhiều request/thread) thành 1 lần encode:
+    thread nền gom tối đa `max_batch` query hoặc đợi tối đa `max_wait_ms` rồi encode 1 lượt.
+    """
+
+    def __init__(self, engine: EmbeddingEngine, max_batch: int = 64, max_wait_ms: float = 5.0):
+        self.engine = engine
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="embed-query-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> List[float]:
+        fut: Future = Future()
+        self._queue.put((text, fut))
+        return fut.result()
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                vectors = self.engine.embed([text for text, _ in batch])
+                for (_, fut), vec in zip(batch, vectors):
+                    fut.set_result(vec)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
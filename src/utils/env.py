@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import os
+import threading
+from typing import Dict, Optional, Tuple, Union
+
+ENV_FILE = ".env"
+_TRUTHY = ("1", "true", "yes")
+
+# (mtime, giá trị) của .env — chỉ parse lại khi file đổi
+_dotenv_cache: Tuple[Optional[float], Dict[str, Optional[str]]] = (None, {})
+_dotenv_lock = threading.Lock()
+
+
+def _dotenv_values() -> Dict[str, Optional[str]]:
+    """Nội dung .env (không có file hoặc chưa cài python-dotenv → {})."""
+    global _dotenv_cache
+    try:
+        mtime = os.path.getmtime(ENV_FILE)
+    except OSError:
+        return {}
+    cached_mtime, values = _dotenv_cache
+    if cached_mtime == mtime:
+        return values
+    with _dotenv_lock:
+        try:
+            from dotenv import dotenv_values  # optional
+            values = dict(dotenv_values(ENV_FILE))
+        except Exception:
+            values = {}
+        _dotenv_cache = (mtime, values)
+    return values
+
+
+def get_env_var(key: str, default: Optional[str] = None) -> Optional[str]:
+    """
+    Lấy biến môi trường theo thứ tự:
+      1) os.environ (Render/Railway/Heroku đặt ở đây)
+      2) .env (nếu có python-dotenv và file tồn tại)
+      3) default
+    """
+    if key in os.environ:
+        return os.environ.get(key)
+    value = _dotenv_values().get(key)
+    return value if value else default
+
+
+def env_flag(key: str, default: Union[bool, str] = False) -> bool:
+    """Cờ bật/tắt: "1" | "true" | "yes" (không phân biệt hoa thường) → True."""
+    if isinstance(default, bool):
+        default = "1" if default else "0"
+    return (get_env_var(key, default) or "").lower() in _TRUTHY
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+from src.utils.env import get_env_var
+
+T = TypeVar("T")
+
+
+# Số thread mặc định theo loại tài nguyên; override bằng ENV EXECUTOR_<KIND>_WORKERS
+#   - browser: Selenium (mặc định bằng CRAWLER_POOL_SIZE, không cần nhiều thread hơn số driver)
+#   - db     : pymongo (I/O nhẹ, nhiều thread được)
+#   - llm    : GenSchedule / agent.run / embedding (nặng CPU + chờ mạng)
+_DEFAULT_WORKERS: Dict[str, Callable[[], str]] = {
+    "browser": lambda: get_env_var("CRAWLER_POOL_SIZE", "2"),
+    "db": lambda: "8",
+    "llm": lambda: "4",
+}
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_lock = threading.Lock()
+
+
+def get_executor(kind: str) -> ThreadPoolExecutor:
+    """Thread pool có giới hạn cho 1 loại tài nguyên (tạo lười, dùng chung toàn process)."""
+    executor = _executors.get(kind)
+    if executor is None:
+        with _lock:
+            executor = _executors.get(kind)
+            if executor is None:
+                default = _DEFAULT_WORKERS.get(kind, lambda: "4")()
+                workers = int(get_env_var(f"EXECUTOR_{kind.upper()}_WORKERS", default) or default)
+                executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=f"{kind}-worker")
+                _executors[kind] = executor
+    return executor
+
+
+async def run_blocking(kind: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Chạy hàm blocking (Selenium/pymongo/LLM) trong pool `kind`, không chặn event loop."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(kind), call)
+
+
+def shutdown_executors(wait: bool = False) -> None:
+    with _lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=wait, cancel_futures=True)
+        _executors.clear()
@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENDPOINT = "https://generativelanguage.googleapis.com/v1beta/models/{model}:{method}"
+
+# Lỗi tạm thời đáng retry
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+# =========================
+# Metrics
+# =========================
+class LLMMetrics:
+    """Đếm số lần gọi, lỗi, retry, tổng latency và token (theo usageMetadata của Gemini)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def record(self, latency: float, usage: Optional[Dict[str, Any]], retries: int, ok: bool) -> None:
+        usage = usage or {}
+        with self._lock:
+            self.calls += 1
+            self.errors += 0 if ok else 1
+            self.retries += retries
+            self.total_latency += latency
+            self.last_latency = latency
+            self.prompt_tokens += int(usage.get("promptTokenCount") or 0)
+            self.output_tokens += int(usage.get("candidatesTokenCount") or 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "retries": self.retries,
+                "avg_latency_s": round(self.total_latency / self.calls, 3) if self.calls else 0.0,
+                "last_latency_s": round(self.last_latency, 3),
+                "prompt_tokens": self.prompt_tokens,
+                "output_tokens": self.output_tokens,
+            }
+
+
+metrics = LLMMetrics()
+
+
+# =========================
+# Helpers
+# =========================
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Retry-After có thể là số giây hoặc HTTP-date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def extract_text(data: Dict[str, Any]) -> str:
+    try:
+        return data["candidates"][0]["content"]["parts"][0]["text"]
+    except Exception as e:
+        raise RuntimeError(f"Error parsing Gemini response: {e}")
+
+
+# =========================
+# Client
+# =========================
+class GeminiClient:
+    """
+    Client REST Gemini dùng chung cả process:
+      - requests.Session (keep-alive, pool kết nối) cho đường sync
+      - httpx.AsyncClient (tạo lười, 1 client / event loop) cho đường async
+      - retry 429/5xx/lỗi mạng với exponential backoff có jitter, tôn trọng Retry-After
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        *,
+        endpoint: str = DEFAULT_ENDPOINT,
+        timeout: float = 30.0,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        pool_maxsize: int = 16,
+    ):
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json", "x-goog-api-key": api_key})
+
+        self._pool_maxsize = pool_maxsize
+        # httpx.AsyncClient gắn với event loop tạo ra nó → mỗi loop 1 client (loop bị huỷ thì entry tự mất)
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+        self._async_lock = threading.Lock()
+
+    def url(self, model: str, method: str = "generateContent") -> str:
+        if "{method}" in self.endpoint:
+            return self.endpoint.format(model=model, method=method)
+        # Template cũ chỉ có {model} (…:generateContent) → thay method thủ công
+        return self.endpoint.format(model=model).replace(":generateContent", f":{method}")
+
+    def _delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        server_hint = _retry_after_seconds(retry_after)
+        if server_hint is not None:
+            return min(server_hint, self.backoff_max)
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(cap / 2, cap)
+
+    # ---------- Sync ----------
+    def generate(self, model: str, body: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        url = self.url(model)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                resp = self.session.post(url, json=body, timeout=timeout or self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    metrics.record(time.perf_counter() - start, None, attempt, ok=False)
+                    raise RuntimeError(f"Gemini request failed: {e}") from e
+                time.sleep(self._delay(attempt, None))
+                attempt += 1
+                continue
+
+            if resp.status_code in RETRY_STATUS and attempt < self.max_retries:
+                time.sleep(self._delay(attempt, resp.headers.get("Retry-After")))
+                attempt += 1
+                continue
+
+            return self._finish(resp, start, attempt)
+
+    def stream_generate(self, model: str, body: Dict[str, Any], timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        streamGenerateContent (alt=sse): yield từng response chunk ngay khi tới.
+        Chỉ retry trước khi nhận byte đầu tiên (đã stream một phần thì không gửi lại).
+        """
+        url = self.url(model, "streamGenerateContent") + "?alt=sse"
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                resp = self.session.post(url, json=body, timeout=timeout or self.timeout, stream=True)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    metrics.record(time.perf_counter() - start, None, attempt, ok=False)
+                    raise RuntimeError(f"Gemini request failed: {e}") from e
+                time.sleep(self._delay(attempt, None))
+                attempt += 1
+                continue
+
+            if resp.status_code in RETRY_STATUS and attempt < self.max_retries:
+                resp.close()
+                time.sleep(self._delay(attempt, resp.headers.get("Retry-After")))
+                attempt += 1
+                continue
+            break
+
+        if resp.status_code != 200:
+            metrics.record(time.perf_counter() - start, None, attempt, ok=False)
+            raise RuntimeError(f"Gemini API error {resp.status_code}: {resp.text}")
+
+        usage = None
+        try:
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                chunk = json.loads(line[len("data:"):].strip())
+                usage = chunk.get("usageMetadata") or usage
+                yield chunk
+        finally:
+            resp.close()
+            metrics.record(time.perf_counter() - start, usage, attempt, ok=True)
+
+    # ---------- Async ----------
+    def _get_async_client(self):
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                import httpx
+
+                client = httpx.AsyncClient(
+                    headers={"Content-Type": "application/json", "x-goog-api-key": self.api_key},
+                    timeout=self.timeout,
+                    limits=httpx.Limits(max_connections=self._pool_maxsize, max_keepalive_connections=self._pool_maxsize),
+                )
+                self._async_clients[loop] = client
+        return client
+
+    async def agenerate(self, model: str, body: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        import httpx
+
+        client = self._get_async_client()
+        url = self.url(model)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                resp = await client.post(url, json=body, timeout=timeout or self.timeout)
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    metrics.record(time.perf_counter() - start, None, attempt, ok=False)
+                    raise RuntimeError(f"Gemini request failed: {e}") from e
+                await asyncio.sleep(self._delay(attempt, None))
+                attempt += 1
+                continue
+
+            if resp.status_code in RETRY_STATUS and attempt < self.max_retries:
+                await asyncio.sleep(self._delay(attempt, resp.headers.get("Retry-After")))
+                attempt += 1
+                continue
+
+            return self._finish(resp, start, attempt)
+
+    def _finish(self, resp: Any, start: float, attempt: int) -> Dict[str, Any]:
+        """Xử lý response cuối cùng (requests hoặc httpx đều có status_code/text/json())."""
+        latency = time.perf_counter() - start
+        if resp.status_code != 200:
+            metrics.record(latency, None, attempt, ok=False)
+            raise RuntimeError(f"Gemini API error {resp.status_code}: {resp.text}")
+        data = resp.json()
+        usage = data.get("usageMetadata")
+        metrics.record(latency, usage, attempt, ok=True)
+        logger.debug(f"Gemini call {latency:.2f}s, retries={attempt}, usage={usage}")
+        return data
+
+    async def aclose(self) -> None:
+        """Đóng AsyncClient của event loop hiện tại (client của loop khác phải đóng trên loop đó)."""
+        with self._async_lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self) -> None:
+        self.session.close()
+
+
+# Client dùng chung theo (api_key, endpoint, timeout, max_retries)
+_clients: Dict[Tuple[str, str, float, int], GeminiClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_gemini_client(
+    api_key: str,
+    *,
+    endpoint: str = DEFAULT_ENDPOINT,
+    timeout: float = 30.0,
+    max_retries: int = 4,
+) -> GeminiClient:
+    key = (api_key, endpoint, timeout, max_retries)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = GeminiClient(api_key, endpoint=endpoint, timeout=timeout, max_retries=max_retries)
+                _clients[key] = client
+    return client
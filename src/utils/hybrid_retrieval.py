@@ -0,0 +1,370 @@
+from __future__ import annotations
+
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document  # fallback cho version cũ
+
+from src.utils.env import get_env_var
+from src.utils.numpy_store import where_matches
+from src.utils.vector_store import document_id, get_scoped_docs, ingest_scope, retrieval_scopes
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_MODES = ("vector", "hybrid", "hybrid_rerank")
+# Hằng số k của Reciprocal Rank Fusion (giá trị chuẩn trong bài báo RRF)
+RRF_K = 60
+BM25_K1 = 1.5
+BM25_B = 0.75
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+_TOKEN_RE = re.compile(r"\w[\w+#]*")  # giữ "c++", "c#"
+
+
+def retrieval_mode() -> str:
+    """RETRIEVAL_MODE: vector (mặc định) | hybrid | hybrid_rerank."""
+    mode = (get_env_var("RETRIEVAL_MODE", "vector") or "vector").strip().lower().replace("-", "_")
+    return mode if mode in RETRIEVAL_MODES else "vector"
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+# =========================
+# BM25 index (inverted index trong bộ nhớ)
+# =========================
+class BM25Index:
+    """
+    Inverted index BM25 (Okapi) song song với vector store, khoá theo document_id của chunk
+    (cùng khoá với kết quả vector trong hybrid_search, bất kể id thật trong store):
+      - thêm/xoá từng chunk → cập nhật tăng dần, không build lại toàn bộ
+      - giữ text + metadata để lọc theo `where` kiểu Chroma và trả Document
+    Dựng lại từ vector store khi process khởi động (vector store là nguồn dữ liệu gốc).
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._texts: Dict[str, str] = {}
+        self._metadatas: Dict[str, Dict[str, Any]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._lengths
+
+    # ---------- Write ----------
+    def _remove_one(self, doc_id: str) -> None:
+        text = self._texts.pop(doc_id, None)
+        if text is None:
+            return
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+        self._metadatas.pop(doc_id, None)
+
+    def add(
+        self,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        metadatas: Optional[Sequence[Optional[Dict[str, Any]]]] = None,
+    ) -> int:
+        """Thêm (hoặc ghi đè cùng id) các chunk; trả về số chunk mới."""
+        metadatas = metadatas or [None] * len(ids)
+        added = 0
+        with self._lock:
+            for doc_id, text, meta in zip(ids, texts, metadatas):
+                if doc_id in self._lengths:
+                    if self._texts[doc_id] == text:
+                        self._metadatas[doc_id] = dict(meta or {})
+                        continue
+                    self._remove_one(doc_id)
+                else:
+                    added += 1
+                tokens = tokenize(text)
+                for term, tf in Counter(tokens).items():
+                    self._postings.setdefault(term, {})[doc_id] = tf
+                self._lengths[doc_id] = len(tokens)
+                self._texts[doc_id] = text
+                self._metadatas[doc_id] = dict(meta or {})
+                self._total_length += len(tokens)
+        return added
+
+    def add_documents(self, documents: Iterable[Document], ids: Optional[Sequence[str]] = None) -> int:
+        documents = list(documents)
+        ids = list(ids) if ids else [document_id(d) for d in documents]
+        return self.add(ids, [d.page_content for d in documents], [d.metadata for d in documents])
+
+    def remove(self, ids: Iterable[str]) -> int:
+        removed = 0
+        with self._lock:
+            for doc_id in ids:
+                if doc_id in self._lengths:
+                    self._remove_one(doc_id)
+                    removed += 1
+        return removed
+
+    def sync_target(
+        self, documents: List[Document], target_normalized: str, level: Optional[str] = None
+    ) -> Dict[str, int]:
+        """Giống sync_target_documents: thêm chunk mới, xoá chunk cũ của đúng (target, level) đó."""
+        ids = [document_id(d) for d in documents]
+        scope = ingest_scope(target_normalized, level)
+        with self._lock:
+            added = self.add_documents(documents, ids)
+            keep = set(ids)
+            stale = [
+                doc_id for doc_id, meta in self._metadatas.items()
+                if target_normalized and doc_id not in keep and where_matches(meta, scope)
+            ]
+            removed = self.remove(stale)
+        return {"added": added, "deleted": removed}
+
+    @classmethod
+    def from_vector_store(cls, vector_store: Any, batch_size: int = 5000) -> "BM25Index":
+        """
+        Dựng index từ toàn bộ chunk đang có trong vector store (Chroma hoặc NumpyVectorStore).
+        Khoá theo document_id(nội dung + metadata), không theo id của store: chunk cũ có id UUID
+        (from_texts / add_texts không truyền ids) vẫn khớp khoá với kết quả vector trong hybrid_search.
+        """
+        index = cls()
+        data = vector_store.get(include=["documents", "metadatas"]) or {}
+        texts = data.get("documents") or []
+        metadatas = data.get("metadatas") or [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            index.add_documents(
+                Document(page_content=text or "", metadata=dict(meta or {}))
+                for text, meta in zip(texts[start:start + batch_size], metadatas[start:start + batch_size])
+            )
+        return index
+
+    # ---------- Read ----------
+    def search(self, query: str, k: int = 10, where: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Top-k (id, điểm BM25) trong các chunk khớp `where`."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            n_docs = len(self._lengths)
+            if not terms or not n_docs or k <= 0:
+                return []
+            avgdl = self._total_length / n_docs or 1.0
+            allowed: Dict[str, bool] = {}
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1.0 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    ok = allowed.get(doc_id)
+                    if ok is None:
+                        ok = allowed[doc_id] = where_matches(self._metadatas.get(doc_id) or {}, where)
+                    if not ok:
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avgdl)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)[:k]
+
+    def document(self, doc_id: str) -> Optional[Document]:
+        text = self._texts.get(doc_id)
+        if text is None:
+            return None
+        return Document(page_content=text, metadata=dict(self._metadatas.get(doc_id) or {}))
+
+
+# Index theo vector store đang dùng (1 store / process nên thực tế chỉ 1 index)
+_indexes: Dict[int, BM25Index] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_bm25_index(vector_store: Any) -> BM25Index:
+    """Index BM25 của `vector_store`, dựng lười ở lần dùng đầu tiên."""
+    key = id(vector_store)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = BM25Index.from_vector_store(vector_store)
+                _indexes[key] = index
+                logger.info(f"✅ BM25 index built: {len(index)} chunks")
+    return index
+
+
+def update_bm25_index(
+    vector_store: Any, documents: List[Document], target_normalized: str, level: Optional[str] = None
+) -> None:
+    """Gọi sau khi ingest; index chưa dựng thì bỏ qua (lần dùng đầu sẽ đọc từ vector store)."""
+    index = _indexes.get(id(vector_store))
+    if index is not None:
+        index.sync_target(documents, target_normalized, level)
+
+
+def add_to_bm25_index(vector_store: Any, documents: List[Document]) -> None:
+    """Thêm chunk (không xoá chunk cũ) — dùng cho ingest theo lô nhiều nguồn."""
+    index = _indexes.get(id(vector_store))
+    if index is not None:
+        index.add_documents(documents)
+
+
+# =========================
+# Fusion + rerank
+# =========================
+def rrf_fuse(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Reciprocal Rank Fusion: score(d) = Σ 1 / (k + rank_i(d)), rank bắt đầu từ 1."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+_reranker: Any = None
+_reranker_failed = False
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Any:
+    """Cross-encoder nhỏ chạy CPU (RERANK_MODEL), nạp lười; lỗi nạp → None (bỏ bước rerank)."""
+    global _reranker, _reranker_failed
+    if _reranker is None and not _reranker_failed:
+        with _reranker_lock:
+            if _reranker is None and not _reranker_failed:
+                model_name = get_env_var("RERANK_MODEL", DEFAULT_RERANK_MODEL)
+                try:
+                    from sentence_transformers import CrossEncoder
+
+                    _reranker = CrossEncoder(model_name, device="cpu", max_length=512)
+                    logger.info(f"✅ Reranker loaded: {model_name}")
+                except Exception as e:
+                    _reranker_failed = True
+                    logger.warning(f"⚠️ Reranker '{model_name}' unavailable, skipping rerank: {e}")
+    return _reranker
+
+
+def rerank(query: str, documents: List[Document]) -> List[Document]:
+    """Sắp xếp lại theo điểm cross-encoder (query, chunk); không có model → giữ nguyên thứ tự."""
+    model = get_reranker()
+    if model is None or len(documents) < 2:
+        return documents
+    scores = model.predict([(query, d.page_content) for d in documents], show_progress_bar=False)
+    order = sorted(range(len(documents)), key=lambda i: float(scores[i]), reverse=True)
+    return [documents[i] for i in order]
+
+
+# =========================
+# Entry point
+# =========================
+def _bm25_scoped(
+    index: BM25Index,
+    query: str,
+    k: int,
+    target: Optional[str],
+    level: Optional[str],
+    category: Optional[str],
+) -> List[str]:
+    """Cùng thứ tự nới phạm vi với get_scoped_docs: phạm vi hẹp trước, bổ sung từ phạm vi rộng."""
+    ranked: List[str] = []
+    for where in retrieval_scopes(target, level, category):
+        for doc_id, _ in index.search(query, k=k, where=where):
+            if doc_id not in ranked:
+                ranked.append(doc_id)
+        if len(ranked) >= k:
+            break
+    return ranked[:k]
+
+
+def hybrid_search(
+    query: str,
+    vector_store: Any,
+    k: int = 5,
+    with_score: bool = False,
+    target: Optional[str] = None,
+    level: Optional[str] = None,
+    category: Optional[str] = None,
+    use_rerank: bool = False,
+):
+    """
+    Vector (get_scoped_docs) + BM25 trên cùng phạm vi target/level → RRF → (tuỳ chọn) rerank
+    top RERANK_TOP_N bằng cross-encoder → top-k.
+    with_score: score = thứ hạng sau fusion (0 = tốt nhất), cùng chiều "nhỏ hơn là tốt hơn"
+    với distance của Chroma để build_context sắp xếp đúng.
+    """
+    candidates = max(k, int(get_env_var("HYBRID_CANDIDATES", "20")))
+
+    docs: Dict[str, Document] = {}
+    vector_ids: List[str] = []
+    for doc, _ in get_scoped_docs(
+        query, vector_store, k=candidates, with_score=True, target=target, level=level, category=category
+    ):
+        doc_id = document_id(doc)  # cùng khoá với BM25Index (không phụ thuộc id trong store)
+        if doc_id not in docs:
+            docs[doc_id] = doc
+            vector_ids.append(doc_id)
+
+    try:
+        index = get_bm25_index(vector_store)
+        keyword_ids = _bm25_scoped(index, query, candidates, target, level, category)
+    except Exception as e:
+        logger.warning(f"⚠️ BM25 search failed, using vector results only: {e}")
+        index, keyword_ids = None, []
+    for doc_id in keyword_ids:
+        if doc_id not in docs:
+            doc = index.document(doc_id)
+            if doc is not None:
+                docs[doc_id] = doc
+
+    ranked = [docs[doc_id] for doc_id, _ in rrf_fuse([vector_ids, keyword_ids]) if doc_id in docs]
+    if use_rerank:
+        top_n = max(k, int(get_env_var("RERANK_TOP_N", "20")))
+        try:
+            ranked = rerank(query, ranked[:top_n]) + ranked[top_n:]
+        except Exception as e:
+            logger.warning(f"⚠️ Rerank failed, keeping fused order: {e}")
+
+    ranked = ranked[:k]
+    return [(doc, float(rank)) for rank, doc in enumerate(ranked)] if with_score else ranked
+
+
+def retrieve(
+    query: str,
+    vector_store: Any,
+    k: int = 5,
+    with_score: bool = False,
+    target: Optional[str] = None,
+    level: Optional[str] = None,
+    category: Optional[str] = None,
+    mode: Optional[str] = None,
+):
+    """Retrieval theo RETRIEVAL_MODE (hoặc `mode`): vector → get_scoped_docs, hybrid(_rerank) → hybrid_search."""
+    mode = mode or retrieval_mode()
+    if mode == "vector":
+        return get_scoped_docs(
+            query, vector_store, k=k, with_score=with_score, target=target, level=level, category=category
+        )
+    return hybrid_search(
+        query,
+        vector_store,
+        k=k,
+        with_score=with_score,
+        target=target,
+        level=level,
+        category=category,
+        use_rerank=mode == "hybrid_rerank",
+    )
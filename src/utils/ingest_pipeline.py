@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from src.utils.hybrid_retrieval import add_to_bm25_index
+from src.utils.load_documents import get_loader, get_text_splitter, is_url
+from src.utils.roadmap_cache import normalize_target
+from src.utils.vector_store import document_id, upsert_documents
+from src.utils.env import get_env_var
+
+logger = logging.getLogger(__name__)
+
+# File cục bộ được nhận khi nguồn là thư mục
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+
+# Chunk trả từ worker dạng (page_content, metadata) để pickle qua process pool gọn nhẹ
+RawChunk = Tuple[str, Dict[str, Any]]
+
+
+# =========================
+# Nguồn + worker
+# =========================
+def expand_sources(sources: Iterable[str]) -> List[str]:
+    """URL giữ nguyên; thư mục → mọi file SUPPORTED_EXTENSIONS bên trong (đệ quy, sắp xếp); bỏ trùng."""
+    expanded: List[str] = []
+    for source in sources:
+        source = (source or "").strip()
+        if not source:
+            continue
+        if not is_url(source) and os.path.isdir(source):
+            for root, _, files in os.walk(source):
+                expanded.extend(
+                    os.path.join(root, name) for name in sorted(files) if name.lower().endswith(SUPPORTED_EXTENSIONS)
+                )
+        else:
+            expanded.append(source)
+    return list(dict.fromkeys(expanded))
+
+
+def _is_pdf(source: str) -> bool:
+    return not is_url(source) and source.lower().endswith(".pdf")
+
+
+def load_chunks(source: str) -> List[RawChunk]:
+    """
+    Load + chunk 1 nguồn (chạy trong thread pool hoặc process pool). Lỗi được raise để
+    pipeline ghi nhận theo từng nguồn (khác load_document: nuốt lỗi, trả list rỗng).
+    """
+    chunks = get_text_splitter().split_documents(get_loader(source).load())
+    return [(doc.page_content, dict(doc.metadata or {})) for doc in chunks]
+
+
+# =========================
+# Manifest (resume)
+# =========================
+class IngestManifest:
+    """
+    Trạng thái từng nguồn trong file JSON: {source: {status, fingerprint, chunks, added, error, updated_at}}.
+    Nguồn "done" có fingerprint không đổi (file: size + mtime; URL: chính URL) được bỏ qua ở lần chạy sau.
+    Ghi atomic (file tạm + os.replace) sau mỗi lần cập nhật → dừng giữa chừng vẫn resume được.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.sources = (json.load(f) or {}).get("sources", {})
+            except Exception as e:
+                logger.warning(f"⚠️ Cannot read ingest manifest '{path}', starting fresh: {e}")
+
+    @staticmethod
+    def fingerprint(source: str) -> str:
+        if is_url(source):
+            return source
+        try:
+            stat = os.stat(source)
+            return f"{stat.st_size}:{stat.st_mtime_ns}"
+        except OSError:
+            return ""
+
+    def is_done(self, source: str) -> bool:
+        entry = self.sources.get(source) or {}
+        return entry.get("status") == "done" and entry.get("fingerprint") == self.fingerprint(source)
+
+    def mark(self, source: str, status: str, **fields: Any) -> None:
+        with self._lock:
+            self.sources[source] = {
+                "status": status,
+                "fingerprint": self.fingerprint(source),
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                **fields,
+            }
+            self._save()
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"sources": self.sources}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+
+# =========================
+# Pipeline
+# =========================
+class _SourceState:
+    def __init__(self) -> None:
+        self.loaded = False
+        self.chunks = 0
+        self.pending = 0  # chunk đã load nhưng chưa ghi vào vector store
+        self.added = 0
+
+
+def _make_pdf_pool(workers: int) -> Executor:
+    try:
+        return ProcessPoolExecutor(max_workers=workers)
+    except Exception as e:  # môi trường không cho fork/spawn
+        logger.warning(f"⚠️ Process pool unavailable, parsing PDFs in threads: {e}")
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-pdf")
+
+
+def ingest_sources(
+    sources: Iterable[str],
+    vector_store: Any = None,
+    *,
+    target: str = "",
+    manifest_path: Optional[str] = None,
+    url_workers: Optional[int] = None,
+    pdf_workers: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    force: bool = False,
+) -> Dict[str, Any]:
+    """
+    Ingest nhiều nguồn (file, thư mục, web page, YouTube) vào vector store:
+      - URL + file text: thread pool (INGEST_URL_WORKERS, mặc định 8) — chủ yếu chờ I/O
+      - PDF: process pool (INGEST_PDF_WORKERS, mặc định số CPU) — parse tốn CPU
+      - chunk (splitter dùng chung) được gom theo lô INGEST_BATCH_SIZE rồi upsert_documents
+        (embed + ghi) ngay khi đủ lô, trong lúc các nguồn khác vẫn đang tải
+      - lỗi của 1 nguồn không dừng pipeline; kết quả từng nguồn ghi vào report + manifest
+    `vector_store` None → vector store dùng chung của registry (tạo mới từ lô đầu nếu chưa có).
+    `target`: gắn metadata target/target_normalized để retrieval lọc theo target.
+    """
+    url_workers = url_workers or int(get_env_var("INGEST_URL_WORKERS", "8"))
+    pdf_workers = pdf_workers or int(get_env_var("INGEST_PDF_WORKERS", str(os.cpu_count() or 2)))
+    batch_size = batch_size or int(get_env_var("INGEST_BATCH_SIZE", "256"))
+
+    started = time.perf_counter()
+    manifest = IngestManifest(manifest_path)
+    report: Dict[str, Dict[str, Any]] = {}
+    todo: List[str] = []
+    for source in expand_sources(sources):
+        if not force and manifest.is_done(source):
+            report[source] = {"status": "skipped"}
+        else:
+            todo.append(source)
+
+    states: Dict[str, _SourceState] = {source: _SourceState() for source in todo}
+    failed: Dict[str, str] = {}
+    buffer: List[Tuple[str, Document]] = []
+
+    def fail(source: str, error: str) -> None:
+        if source in failed or source in report:
+            return
+        failed[source] = error
+        report[source] = {"status": "failed", "error": error}
+        manifest.mark(source, "failed", error=error)
+        logger.error(f"❌ Ingest failed for '{source}': {error}")
+
+    def finish_if_complete(source: str) -> None:
+        state = states[source]
+        if source in failed or source in report or not state.loaded or state.pending:
+            return
+        status = "done" if state.chunks else "empty"
+        report[source] = {"status": status, "chunks": state.chunks, "added": state.added}
+        manifest.mark(source, status, chunks=state.chunks, added=state.added)
+
+    def flush() -> None:
+        nonlocal vector_store
+        batch = [(source, doc) for source, doc in buffer if source not in failed]
+        buffer.clear()
+        if not batch:
+            return
+        docs = [doc for _, doc in batch]
+        try:
+            created = False
+            if vector_store is None:
+                from src.utils.model_registry import get_registry  # import lười (embedding/LLM)
+
+                registry = get_registry()
+                created = not registry.has_vector_store()
+                vector_store = registry.get_vector_store(docs)
+            if created:
+                # Store vừa được tạo từ chính lô này → mọi chunk (không trùng) đều là chunk mới
+                stats = {"added_ids": list(dict.fromkeys(document_id(d) for d in docs))}
+            else:
+                stats = upsert_documents(vector_store, docs, batch_size=batch_size)
+            add_to_bm25_index(vector_store, docs)
+        except Exception as e:
+            for source in dict.fromkeys(source for source, _ in batch):
+                fail(source, f"store: {e}")
+            return
+        added_ids = set(stats["added_ids"])
+        for source, doc in batch:
+            state = states[source]
+            state.pending -= 1
+            if document_id(doc) in added_ids:
+                added_ids.discard(document_id(doc))  # chunk trùng giữa 2 nguồn chỉ tính cho nguồn đầu
+                state.added += 1
+        for source in dict.fromkeys(source for source, _ in batch):
+            finish_if_complete(source)
+
+    thread_pool = ThreadPoolExecutor(max_workers=max(1, url_workers), thread_name_prefix="ingest-io")
+    pdf_pool = _make_pdf_pool(max(1, pdf_workers)) if any(_is_pdf(s) for s in todo) else None
+    # Giới hạn số nguồn đang xử lý → kết quả chưa kịp embed không dồn hết vào RAM
+    max_inflight = 2 * (url_workers + (pdf_workers if pdf_pool else 0))
+    queue = list(reversed(todo))
+    inflight: Dict[Future, str] = {}
+
+    def submit_more() -> None:
+        while queue and len(inflight) < max_inflight:
+            source = queue.pop()
+            pool = pdf_pool if pdf_pool is not None and _is_pdf(source) else thread_pool
+            inflight[pool.submit(load_chunks, source)] = source
+
+    try:
+        submit_more()
+        while inflight:
+            done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+            for future in done:
+                source = inflight.pop(future)
+                state = states[source]
+                try:
+                    chunks = future.result()
+                except Exception as e:
+                    fail(source, str(e) or e.__class__.__name__)
+                    continue
+                for text, meta in chunks:
+                    meta.setdefault("source", source)
+                    if target:
+                        meta.update({"target": target, "target_normalized": normalize_target(target)})
+                    buffer.append((source, Document(page_content=text, metadata=meta)))
+                state.loaded = True
+                state.chunks = state.pending = len(chunks)
+                finish_if_complete(source)  # nguồn rỗng
+                if len(buffer) >= batch_size:
+                    flush()
+            submit_more()
+        flush()
+    finally:
+        thread_pool.shutdown(wait=True)
+        if pdf_pool is not None:
+            pdf_pool.shutdown(wait=True)
+
+    totals = {"sources": len(report), "chunks": 0, "added": 0}
+    for entry in report.values():
+        totals[entry["status"]] = totals.get(entry["status"], 0) + 1
+        totals["chunks"] += entry.get("chunks", 0) or 0
+        totals["added"] += entry.get("added", 0) or 0
+    logger.info(f"✅ Ingest finished: {totals}")
+    return {"sources": report, "totals": totals, "elapsed_s": round(time.perf_counter() - started, 3)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk ingest files / folders / URLs into the vector store")
+    parser.add_argument("sources", nargs="*", help="File, thư mục, URL web hoặc YouTube")
+    parser.add_argument("--from-file", help="File chứa danh sách nguồn, 1 dòng / nguồn")
+    parser.add_argument("--target", default="", help="Gắn metadata target cho mọi chunk")
+    parser.add_argument("--manifest", default=get_env_var("INGEST_MANIFEST_PATH", "./ingest_manifest.json"))
+    parser.add_argument("--url-workers", type=int, default=None)
+    parser.add_argument("--pdf-workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="Ingest lại cả nguồn đã xong trong manifest")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sources = list(args.sources)
+    if args.from_file:
+        with open(args.from_file, "r", encoding="utf-8") as f:
+            sources.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+
+    result = ingest_sources(
+        sources,
+        target=args.target,
+        manifest_path=args.manifest,
+        url_workers=args.url_workers,
+        pdf_workers=args.pdf_workers,
+        batch_size=args.batch_size,
+        force=args.force,
+    )
+    print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -1,16 +1,19 @@
 from __future__ import annotations
 
 import logging
-import os
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Iterator
 
-import requests
 from pydantic import Field
 
 # LangChain base
 from langchain.llms.base import LLM
+from langchain.callbacks.base import BaseCallbackHandler
 from langchain.callbacks.manager import CallbackManager
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+from langchain_core.outputs import GenerationChunk
+
+from src.utils.gemini_client import DEFAULT_ENDPOINT, GeminiClient, extract_text, get_gemini_client
+from src.utils.env import env_flag, get_env_var
 
 # Providers (import optional)
 from langchain_community.llms import LlamaCpp
@@ -37,25 +40,85 @@ logger = logging.getLogger(__name__)
 # ---------------------------
 # Helpers
 # ---------------------------
-def get_env_var(key: str, default: Optional[str] = None) -> Optional[str]:
-    """
-    Lấy biến môi trường theo thứ tự ưu tiên:
-    1) os.environ (Render/Railway/Heroku set ở đây)
-    2) .env (nếu có `python-dotenv` và file tồn tại)
-    3) default
-    """
-    if key in os.environ:
-        return os.environ.get(key)
+def _apply_stop(text: str, stop: Optional[List[str]]) -> str:
+    # Xử lý stop tokens (LangChain bảo đảm truyền stop khi cần)
+    if stop:
+        for token in stop:
+            if token and token in text:
+                text = text.split(token)[0]
+                break
+    return text
 
-    try:
-        from dotenv import dotenv_values  # import lười, không bắt buộc cài
-        values = dotenv_values(".env")
-        if key in values and values[key]:
-            return values[key]
-    except Exception:
-        pass
 
-    return default
+# ---------------------------
+# Gemini (REST)
+# ---------------------------
+class GeminiLLM(LLM):
+    """LLM wrapper tối giản gọi REST Gemini (Generative Language API) qua client dùng chung."""
+    api_key: str = Field(..., description="Google API key")
+    model: str = Field(
+        default_factory=lambda: get_env_var("GEMINI_MODEL", "gemini-2.0-flash"),
+        description="Gemini model name"
+    )
+    endpoint: str = Field(
+        default=DEFAULT_ENDPOINT,
+        description="Gemini endpoint template ({model}, {method})",
+    )
+    request_timeout: float = Field(default=30.0)
+    max_retries: int = Field(default=4)
+    # True → luôn dùng streamGenerateContent; False → chỉ stream khi có callback nhận token (SSE)
+    streaming: bool = Field(default=False)
+
+    def _client(self) -> GeminiClient:
+        # Session/AsyncClient dùng chung giữa mọi instance → tái sử dụng kết nối TCP+TLS
+        return get_gemini_client(
+            self.api_key, endpoint=self.endpoint, timeout=self.request_timeout, max_retries=self.max_retries
+        )
+
+    @staticmethod
+    def _body(prompt: str, response_schema: Optional[dict] = None) -> dict:
+        body: dict = {"contents": [{"parts": [{"text": prompt}]}]}
+        if response_schema:
+            # Constrained output: Gemini chỉ sinh JSON khớp schema
+            body["generationConfig"] = {"responseMimeType": "application/json", "responseSchema": response_schema}
+        return body
+
+    @staticmethod
+    def _wants_tokens(run_manager: Any) -> bool:
+        """Có callback thực sự xử lý on_llm_new_token (vd: QueueCallbackHandler của /query/stream)."""
+        handlers = getattr(run_manager, "handlers", None) or []
+        return any(type(h).on_llm_new_token is not BaseCallbackHandler.on_llm_new_token for h in handlers)
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        if self.streaming or self._wants_tokens(run_manager):
+            text = "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+            return _apply_stop(text, stop)
+        data = self._client().generate(self.model, self._body(prompt, kwargs.get("response_schema")))
+        return _apply_stop(extract_text(data), stop)
+
+    def _stream(
+        self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> Iterator[GenerationChunk]:
+        body = self._body(prompt, kwargs.get("response_schema"))
+        for data in self._client().stream_generate(self.model, body):
+            try:
+                text = extract_text(data)
+            except RuntimeError:
+                continue  # chunk cuối có thể chỉ chứa usageMetadata / finishReason
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+    async def _acall(
+        self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> str:
+        data = await self._client().agenerate(self.model, self._body(prompt, kwargs.get("response_schema")))
+        return _apply_stop(extract_text(data), stop)
+
+    @property
+    def _llm_type(self) -> str:
+        return "gemini-rest"
 
 
 # ---------------------------
@@ -84,14 +147,19 @@ def initialize_llm(
         if llm_type == "local":
             if not model_path:
                 raise ValueError("LLM_MODEL_PATH must be set for local LLMs (model_path).")
-            callback_manager = CallbackManager([StreamingStdOutCallbackHandler()])
+            # Token được stream qua callback của từng request (vd: SSE /query/stream);
+            # chỉ in ra stdout khi bật LLM_STREAM_STDOUT
+            handlers = []
+            if env_flag("LLM_STREAM_STDOUT", False):
+                handlers.append(StreamingStdOutCallbackHandler())
             return LlamaCpp(
                 model_path=model_path,
                 n_ctx=n_ctx,
                 n_gpu_layers=n_gpu_layers,
                 n_threads=n_threads,
                 verbose=False,
-                callback_manager=callback_manager,
+                streaming=True,
+                callback_manager=CallbackManager(handlers),
             )
 
         elif llm_type == "groq":
@@ -133,49 +201,12 @@ def initialize_llm(
             if not gemini_key:
                 raise ValueError("GEMINI_API_KEY must be set for Gemini.")
 
-            class GeminiLLM(LLM):
-                """LLM wrapper tối giản gọi REST Gemini (Generative Language API)."""
-                api_key: str = Field(..., description="Google API key")
-                model: str = Field(
-                    default_factory=lambda: get_env_var("GEMINI_MODEL", "gemini-2.0-flash"),
-                    description="Gemini model name"
-                )
-                endpoint: str = Field(
-                    default="https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent",
-                    description="Gemini endpoint template",
-                )
-                request_timeout: float = Field(default=30.0)
-
-                def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
-                    url = self.endpoint.format(model=self.model)
-                    headers = {
-                        "Content-Type": "application/json",
-                        "x-goog-api-key": self.api_key
-                    }
-                    body = {"contents": [{"parts": [{"text": prompt}]}]}
-                    resp = requests.post(url, headers=headers, json=body, timeout=self.request_timeout)
-                    if resp.status_code != 200:
-                        raise RuntimeError(f"Gemini API error {resp.status_code}: {resp.text}")
-
-                    try:
-                        data = resp.json()
-                        text = data["candidates"][0]["content"]["parts"][0]["text"]
-                    except Exception as e:
-                        raise RuntimeError(f"Error parsing Gemini response: {e}")
-
-                    # Xử lý stop tokens (LangChain bảo đảm truyền stop khi cần)
-                    if stop:
-                        for token in stop:
-                            if token and token in text:
-                                text = text.split(token)[0]
-                                break
-                    return text
-
-                @property
-                def _llm_type(self) -> str:
-                    return "gemini-rest"
-
-            return GeminiLLM(api_key=gemini_key)
+            return GeminiLLM(
+                api_key=gemini_key,
+                request_timeout=float(get_env_var("GEMINI_TIMEOUT", "30")),
+                max_retries=int(get_env_var("GEMINI_MAX_RETRIES", "4")),
+                streaming=env_flag("GEMINI_STREAMING", False),
+            )
 
         else:
             raise ValueError(f"Unsupported LLM type: {llm_type}")
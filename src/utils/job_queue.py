@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from src.utils.executors import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Trạng thái job
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def serialize_job(doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Chuyển job document sang dict JSON-friendly (datetime → ISO string)."""
+    if doc is None:
+        return None
+    out: Dict[str, Any] = {}
+    for key, value in doc.items():
+        if key == "_id":
+            out["id"] = str(value)
+        elif isinstance(value, datetime):
+            out[key] = value.isoformat()
+        else:
+            out[key] = value
+    return out
+
+
+# =========================
+# Persistent queue (Mongo collection)
+# =========================
+class JobQueue:
+    """
+    Hàng đợi job bền vững trên 1 collection Mongo (sống qua restart).
+
+    Vòng đời: queued → running → done | failed; lỗi được retry với exponential backoff
+    (có jitter) tới `max_attempts`. Job `running` quá `lease_seconds` (worker chết)
+    được đưa lại về `queued` bởi requeue_stale().
+    """
+
+    def __init__(
+        self,
+        collection: Any,
+        *,
+        max_attempts: int = 3,
+        backoff_base: float = 5.0,
+        backoff_max: float = 300.0,
+        lease_seconds: float = 600.0,
+        retention_days: Optional[float] = 7.0,
+    ):
+        self.collection = collection
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease_seconds = lease_seconds
+        self.retention_days = retention_days
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        *,
+        priority: int = 0,
+        dedupe_key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Thêm job mới. Nếu `dedupe_key` trùng 1 job đang queued/running thì trả về job đó
+        thay vì tạo thêm.
+        """
+        if dedupe_key:
+            active = self.collection.find_one(
+                {"dedupe_key": dedupe_key, "status": {"$in": [JOB_QUEUED, JOB_RUNNING]}}
+            )
+            if active:
+                return active
+
+        now = _now()
+        doc = {
+            "_id": uuid.uuid4().hex,
+            "kind": kind,
+            "payload": payload,
+            "status": JOB_QUEUED,
+            "priority": priority,
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "dedupe_key": dedupe_key,
+            "created_at": now,
+            "updated_at": now,
+            "run_after": now,
+            "started_at": None,
+            "finished_at": None,
+            "last_error": None,
+            "result": None,
+        }
+        self.collection.insert_one(doc)
+        return doc
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.collection.find_one({"_id": job_id})
+
+    def list(self, status: Optional[str] = None, kind: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {}
+        if status:
+            query["status"] = status
+        if kind:
+            query["kind"] = kind
+        return list(self.collection.find(query, sort=[("created_at", -1)], limit=limit))
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy nguyên tử 1 job sẵn sàng (ưu tiên priority cao, rồi job cũ nhất)."""
+        from pymongo import ReturnDocument
+
+        now = _now()
+        return self.collection.find_one_and_update(
+            {"status": JOB_QUEUED, "run_after": {"$lte": now}},
+            {
+                "$set": {
+                    "status": JOB_RUNNING,
+                    "worker": worker_id,
+                    "started_at": now,
+                    "updated_at": now,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", -1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _expires_at(self, now: datetime) -> Optional[datetime]:
+        """Job đã xong/failed được TTL index dọn sau `retention_days`."""
+        if not self.retention_days or self.retention_days <= 0:
+            return None
+        return now + timedelta(days=self.retention_days)
+
+    def complete(self, job_id: str, result: Any = None) -> None:
+        now = _now()
+        self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {
+                "status": JOB_DONE,
+                "result": result,
+                "finished_at": now,
+                "updated_at": now,
+                "last_error": None,
+                "expires_at": self._expires_at(now),
+            }},
+        )
+
+    def fail(self, job: Dict[str, Any], error: str) -> None:
+        """Ghi lỗi; còn lượt thì đưa lại về queued sau backoff, hết lượt thì failed."""
+        now = _now()
+        attempts = int(job.get("attempts") or 0)
+        max_attempts = int(job.get("max_attempts") or self.max_attempts)
+
+        if attempts < max_attempts:
+            delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+            delay *= random.uniform(0.5, 1.0)  # jitter tránh retry dồn cục
+            update = {"status": JOB_QUEUED, "run_after": now + timedelta(seconds=delay)}
+        else:
+            update = {"status": JOB_FAILED, "finished_at": now, "expires_at": self._expires_at(now)}
+
+        update.update({"last_error": error, "updated_at": now})
+        self.collection.update_one({"_id": job["_id"]}, {"$set": update})
+
+    def release(self, job_id: str) -> None:
+        """Trả job đang chạy về `queued` (vd: app tắt giữa chừng), không tính là 1 lần thử."""
+        now = _now()
+        self.collection.update_one(
+            {"_id": job_id, "status": JOB_RUNNING},
+            {"$set": {"status": JOB_QUEUED, "run_after": now, "updated_at": now}, "$inc": {"attempts": -1}},
+        )
+
+    def renew(self, job_id: str) -> None:
+        """Gia hạn lease của job đang chạy (worker còn sống) để requeue_stale không lấy lại giữa chừng."""
+        now = _now()
+        self.collection.update_one(
+            {"_id": job_id, "status": JOB_RUNNING},
+            {"$set": {"lease_until": now + timedelta(seconds=self.lease_seconds), "updated_at": now}},
+        )
+
+    def requeue_stale(self) -> int:
+        """Đưa các job `running` đã quá lease (worker chết / app restart) về lại `queued`."""
+        now = _now()
+        result = self.collection.update_many(
+            {"status": JOB_RUNNING, "lease_until": {"$lt": now}},
+            {"$set": {"status": JOB_QUEUED, "run_after": now, "updated_at": now}},
+        )
+        return result.modified_count
+
+
+# =========================
+# Worker pool (asyncio tasks)
+# =========================
+class JobWorkerPool:
+    """
+    N worker asyncio cùng tiêu thụ JobQueue; `concurrency` là giới hạn trên số job chạy đồng thời
+    (với crawl job thì cũng là giới hạn số browser dùng cùng lúc).
+    Job đang chạy được gia hạn lease định kỳ; job `running` quá lease (worker chết khi app vẫn chạy)
+    được requeue mỗi `requeue_interval` giây từ vòng lặp worker.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, JobHandler],
+        *,
+        concurrency: int = 2,
+        poll_interval: float = 1.0,
+        requeue_interval: float = 60.0,
+        release_timeout: float = 5.0,
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.requeue_interval = requeue_interval
+        self.release_timeout = release_timeout
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._stopping = False
+        self._next_requeue = 0.0
+
+    async def _requeue_stale(self) -> None:
+        """Chạy requeue_stale tối đa 1 lần / requeue_interval cho cả pool (worker nào tới lượt thì chạy)."""
+        loop = asyncio.get_running_loop()
+        if loop.time() < self._next_requeue:
+            return
+        self._next_requeue = loop.time() + self.requeue_interval  # đặt trước khi await → worker khác bỏ qua
+        try:
+            requeued = await run_blocking("db", self.queue.requeue_stale)
+        except Exception as e:
+            logger.error(f"❌ Stale job requeue failed: {e}")
+            return
+        if requeued:
+            logger.info(f"🔁 Re-queued {requeued} stale job(s)")
+
+    async def _keep_lease(self, job_id: str) -> None:
+        interval = max(1.0, self.queue.lease_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await run_blocking("db", self.queue.renew, job_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Lease renewal failed for job {job_id}: {e}")
+
+    async def start(self) -> None:
+        self._next_requeue = 0.0
+        await self._requeue_stale()
+        self._stopping = False
+        for i in range(self.concurrency):
+            worker_id = f"worker-{i}-{uuid.uuid4().hex[:6]}"
+            self._tasks.append(asyncio.create_task(self._run(worker_id)))
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, worker_id: str) -> None:
+        while not self._stopping:
+            await self._requeue_stale()
+            try:
+                job = await run_blocking("db", self.queue.claim, worker_id)
+            except Exception as e:
+                logger.error(f"❌ Job claim failed: {e}")
+                job = None
+
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            await self._execute(job)
+
+    async def _execute(self, job: Dict[str, Any]) -> None:
+        handler = self.handlers.get(job.get("kind"))
+        lease = asyncio.create_task(self._keep_lease(job["_id"]))
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for job kind '{job.get('kind')}'")
+            result = await handler(job.get("payload") or {})
+            await run_blocking("db", self.queue.complete, job["_id"], result)
+            logger.info(f"✅ Job {job['_id']} ({job.get('kind')}) done")
+        except asyncio.CancelledError:
+            # App tắt giữa chừng: trả job về hàng đợi để lần khởi động sau chạy lại.
+            # Không chờ quá release_timeout; không release được thì requeue_stale lấy lại khi hết lease.
+            try:
+                await asyncio.wait_for(run_blocking("db", self.queue.release, job["_id"]), self.release_timeout)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not release job {job['_id']} on shutdown: {e!r}")
+            raise
+        except Exception as e:
+            logger.error(f"❌ Job {job['_id']} ({job.get('kind')}) failed: {e}")
+            await run_blocking("db", self.queue.fail, job, str(e))
+        finally:
+            lease.cancel()
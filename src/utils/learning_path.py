@@ -1,8 +1,18 @@
-from typing import Any
+from typing import Any, List, Optional
 from datetime import datetime
 
+# Câu trả lời khi agent lỗi (GenSchedule dựa vào đây để fallback sang scheduler)
+LEARNING_PATH_FAILED = "Sorry, I could not create a learning path."
 
-def create_learning_path(agent: Any, learning_goal: str, deadline: str, user_knowledge: str = "", start_date: str = None) -> str:
+
+def create_learning_path(
+    agent: Any,
+    learning_goal: str,
+    deadline: str,
+    user_knowledge: str = "",
+    start_date: str = None,
+    callbacks: Optional[List[Any]] = None,
+) -> str:
     """
     Creates a personalized learning path using the agent with a deadline.
 
@@ -12,6 +22,7 @@ def create_learning_path(agent: Any, learning_goal: str, deadline: str, user_kno
         deadline: The final deadline to complete the learning goal (format YYYY-MM-DD).
         user_knowledge: The user's current knowledge (optional).
         start_date: Optional start date (format YYYY-MM-DD). If None, today is used.
+        callbacks: Optional LangChain callback handlers (token / agent-step streaming).
 
     Returns:
         A JSON string with "skills" and "learning_path".
@@ -50,7 +61,7 @@ def create_learning_path(agent: Any, learning_goal: str, deadline: str, user_kno
         - Do not include any explanation outside the JSON.
         """
 
-        return agent.run(prompt.strip())
+        return agent.run(prompt.strip(), callbacks=callbacks)
     except Exception as e:
         print(f"Error creating learning path: {e}")
-        return "Sorry, I could not create a learning path."
+        return LEARNING_PATH_FAILED
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import os
 import json
+from functools import lru_cache
 from typing import List, Union, Dict, Any
 
 # LangChain (bản community tách riêng)
@@ -22,6 +23,8 @@ except Exception:
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 
+from src.utils.roadmap_cache import normalize_target
+
 # dotenv: chỉ load khi .env tồn tại (tránh lỗi trên Render)
 try:
     from dotenv import load_dotenv, dotenv_values
@@ -65,54 +68,59 @@ def _init_config() -> Dict[str, Any]:
 CONFIG = _init_config()
 
 
+# ======= Text splitter (dùng chung) =======
+@lru_cache(maxsize=8)
+def _cached_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", " ", ""],  # giúp tách mềm mại hơn
+    )
+
+
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    """Splitter theo CHUNK_SIZE/CHUNK_OVERLAP (ENV-first), tạo 1 lần và dùng lại giữa các lần gọi."""
+    return _cached_splitter(int(str(CONFIG["CHUNK_SIZE"])), int(str(CONFIG["CHUNK_OVERLAP"])))
+
+
 # ======= Document loaders =======
-def load_document(file_path: str) -> List[Document]:
+def is_url(file_path: str) -> bool:
+    return file_path.startswith("http://") or file_path.startswith("https://")
+
+
+def get_loader(file_path: str) -> Any:
     """
-    Load document từ đường dẫn file hoặc URL, hỗ trợ:
+    Chọn loader phù hợp cho đường dẫn file hoặc URL:
       - Text (.txt, .md, .json, …)
       - PDF
       - Web page (http/https)
       - YouTube (youtube.com / youtu.be) — nếu YoutubeLoader khả dụng
+    """
+    if is_url(file_path):
+        # YouTube?
+        if ("youtube.com" in file_path or "youtu.be" in file_path) and _YOUTUBE_AVAILABLE:
+            return YoutubeLoader.from_url(file_path)
+        return WebBaseLoader(file_path)
+
+    # File cục bộ
+    if file_path.lower().endswith(".pdf"):
+        return PyPDFLoader(file_path)
+    # TextLoader có thể đọc txt, md, json (nhưng json sẽ là raw text).
+    # Nếu bạn muốn parse JSON, hãy viết loader riêng. Ở đây ta ưu tiên đơn giản.
+    return TextLoader(file_path, encoding="utf-8")
+
+
+def load_document(file_path: str) -> List[Document]:
+    """
+    Load document từ đường dẫn file hoặc URL (xem get_loader).
     Trả về danh sách Document đã được chunk.
     """
     try:
-        # Chọn loader phù hợp
-        loader = None
-        url_like = file_path.startswith("http://") or file_path.startswith("https://")
-
-        if url_like:
-            # YouTube?
-            if ("youtube.com" in file_path or "youtu.be" in file_path) and _YOUTUBE_AVAILABLE:
-                loader = YoutubeLoader.from_url(file_path)
-            else:
-                loader = WebBaseLoader(file_path)
-        else:
-            # File cục bộ
-            lower = file_path.lower()
-            if lower.endswith(".pdf"):
-                loader = PyPDFLoader(file_path)
-            else:
-                # TextLoader có thể đọc txt, md, json (nhưng json sẽ là raw text).
-                # Nếu bạn muốn parse JSON, hãy viết loader riêng. Ở đây ta ưu tiên đơn giản.
-                loader = TextLoader(file_path, encoding="utf-8")
-
-        if loader is None:
-            raise ValueError("Không tìm được loader phù hợp cho đường dẫn đã cung cấp.")
-
         # Load thô
-        raw_docs = loader.load()
+        raw_docs = get_loader(file_path).load()
 
         # Chunk theo cấu hình (ENV-first)
-        chunk_size = int(str(CONFIG["CHUNK_SIZE"]))
-        chunk_overlap = int(str(CONFIG["CHUNK_OVERLAP"]))
-
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            separators=["\n\n", "\n", " ", ""],  # giúp tách mềm mại hơn
-        )
-        chunks = text_splitter.split_documents(raw_docs)
-        return chunks
+        return get_text_splitter().split_documents(raw_docs)
 
     except Exception as e:
         # Không raise để không làm crash pipeline — trả list rỗng và log ra stderr
@@ -177,7 +185,12 @@ def load_roadmap_json(file_path: str) -> List[Document]:
             documents.append(
                 Document(
                     page_content=full_text,
-                    metadata={"target": target, "category": category, "source": "roadmap.json"},
+                    metadata={
+                        "target": target,
+                        "target_normalized": normalize_target(target),
+                        "category": category,
+                        "source": "roadmap.json",
+                    },
                 )
             )
 
@@ -188,7 +201,9 @@ def load_roadmap_json(file_path: str) -> List[Document]:
         return []
 
 
-def crawler_roadmap_to_docs(roadmap_data: Union[Dict, List[Dict]]) -> List[Document]:
+def crawler_roadmap_to_docs(
+    roadmap_data: Union[Dict, List[Dict]], target: str = "", level: str = ""
+) -> List[Document]:
     """
     Convert dữ liệu từ crawler (roadmap.sh) thành list[Document].
 
@@ -203,6 +218,8 @@ def crawler_roadmap_to_docs(roadmap_data: Union[Dict, List[Dict]]) -> List[Docum
     }
 
     Có thể nhận 1 object hoặc list các object.
+    `target`: target người dùng yêu cầu (khoá ingest/xoá chunk cũ); mặc định dùng title.
+    `level`: level của roadmap (metadata để lọc khi retrieval).
     """
     try:
         if isinstance(roadmap_data, dict):
@@ -241,22 +258,22 @@ def crawler_roadmap_to_docs(roadmap_data: Union[Dict, List[Dict]]) -> List[Docum
                 lp_text = "\n" + "\n".join(lp_lines)
 
             page = f"Target: {title}\n" + "\n\n".join(blocks) + lp_text
+            doc_target = target or title
             docs.append(
                 Document(
                     page_content=page,
-                    metadata={"title": title, "source": "roadmap.sh"},
+                    metadata={
+                        "title": title,
+                        "target": doc_target,
+                        "target_normalized": normalize_target(doc_target),
+                        "level": normalize_target(level),
+                        "source": "roadmap.sh",
+                    },
                 )
             )
 
         # Chunk luôn theo config (giống load_document) để tái sử dụng downstream
-        chunk_size = int(str(CONFIG["CHUNK_SIZE"]))
-        chunk_overlap = int(str(CONFIG["CHUNK_OVERLAP"]))
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            separators=["\n\n", "\n", " ", ""],
-        )
-        return splitter.split_documents(docs)
+        return get_text_splitter().split_documents(docs)
 
     except Exception as e:
         print(f"[crawler_roadmap_to_docs] Error: {e}")
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from typing import Any, List, Optional
+
+from langchain.memory import ConversationBufferMemory
+
+from src.utils.custom_emb import CustomEmbeddings, create_embeddings
+from src.utils.vector_store import default_db_path, load_vector_store, create_vector_store, sync_target_documents
+from src.utils.roadmap_cache import normalize_target
+from src.utils.initialize_llms import initialize_llm
+from src.utils.create_agent import create_agent
+from src.utils.hybrid_retrieval import get_bm25_index, retrieval_mode, update_bm25_index
+from src.utils.env import get_env_var
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """
+    Giữ các tài nguyên nặng (embedding model, Chroma client, LLM client) sống suốt
+    vòng đời process, để mỗi request chỉ phải tạo agent + memory riêng (rẻ).
+    """
+
+    def __init__(
+        self,
+        vectordb_path: Optional[str] = None,
+        llm_type: Optional[str] = None,
+    ):
+        self.vectordb_path = vectordb_path or default_db_path()
+        # Cho phép override loại LLM qua ENV LLM_TYPE (vd: "groq", "openai", "gemini", "local")
+        self.llm_type = llm_type or get_env_var("LLM_TYPE", "gemini")
+
+        self.embeddings: Optional[CustomEmbeddings] = None
+        self.vector_store: Any = None
+        self.llm: Any = None
+
+        # RLock: warm_up() gọi lại các getter bên dưới
+        self._lock = threading.RLock()
+        # Ghi vào vector store tuần tự (tránh 2 request cùng upsert 1 target)
+        self._write_lock = threading.Lock()
+
+    # ---------- Lazy getters (thread-safe) ----------
+    def get_embeddings(self) -> CustomEmbeddings:
+        if self.embeddings is None:
+            with self._lock:
+                if self.embeddings is None:
+                    self.embeddings = create_embeddings()
+        return self.embeddings
+
+    def get_vector_store(self, documents: Optional[List[Any]] = None) -> Any:
+        """
+        Trả về vector store dùng chung.
+        Nếu thư mục DB chưa tồn tại thì cần `documents` để tạo mới (giống hành vi cũ của GenSchedule).
+        """
+        if self.vector_store is None:
+            with self._lock:
+                if self.vector_store is None:
+                    embeddings = self.get_embeddings()
+                    if self.vectordb_path and os.path.exists(self.vectordb_path):
+                        self.vector_store = load_vector_store(
+                            db_path=self.vectordb_path, embeddings=embeddings
+                        )
+                    elif documents:
+                        self.vector_store = create_vector_store(
+                            documents, embeddings, db_path=self.vectordb_path
+                        )
+        return self.vector_store
+
+    def get_llm(self) -> Any:
+        if self.llm is None:
+            with self._lock:
+                if self.llm is None:
+                    self.llm = initialize_llm(llm_type=self.llm_type)
+        return self.llm
+
+    def has_vector_store(self) -> bool:
+        """Store đã nạp hoặc đã có trên đĩa (False → get_vector_store(documents) sẽ tạo mới từ documents)."""
+        return self.vector_store is not None or bool(
+            self.vectordb_path and os.path.exists(self.vectordb_path)
+        )
+
+    def ingest(self, documents: List[Any], target: str = "", level: Optional[str] = None) -> Any:
+        """
+        Đưa chunk của 1 roadmap vào vector store dùng chung:
+          - store chưa tồn tại → tạo mới từ `documents`
+          - đã tồn tại → upsert theo content hash + xoá chunk cũ của (target, level) đó
+        `level` None → xoá chunk cũ của mọi level thuộc target.
+        """
+        with self._write_lock:
+            existed = self.has_vector_store()
+            vector_store = self.get_vector_store(documents)
+            if existed and documents:
+                try:
+                    target_normalized = normalize_target(target)
+                    level_normalized = normalize_target(level) if level is not None else None
+                    stats = sync_target_documents(vector_store, documents, target_normalized, level_normalized)
+                    logger.info(
+                        f"✅ Ingested '{target}': +{stats['added']} new, "
+                        f"{stats['skipped']} unchanged, -{stats['deleted']} stale"
+                    )
+                    update_bm25_index(vector_store, documents, target_normalized, level_normalized)
+                except Exception as e:
+                    logger.error(f"❌ Incremental ingest failed for '{target}': {e}")
+            return vector_store
+
+    # ---------- Per-request ----------
+    def new_agent(self, vector_store: Any = None, target: Optional[str] = None, level: Optional[str] = None) -> Any:
+        """
+        Tạo agent mới với memory riêng cho từng request (không chia sẻ lịch sử hội thoại).
+        `target`/`level`: giới hạn tool retrieval trong chunk của roadmap đó.
+        """
+        memory = ConversationBufferMemory(memory_key="chat_history", input_key="input")
+        return create_agent(
+            self.get_llm(), vector_store or self.get_vector_store(), memory, target=target, level=level
+        )
+
+    def warm_up(self) -> None:
+        """Nạp trước embedding model, vector store (nếu đã có), BM25 index (hybrid) và LLM client lúc app khởi động."""
+        with self._lock:
+            self.get_embeddings()
+            vector_store = self.get_vector_store()
+            if vector_store is not None and retrieval_mode() != "vector":
+                get_bm25_index(vector_store)
+            self.get_llm()
+
+
+# Global registry instance (dùng chung giữa các request)
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ModelRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
+
+
+def init_registry(warm: bool = True) -> ModelRegistry:
+    """Khởi tạo registry lúc startup; lỗi warm-up chỉ log để app vẫn lên được."""
+    registry = get_registry()
+    if warm:
+        try:
+            registry.warm_up()
+            logger.info("✅ Model registry warmed up")
+        except Exception as e:
+            logger.error(f"❌ Model registry warm-up failed: {e}")
+    return registry
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from src.utils.env import get_env_var
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# TTL helper
+# =========================
+def ttl_expiry(env_key: str, default_days: Optional[str] = None) -> Optional[datetime]:
+    """
+    Tính `expires_at` cho document từ ENV (số ngày). Trả None nếu không cấu hình / <= 0
+    → document không bao giờ bị TTL index xoá.
+    """
+    raw = get_env_var(env_key, default_days)
+    if not raw:
+        return None
+    days = float(raw)
+    if days <= 0:
+        return None
+    return datetime.now(timezone.utc) + timedelta(days=days)
+
+
+# =========================
+# Index provisioning
+# =========================
+def _create_index(collection: Any, keys: Any, **kwargs: Any) -> None:
+    """create_index idempotent; lỗi (vd: dữ liệu cũ trùng khoá unique) chỉ log, không chặn startup."""
+    try:
+        collection.create_index(keys, **kwargs)
+    except Exception as e:
+        logger.error(f"❌ Could not create index {kwargs.get('name') or keys} on {collection.name}: {e}")
+
+
+def backfill_roadmap_keys(collection: Any) -> int:
+    """
+    Gắn target_normalized (từ `query`, rồi `target`) + level (thiếu → None) cho document cũ do
+    insert_one tạo → mọi document đều nằm trong khoá unique (target_normalized, level).
+    """
+    from src.utils.roadmap_cache import normalize_target  # import lười (roadmap_cache import module này)
+
+    updated = 0
+    legacy = collection.find(
+        {"$or": [{"target_normalized": {"$exists": False}}, {"level": {"$exists": False}}]},
+        projection={"query": 1, "target": 1, "target_normalized": 1, "level": 1},
+    )
+    for doc in legacy:
+        fields = {"level": doc.get("level")}
+        if "target_normalized" not in doc:
+            fields["target_normalized"] = normalize_target(doc.get("query") or doc.get("target"))
+        updated += collection.update_one({"_id": doc["_id"]}, {"$set": fields}).modified_count
+    return updated
+
+
+def dedupe_roadmaps(collection: Any) -> int:
+    """
+    Xoá bản trùng (target_normalized, level) do insert_one cũ, giữ bản crawl mới nhất.
+    Backfill khoá cho document cũ trước khi gom nhóm (document cũ chính là nguồn gây trùng).
+    """
+    backfilled = backfill_roadmap_keys(collection)
+    if backfilled:
+        logger.info(f"♻️ Backfilled target_normalized/level on {backfilled} legacy roadmap document(s)")
+    removed = 0
+    pipeline = [
+        {"$sort": {"crawled_at": -1}},
+        {"$group": {"_id": {"t": "$target_normalized", "l": "$level"}, "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ]
+    for group in collection.aggregate(pipeline):
+        stale_ids = group["ids"][1:]
+        removed += collection.delete_many({"_id": {"$in": stale_ids}}).deleted_count
+    return removed
+
+
+def ensure_indexes(db: Any) -> None:
+    """
+    Tạo index lúc startup:
+      - roadmaps      : unique (target_normalized, level) + index cho lookup kiểu cũ, TTL expires_at
+      - learning_path : created_at, TTL expires_at
+      - jobs          : claim (status, priority, created_at), dedupe_key, TTL expires_at
+      - crawl_leases  : TTL expires_at (dọn lease bị bỏ rơi)
+      - schedule_cache: key_hash, (bucket, level_normalized), last_hit_at (LRU), TTL expires_at
+      - schedule_templates: unique (target_normalized, level, bucket)
+    TTL index chỉ xoá document có field `expires_at` (BSON date).
+    """
+    from pymongo import ASCENDING, DESCENDING
+
+    roadmaps = db["roadmaps"]
+    removed = dedupe_roadmaps(roadmaps)
+    if removed:
+        logger.info(f"🧹 Removed {removed} duplicate roadmap document(s)")
+    _create_index(
+        roadmaps,
+        [("target_normalized", ASCENDING), ("level", ASCENDING)],
+        name="target_normalized_level_unique",
+        unique=True,
+        partialFilterExpression={"target_normalized": {"$exists": True}},
+    )
+    _create_index(roadmaps, [("query", ASCENDING), ("level", ASCENDING)], name="query_level")
+    _create_index(roadmaps, [("target", ASCENDING), ("level", ASCENDING)], name="target_level")
+    _create_index(roadmaps, "expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+
+    learning_path = db["learning_path"]
+    _create_index(learning_path, [("created_at", DESCENDING)], name="created_at")
+    _create_index(learning_path, "expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+
+    jobs = db["jobs"]
+    _create_index(
+        jobs,
+        [("status", ASCENDING), ("priority", DESCENDING), ("created_at", ASCENDING)],
+        name="claim_order",
+    )
+    _create_index(jobs, "dedupe_key", name="dedupe_key")
+    _create_index(jobs, [("created_at", DESCENDING)], name="created_at")
+    _create_index(jobs, "expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+
+    _create_index(db["crawl_leases"], "expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+
+    schedule_cache = db["schedule_cache"]
+    _create_index(schedule_cache, "key_hash", name="key_hash", unique=True)
+    _create_index(schedule_cache, [("bucket", ASCENDING), ("level_normalized", ASCENDING)], name="bucket_level")
+    _create_index(schedule_cache, "last_hit_at", name="last_hit_at")
+    _create_index(schedule_cache, "expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+
+    _create_index(
+        db["schedule_templates"],
+        [("target_normalized", ASCENDING), ("level", ASCENDING), ("bucket", ASCENDING)],
+        name="target_level_bucket_unique",
+        unique=True,
+    )
@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl  # khoá file giữa các process (POSIX)
+except ImportError:  # Windows: chỉ còn khoá trong process
+    fcntl = None
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document  # fallback cho version cũ
+
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.json"
+LOCK_FILE = ".write.lock"
+
+
+def _match(value: Any, cond: Any) -> bool:
+    """1 điều kiện kiểu Chroma: giá trị trực tiếp, {"$eq"}, {"$ne"}, {"$in"}, {"$nin"}."""
+    if isinstance(cond, dict):
+        for op, arg in cond.items():
+            if op == "$eq" and value != arg:
+                return False
+            if op == "$ne" and value == arg:
+                return False
+            if op == "$in" and value not in arg:
+                return False
+            if op == "$nin" and value in arg:
+                return False
+        return True
+    return value == cond
+
+
+def where_matches(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Kiểm tra 1 metadata với filter `where` kiểu Chroma (dùng cho index ngoài vector, vd: BM25)."""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(where_matches(metadata, sub) for sub in cond):
+                return False
+        elif key == "$or":
+            if not any(where_matches(metadata, sub) for sub in cond):
+                return False
+        elif not _match((metadata or {}).get(key), cond):
+            return False
+    return True
+
+
+class NumpyVectorStore:
+    """
+    Vector store trong process cho corpus nhỏ (≤ vài chục nghìn chunk):
+      - embedding đã chuẩn hóa (float32/float16) trong `vectors.npy`, mở bằng mmap (chia sẻ page cache
+        giữa các worker process); ids/documents/metadatas trong sidecar `meta.json`
+      - top-k brute-force bằng 1 phép nhân ma trận + argpartition, filter metadata kiểu Chroma `where`
+      - ghi: khoá file giữa các process → nạp lại bản mới nhất trên đĩa → áp thay đổi → viết file tạm
+        rồi os.replace (atomic); process khác tự nạp lại khi meta.json đổi
+    API bám theo phần Chroma mà repo dùng: add_documents/add_texts(ids), get, delete,
+    similarity_search(_with_score) (score = cosine distance, nhỏ hơn là gần hơn), persist.
+    """
+
+    def __init__(self, path: str, embedding_function: Any, dtype: str = "float32"):
+        self.path = path
+        self.embedding_function = embedding_function
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.RLock()
+
+        self._vectors: np.ndarray = np.zeros((0, 0), dtype=self.dtype)
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._row: Dict[str, int] = {}
+        self._columns: Dict[str, np.ndarray] = {}
+        self._meta_mtime: Optional[float] = None
+
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    # ---------- Persistence ----------
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, VECTORS_FILE)
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, META_FILE)
+
+    @contextmanager
+    def _write_lock(self):
+        """Khoá ghi: thread lock + flock trên LOCK_FILE (các worker process dùng chung thư mục)."""
+        with self._lock:
+            with open(os.path.join(self.path, LOCK_FILE), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    # Trong khoá không ai ghi dở → nạp bản mới nhất để không ghi đè thay đổi của process khác
+                    self._load()
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self) -> None:
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(self._vectors_path, mmap_mode="r")
+        if vectors.shape[0] != len(meta["ids"]):
+            return  # đang giữa 2 lần os.replace của process khác → lần query sau nạp lại
+        self._vectors = vectors
+        self._ids = meta["ids"]
+        self._documents = meta["documents"]
+        self._metadatas = meta["metadatas"]
+        self._row = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        self._columns = {}
+        self._meta_mtime = os.path.getmtime(self._meta_path)
+
+    def _maybe_reload(self) -> None:
+        try:
+            mtime = os.path.getmtime(self._meta_path)
+        except OSError:
+            return
+        if mtime != self._meta_mtime:
+            with self._lock:
+                self._load()
+
+    def _save(
+        self,
+        vectors: np.ndarray,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+    ) -> None:
+        """Ghi snapshot mới rồi nạp lại; state trong bộ nhớ chỉ đổi sau khi ghi xong."""
+        tmp_vectors = f"{self._vectors_path}.{uuid.uuid4().hex}.tmp"
+        tmp_meta = f"{self._meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_vectors, "wb") as f:
+            np.save(f, vectors.astype(self.dtype, copy=False))
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "documents": documents, "metadatas": metadatas}, f, ensure_ascii=False)
+        os.replace(tmp_vectors, self._vectors_path)
+        os.replace(tmp_meta, self._meta_path)
+        self._load()
+
+    def persist(self) -> None:
+        """Mỗi lần ghi đã lưu xuống đĩa (giữ để tương thích API Chroma)."""
+
+    # ---------- Write ----------
+    @staticmethod
+    def _normalize(vectors: Any) -> np.ndarray:
+        arr = np.asarray(vectors, dtype=np.float32)
+        if arr.ndim == 1:
+            arr = arr[None, :]
+        return arr / np.clip(np.linalg.norm(arr, axis=1, keepdims=True), 1e-12, None)
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+
+        # Id lặp trong cùng lô → bản cuối cùng thắng (chỉ embed 1 lần / id)
+        staged: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        for doc_id, text, meta in zip(ids, texts, metadatas):
+            staged[doc_id] = (text, dict(meta or {}))
+        new_vectors = self._normalize(self.embedding_function.embed_documents([t for t, _ in staged.values()]))
+
+        with self._write_lock():
+            vectors = np.array(self._vectors, dtype=np.float32)  # bản sao (mmap read-only)
+            if vectors.size == 0:
+                vectors = np.zeros((0, new_vectors.shape[1]), dtype=np.float32)
+            out_ids = list(self._ids)
+            out_documents = list(self._documents)
+            out_metadatas = list(self._metadatas)
+
+            appended = []
+            for (doc_id, (text, meta)), vec in zip(staged.items(), new_vectors):
+                row = self._row.get(doc_id)
+                if row is not None:  # id đã có trên đĩa → ghi đè (upsert)
+                    vectors[row] = vec
+                    out_documents[row] = text
+                    out_metadatas[row] = meta
+                    continue
+                out_ids.append(doc_id)
+                out_documents.append(text)
+                out_metadatas.append(meta)
+                appended.append(vec)
+
+            if appended:
+                vectors = np.vstack([vectors, np.asarray(appended, dtype=np.float32)])
+            self._save(vectors, out_ids, out_documents, out_metadatas)
+        return ids
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        return self.add_texts(
+            [d.page_content for d in documents], [dict(d.metadata or {}) for d in documents], ids=ids
+        )
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        if not ids:
+            return
+        with self._write_lock():
+            drop = {self._row[i] for i in ids if i in self._row}
+            if not drop:
+                return
+            keep = [r for r in range(len(self._ids)) if r not in drop]
+            self._save(
+                np.asarray(self._vectors, dtype=np.float32)[keep],
+                [self._ids[r] for r in keep],
+                [self._documents[r] for r in keep],
+                [self._metadatas[r] for r in keep],
+            )
+
+    # ---------- Read ----------
+    def _column(self, key: str) -> np.ndarray:
+        col = self._columns.get(key)
+        if col is None:
+            col = np.empty(len(self._metadatas), dtype=object)
+            col[:] = [m.get(key) for m in self._metadatas]
+            self._columns[key] = col
+        return col
+
+    def _mask(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Filter `where` kiểu Chroma ({"k": v}, {"k": {"$in": [...]}}, {"$and"/"$or": [...]}) → mask bool."""
+        if not where:
+            return None
+        mask = np.ones(len(self._ids), dtype=bool)
+        for key, cond in where.items():
+            if key in ("$and", "$or"):
+                parts = [self._mask(sub) for sub in cond]
+                parts = [p for p in parts if p is not None]
+                if parts:
+                    combined = np.logical_and.reduce(parts) if key == "$and" else np.logical_or.reduce(parts)
+                    mask &= combined
+                continue
+            col = self._column(key)
+            if isinstance(cond, dict):
+                mask &= np.fromiter((_match(v, cond) for v in col), dtype=bool, count=len(col))
+            else:
+                mask &= col == cond
+        return mask
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        include: Optional[Sequence[str]] = ("documents", "metadatas"),
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        self._maybe_reload()
+        with self._lock:
+            if ids is not None:
+                rows = [self._row[i] for i in ids if i in self._row]
+            else:
+                rows = list(range(len(self._ids)))
+            mask = self._mask(where)
+            if mask is not None:
+                rows = [r for r in rows if mask[r]]
+
+            include = include or []
+            out: Dict[str, Any] = {"ids": [self._ids[r] for r in rows]}
+            if "documents" in include:
+                out["documents"] = [self._documents[r] for r in rows]
+            if "metadatas" in include:
+                out["metadatas"] = [self._metadatas[r] for r in rows]
+            if "embeddings" in include:
+                out["embeddings"] = [np.asarray(self._vectors[r], dtype=np.float32).tolist() for r in rows]
+            return out
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: Sequence[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        self._maybe_reload()
+        with self._lock:
+            vectors, documents, metadatas = self._vectors, self._documents, self._metadatas
+            mask = self._mask(filter)
+        if not len(documents) or k <= 0:
+            return []
+
+        query = self._normalize(embedding)[0].astype(vectors.dtype, copy=False)
+        scores = np.asarray(vectors @ query, dtype=np.float32)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            k = min(k, int(mask.sum()))
+            if k == 0:
+                return []
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (Document(page_content=documents[r], metadata=dict(metadatas[r])), float(1.0 - scores[r]))
+            for r in top
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(
+            self.embedding_function.embed_query(query), k=k, filter=filter
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # ---------- Constructors ----------
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Any,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+        path: str = "./vector_index",
+        dtype: str = "float32",
+    ) -> "NumpyVectorStore":
+        store = cls(path, embedding, dtype=dtype)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    @classmethod
+    def from_documents(
+        cls,
+        documents: List[Document],
+        embedding: Any,
+        ids: Optional[List[str]] = None,
+        path: str = "./vector_index",
+        dtype: str = "float32",
+    ) -> "NumpyVectorStore":
+        store = cls(path, embedding, dtype=dtype)
+        store.add_documents(documents, ids=ids)
+        return store
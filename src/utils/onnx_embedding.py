@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# onnxruntime / transformers là optional: chỉ cần khi EMBEDDING_BACKEND=onnx | onnx-int8
+try:
+    import onnxruntime as ort
+    _ONNX_AVAILABLE = True
+except Exception:
+    ort = None  # type: ignore
+    _ONNX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ONNX_DIR = "./onnx_models"
+
+# Câu mẫu cho parity check (tên kỹ năng ngắn + câu dài như chunk roadmap)
+_PARITY_SAMPLES = [
+    "Docker",
+    "Kubernetes",
+    "Apache Spark",
+    "Machine Learning Fundamentals",
+    "Transformer Networks (BERT, GPT, RoBERTa)",
+    "Tôi muốn trở thành kỹ sư dữ liệu",
+    "Target: Backend Development\nSkill: Fundamentals\n  - Computer Science Basics\n  - Networking Basics",
+    "Data Cleaning, Handling Missing Data, Data Validation and Data Governance for analytics pipelines",
+]
+
+
+def _safe_name(model_name: str) -> str:
+    return model_name.replace("/", "__")
+
+
+# Cấu hình đã biết của model mặc định (dùng khi không tải được config từ hub, vd: offline).
+# all-MiniLM-L6-v2 kết thúc bằng module Normalize → vector đơn vị.
+_KNOWN_ST_CONFIGS: Dict[str, Dict[str, Any]] = {
+    "sentence-transformers/all-MiniLM-L6-v2": {"pooling": "mean", "normalize": True, "max_length": 256},
+}
+
+
+def _read_st_config(model_name: str) -> Dict[str, Any]:
+    """
+    Đọc cấu hình pipeline sentence-transformers (pooling, normalize, max_seq_length)
+    để ONNX encoder tái tạo đúng đầu ra của model float.
+
+    Không đọc được → dùng _KNOWN_ST_CONFIGS nếu có, ngược lại raise RuntimeError (đoán sai normalize
+    sẽ đổi hình học vector so với PyTorch / index đã build; CustomEmbeddings tự fallback về PyTorch).
+    """
+    cfg: Dict[str, Any] = {"pooling": "mean", "normalize": False, "max_length": 256}
+    try:
+        from huggingface_hub import hf_hub_download
+
+        with open(hf_hub_download(model_name, "modules.json"), "r", encoding="utf-8") as f:
+            modules = json.load(f)
+        cfg["normalize"] = any("Normalize" in (m.get("type") or "") for m in modules)
+
+        pooling_dir = next((m.get("path") for m in modules if "Pooling" in (m.get("type") or "")), None)
+        if pooling_dir:
+            with open(hf_hub_download(model_name, f"{pooling_dir}/config.json"), "r", encoding="utf-8") as f:
+                pooling = json.load(f)
+            if pooling.get("pooling_mode_cls_token"):
+                cfg["pooling"] = "cls"
+
+        with open(hf_hub_download(model_name, "sentence_bert_config.json"), "r", encoding="utf-8") as f:
+            cfg["max_length"] = int(json.load(f).get("max_seq_length") or cfg["max_length"])
+    except Exception as e:
+        known = _KNOWN_ST_CONFIGS.get(model_name)
+        if known is None:
+            raise RuntimeError(f"Could not read sentence-transformers config for {model_name}: {e}") from e
+        logger.warning(f"⚠️ Could not read sentence-transformers config for {model_name}, using known config: {e}")
+        return dict(known)
+    return cfg
+
+
+# =========================
+# Export + quantize
+# =========================
+def export_onnx(model_name: str, output_path: str, opset: int = 17) -> str:
+    """Export transformer encoder (last_hidden_state) sang ONNX với batch/sequence động."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            output_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    return output_path
+
+
+def quantize_int8(fp32_path: str, int8_path: str) -> str:
+    """Dynamic int8 quantization (weights int8, activations tính động) — hợp CPU không GPU."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+# =========================
+# Encoder
+# =========================
+class OnnxSentenceEncoder:
+    """
+    Chạy model sentence-transformers bằng onnxruntime trên CPU (fp32 hoặc int8),
+    tái tạo pooling + normalize giống pipeline gốc. File ONNX được export 1 lần rồi cache.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        quantize: bool = True,
+        onnx_dir: Optional[str] = None,
+        num_threads: Optional[int] = None,
+    ):
+        if not _ONNX_AVAILABLE:
+            raise ImportError("onnxruntime chưa được cài. Hãy `pip install onnxruntime onnx`.")
+        from transformers import AutoTokenizer
+
+        base_dir = os.path.join(onnx_dir or DEFAULT_ONNX_DIR, _safe_name(model_name))
+        fp32_path = os.path.join(base_dir, "model.onnx")
+        int8_path = os.path.join(base_dir, "model.int8.onnx")
+
+        if not os.path.exists(fp32_path):
+            logger.info(f"⏳ Exporting {model_name} to ONNX: {fp32_path}")
+            export_onnx(model_name, fp32_path)
+        path = fp32_path
+        if quantize:
+            if not os.path.exists(int8_path):
+                logger.info(f"⏳ Quantizing {model_name} to int8: {int8_path}")
+                quantize_int8(fp32_path, int8_path)
+            path = int8_path
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        self.model_name = model_name
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+        cfg = _read_st_config(model_name)
+        self.pooling = cfg["pooling"]
+        self.normalize = cfg["normalize"]
+        self.max_length = cfg["max_length"]
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        enc = self.tokenizer(
+            list(texts), padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+        )
+        feeds = {name: value.astype(np.int64) for name, value in enc.items() if name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.normalize:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+
+# =========================
+# Parity check
+# =========================
+def check_parity(
+    model_name: str,
+    texts: Optional[List[str]] = None,
+    *,
+    quantize: bool = True,
+    onnx_dir: Optional[str] = None,
+) -> Dict[str, Any]:
+    """So sánh vector ONNX với model float (sentence-transformers): cosine từng câu + drift lớn nhất."""
+    from sentence_transformers import SentenceTransformer
+
+    texts = texts or _PARITY_SAMPLES
+    reference = SentenceTransformer(model_name, device="cpu").encode(texts, convert_to_numpy=True)
+    candidate = OnnxSentenceEncoder(model_name, quantize=quantize, onnx_dir=onnx_dir).encode(texts)
+
+    ref = reference / np.clip(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12, None)
+    cand = candidate / np.clip(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12, None)
+    cosines = (ref * cand).sum(axis=1)
+
+    return {
+        "model": model_name,
+        "backend": "onnx-int8" if quantize else "onnx",
+        "n": len(texts),
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "max_drift": float(1.0 - cosines.min()),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ONNX embedding parity check vs float model")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2"))
+    parser.add_argument("--texts-file", help="File text, mỗi dòng 1 câu (mặc định: câu mẫu có sẵn)")
+    parser.add_argument("--fp32", action="store_true", help="So sánh bản ONNX fp32 thay vì int8")
+    parser.add_argument("--onnx-dir", default=os.getenv("EMBEDDING_ONNX_DIR", DEFAULT_ONNX_DIR))
+    args = parser.parse_args()
+
+    sample_texts = None
+    if args.texts_file:
+        with open(args.texts_file, "r", encoding="utf-8") as f:
+            sample_texts = [line.strip() for line in f if line.strip()]
+
+    report = check_parity(args.model, sample_texts, quantize=not args.fp32, onnx_dir=args.onnx_dir)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
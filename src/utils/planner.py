@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from src.utils.context_builder import build_context
+from src.utils.schedule_dates import extract_schedule_json
+from src.utils.hybrid_retrieval import retrieve
+
+logger = logging.getLogger(__name__)
+
+# Schema output (OpenAPI subset mà Gemini responseSchema chấp nhận)
+LEARNING_PATH_SCHEMA: Dict[str, Any] = {
+    "type": "OBJECT",
+    "properties": {
+        "learning_path": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "week": {"type": "INTEGER"},
+                    "objective": {"type": "STRING"},
+                    "deadline": {"type": "STRING"},
+                },
+                "required": ["week", "objective", "deadline"],
+            },
+        }
+    },
+    "required": ["learning_path"],
+}
+
+
+def retrieve_context(
+    vector_store: Any,
+    learning_goal: str,
+    user_knowledge: str = "",
+    k: int = 6,
+    llm: Any = None,
+    roadmap: Any = None,
+) -> str:
+    """
+    Lấy chunk roadmap liên quan qua hybrid_retrieval.retrieve (không qua tool của agent): RETRIEVAL_MODE
+    vector → get_scoped_docs, hybrid → hybrid_search; chỉ trong chunk của target/level được hỏi (nới rộng
+    nếu thiếu). Dedupe + đóng gói theo ngân sách token của `llm`, kèm outline roadmap nếu có.
+    """
+    query = f"{learning_goal} {user_knowledge}".strip()
+    results = retrieve(
+        query, vector_store, k=k, with_score=True, target=learning_goal, level=user_knowledge
+    )
+    return build_context(results, llm, roadmap=roadmap)
+
+
+def build_planner_prompt(
+    learning_goal: str,
+    deadline: str,
+    user_knowledge: str = "",
+    start_date: Optional[str] = None,
+    context: str = "",
+) -> str:
+    start_date = start_date or datetime.today().strftime("%Y-%m-%d")
+    prompt = f"""
+You are a helpful AI assistant designed to create personalized learning paths.
+The user's learning goal is: "{learning_goal}".
+The user wants to complete it by the deadline: {deadline}.
+The start date is: {start_date}.
+"""
+    if user_knowledge:
+        prompt += f'The user has some existing knowledge: "{user_knowledge}".\n'
+    if context:
+        prompt += f"""
+Relevant roadmap material (use it to choose and order the weekly objectives):
+{context}
+"""
+    prompt += """
+Return ONLY a JSON object with the following structure:
+
+{
+  "learning_path": [
+    {"week": 1, "objective": "...", "deadline": "YYYY-MM-DD"},
+    ...
+  ]
+}
+
+- "deadline" must be an actual date between the start date and the final deadline.
+- Split the total learning period into weekly objectives that fit evenly until the final deadline.
+- Do not include any explanation outside the JSON.
+"""
+    return prompt.strip()
+
+
+def _structured_kwargs(llm: Any) -> Dict[str, Any]:
+    """Tham số constrained output theo provider (LLM không hỗ trợ thì chỉ dựa vào prompt)."""
+    llm_type = getattr(llm, "_llm_type", "")
+    if llm_type == "gemini-rest":
+        return {"response_schema": LEARNING_PATH_SCHEMA}
+    if llm_type in ("openai-chat", "groq-chat"):
+        return {"response_format": {"type": "json_object"}}
+    return {}
+
+
+def plan_learning_path(
+    llm: Any,
+    vector_store: Any,
+    learning_goal: str,
+    deadline: str,
+    user_knowledge: str = "",
+    start_date: Optional[str] = None,
+    k: int = 6,
+    callbacks: Optional[List[Any]] = None,
+    context: Optional[str] = None,
+) -> str:
+    """
+    Planner mode: retrieve_context (retrieve / get_scoped_docs) → 1 prompt → đúng 1 lần gọi LLM với output JSON.
+    `context`: chunk đã retrieve sẵn (dùng chung giữa nhiều request), None → tự retrieve.
+    Trả về JSON string {"learning_path": [...]} (cùng dạng với agent mode).
+    """
+    if context is None:
+        context = retrieve_context(vector_store, learning_goal, user_knowledge, k=k, llm=llm)
+    prompt = build_planner_prompt(learning_goal, deadline, user_knowledge, start_date, context)
+
+    config = {"callbacks": callbacks} if callbacks else None
+    output = llm.invoke(prompt, config=config, **_structured_kwargs(llm))
+    text = getattr(output, "content", output)
+
+    schedule = extract_schedule_json(text)
+    if schedule is None:
+        logger.warning("⚠️ Planner output is not valid learning path JSON, returning raw text")
+        return text
+    return json.dumps(schedule, ensure_ascii=False, indent=2)
@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document  # fallback cho version cũ
+
+from src.utils.env import get_env_var
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUESTIONS_GLOB = "data/questions/*/*.json"
+DEFAULT_ROADMAP_PATH = "data/temp_roadmap.txt"
+DEFAULT_KS = (1, 3, 5, 10)
+
+
+# =========================
+# Corpus + ground truth
+# =========================
+def _label(question: Dict[str, Any]) -> Tuple[str, str]:
+    return (str(question.get("skill_name") or "").strip(), str(question.get("subskill_name") or "").strip())
+
+
+def load_questions(pattern: str = DEFAULT_QUESTIONS_GLOB) -> List[Dict[str, Any]]:
+    """Toàn bộ câu hỏi có nhãn skill_name/subskill_name trong ngân hàng câu hỏi."""
+    questions: List[Dict[str, Any]] = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for q in data if isinstance(data, list) else []:
+            if q.get("question_text") and all(_label(q)):
+                questions.append(q)
+    return questions
+
+
+def split_questions(
+    questions: Sequence[Dict[str, Any]], holdout_every: int = 3
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Chia deterministic theo từng nhãn: mỗi câu thứ `holdout_every` làm query, phần còn lại làm
+    nội dung chunk → query không trùng nguyên văn với chunk chứa đáp án.
+    """
+    by_label: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+    for q in sorted(questions, key=lambda q: str(q.get("id") or "")):
+        by_label[_label(q)].append(q)
+    corpus, queries = [], []
+    for items in by_label.values():
+        for i, q in enumerate(items):
+            # Nhãn chỉ có 1 câu → chỉ dùng làm corpus (không có gì để tìm)
+            (queries if len(items) > 1 and i % holdout_every == holdout_every - 1 else corpus).append(q)
+    return corpus, queries
+
+
+def _label_names(questions: Sequence[Dict[str, Any]]) -> List[str]:
+    """Mọi tên skill/subskill (casefold) xuất hiện trong ngân hàng câu hỏi."""
+    return sorted({name.casefold() for q in questions for name in _label(q) if name})
+
+
+def build_corpus(
+    corpus_questions: Sequence[Dict[str, Any]],
+    roadmap_path: Optional[str] = DEFAULT_ROADMAP_PATH,
+) -> List[Document]:
+    """
+    1 Document / nhãn (skill, subskill): tên nhãn + câu hỏi, giải thích, tags của phần corpus.
+    Tag trùng/nằm trong tên 1 nhãn (vd "Transformer Networks", "BERT") bị bỏ: tags được gắn từ chính
+    nhãn nên để lại sẽ làm lộ đáp án vào chunk → recall bị thổi phồng.
+    Chunk của `data/temp_roadmap.txt` (qua crawler_roadmap_to_docs) thêm vào làm nhiễu, không có nhãn.
+    """
+    label_names = _label_names(corpus_questions)
+    grouped: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+    targets: Dict[Tuple[str, str], str] = {}
+    for q in corpus_questions:
+        targets.setdefault(_label(q), str(q.get("target") or ""))
+        lines = grouped[_label(q)]
+        lines.append(q["question_text"])
+        if q.get("explanation"):
+            lines.append(q["explanation"])
+        tags = [
+            str(t) for t in q.get("tags") or []
+            if not any(str(t).strip().casefold() in name for name in label_names)
+        ]
+        if tags:
+            lines.append(", ".join(tags))
+
+    docs: List[Document] = []
+    for (skill, subskill), lines in grouped.items():
+        docs.append(Document(
+            page_content=f"Skill: {skill}\nSubskill: {subskill}\n" + "\n".join(dict.fromkeys(lines)),
+            metadata={"skill_name": skill, "subskill_name": subskill, "target": targets[(skill, subskill)]},
+        ))
+
+    if roadmap_path and os.path.exists(roadmap_path):
+        from src.utils.load_documents import crawler_roadmap_to_docs
+
+        with open(roadmap_path, "r", encoding="utf-8") as f:
+            roadmap = json.load(f)
+        for doc in crawler_roadmap_to_docs(roadmap, target="bench-distractor"):
+            doc.metadata.update({"skill_name": "", "subskill_name": ""})
+            docs.append(doc)
+    return docs
+
+
+# =========================
+# Đo đạc
+# =========================
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Percentile nội suy tuyến tính (giống numpy.percentile mặc định)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * pct / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def rss_mb() -> Dict[str, float]:
+    """RSS hiện tại (/proc, Linux) và peak RSS của process (MB)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # macOS: bytes, Linux: KB
+    current_mb = 0.0
+    try:
+        with open("/proc/self/statm", "r") as f:
+            current_mb = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    return {"current": round(current_mb, 1), "peak": round(peak_mb, 1)}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def _latency_stats(samples_ms: Sequence[float]) -> Dict[str, float]:
+    return {
+        "p50": round(percentile(samples_ms, 50), 3),
+        "p95": round(percentile(samples_ms, 95), 3),
+        "p99": round(percentile(samples_ms, 99), 3),
+        "mean": round(sum(samples_ms) / len(samples_ms), 3) if samples_ms else 0.0,
+    }
+
+
+def run_benchmark(
+    questions_glob: str = DEFAULT_QUESTIONS_GLOB,
+    roadmap_path: Optional[str] = DEFAULT_ROADMAP_PATH,
+    ks: Sequence[int] = DEFAULT_KS,
+    model_name: Optional[str] = None,
+    retrieval: str = "vector",
+    max_queries: Optional[int] = None,
+    warmup: int = 5,
+    embedding_cache: bool = False,
+) -> Dict[str, Any]:
+    """
+    create_embeddings → embed throughput; create_vector_store → build time;
+    get_similar_docs (hoặc hybrid retrieve) → recall@k + latency p50/p95/p99; RSS sau mỗi bước.
+    Vector store dựng trong thư mục tạm (backend theo VECTOR_BACKEND), xoá sau khi chạy.
+    Cache embedding trên đĩa mặc định tắt (`embedding_cache`) để đo thời gian encode thật.
+    """
+    from src.utils.custom_emb import create_embeddings
+    from src.utils.vector_store import create_vector_store, get_similar_docs, vector_backend
+
+    ks = sorted(set(int(k) for k in ks))
+    max_k = ks[-1]
+    report: Dict[str, Any] = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "embedding_model": model_name or get_env_var("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2"),
+            "embedding_backend": get_env_var("EMBEDDING_BACKEND", "torch"),
+            "embedding_batch_size": int(get_env_var("EMBEDDING_BATCH_SIZE", "32")),
+            "embedding_microbatch_wait_ms": float(get_env_var("EMBEDDING_MICROBATCH_WAIT_MS", "5")),
+            "embedding_cache": embedding_cache,
+            "vector_backend": vector_backend(),
+            "vector_dtype": get_env_var("VECTOR_DTYPE", "float32"),
+            "retrieval": retrieval,
+            "ks": ks,
+        },
+        "rss_mb": {"start": rss_mb()},
+    }
+
+    corpus_questions, queries = split_questions(load_questions(questions_glob))
+    if max_queries:
+        queries = queries[:max_queries]
+    docs = build_corpus(corpus_questions, roadmap_path)
+    texts = [d.page_content for d in docs]
+    report["corpus"] = {
+        "documents": len(docs),
+        "labelled_documents": sum(1 for d in docs if d.metadata.get("subskill_name")),
+        "queries": len(queries),
+        "chars": sum(len(t) for t in texts),
+    }
+
+    # ---------- Embedding ----------
+    started = time.perf_counter()
+    embeddings = create_embeddings(model_name, use_cache=embedding_cache)
+    embeddings.embed_query("warm up")
+    load_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    embeddings.embed_documents(texts)
+    embed_s = time.perf_counter() - started
+    report["embedding"] = {
+        "model_load_s": round(load_s, 3),
+        "embed_s": round(embed_s, 3),
+        "docs_per_s": round(len(texts) / embed_s, 1) if embed_s > 0 else None,
+    }
+    report["rss_mb"]["after_embed"] = rss_mb()
+
+    # ---------- Index build ----------
+    workdir = tempfile.mkdtemp(prefix="retrieval_bench_")
+    try:
+        started = time.perf_counter()
+        vector_store = create_vector_store(docs, embeddings, db_path=workdir, collection_name="bench")
+        report["index"] = {"build_s": round(time.perf_counter() - started, 3)}
+
+        search = lambda q: get_similar_docs(q, vector_store, k=max_k)  # noqa: E731
+        if retrieval != "vector":
+            from src.utils.hybrid_retrieval import get_bm25_index, retrieve
+
+            started = time.perf_counter()
+            get_bm25_index(vector_store)
+            report["index"]["bm25_build_s"] = round(time.perf_counter() - started, 3)
+            search = lambda q: retrieve(q, vector_store, k=max_k, mode=retrieval)  # noqa: E731
+        report["rss_mb"]["after_build"] = rss_mb()
+
+        # ---------- Query ----------
+        for q in queries[:warmup]:
+            search(q["question_text"])
+
+        hits = {k: 0 for k in ks}
+        reciprocal_ranks: List[float] = []
+        latencies_ms: List[float] = []
+        for q in queries:
+            started = time.perf_counter()
+            results = search(q["question_text"])
+            latencies_ms.append((time.perf_counter() - started) * 1000)
+
+            labels = [(d.metadata.get("skill_name"), d.metadata.get("subskill_name")) for d in results]
+            rank = next((i + 1 for i, label in enumerate(labels) if label == _label(q)), None)
+            reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+            for k in ks:
+                if rank is not None and rank <= k:
+                    hits[k] += 1
+
+        n = len(queries) or 1
+        report["recall"] = {f"@{k}": round(hits[k] / n, 4) for k in ks}
+        report["mrr"] = round(sum(reciprocal_ranks) / n, 4)
+        report["query_latency_ms"] = _latency_stats(latencies_ms)
+        report["queries_per_s"] = round(len(latencies_ms) / (sum(latencies_ms) / 1000), 1) if latencies_ms else None
+        report["rss_mb"]["after_query"] = rss_mb()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark embedding + vector store + retrieval (JSON report)")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS_GLOB, help="Glob file câu hỏi có nhãn")
+    parser.add_argument("--roadmap", default=DEFAULT_ROADMAP_PATH, help="Roadmap JSON thêm làm chunk nhiễu ('' = bỏ)")
+    parser.add_argument("--k", type=int, action="append", help="recall@k (lặp lại được; mặc định 1,3,5,10)")
+    parser.add_argument("--model", default=None, help="Embedding model (mặc định EMBEDDING_MODEL_NAME)")
+    parser.add_argument("--retrieval", default="vector", choices=["vector", "hybrid", "hybrid_rerank"])
+    parser.add_argument("--max-queries", type=int, default=None)
+    parser.add_argument("--embedding-cache", action="store_true", help="Giữ cache embedding trên đĩa (mặc định tắt để đo thật)")
+    parser.add_argument("--output", default=None, help="Ghi report JSON ra file (mặc định stdout)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    result = run_benchmark(
+        questions_glob=args.questions,
+        roadmap_path=args.roadmap or None,
+        ks=args.k or DEFAULT_KS,
+        model_name=args.model,
+        retrieval=args.retrieval,
+        max_queries=args.max_queries,
+        embedding_cache=args.embedding_cache,
+    )
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
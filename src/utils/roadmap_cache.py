@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from src.utils.mongo_indexes import ttl_expiry
+from src.utils.env import get_env_var
+
+# Field cần cho read-through cache (tránh kéo cả document lớn qua mạng)
+CACHE_PROJECTION = {"data": 1, "crawled_at": 1, "target": 1, "level": 1}
+
+
+# =========================
+# Keys & freshness
+# =========================
+def normalize_target(target: Optional[str]) -> str:
+    """Khoá cache ổn định: bỏ khoảng trắng thừa, không phân biệt hoa/thường."""
+    return " ".join((target or "").split()).casefold()
+
+
+def roadmap_hash(data: Any) -> str:
+    """Hash nội dung roadmap (ổn định theo thứ tự key) để phát hiện roadmap thay đổi sau mỗi lần crawl."""
+    payload = json.dumps(data or {}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def roadmap_max_age_seconds() -> float:
+    """TTL của roadmap đã crawl (ENV ROADMAP_TTL_HOURS, mặc định 7 ngày; <= 0 nghĩa là không hết hạn)."""
+    return float(get_env_var("ROADMAP_TTL_HOURS", "168")) * 3600
+
+
+def _parse_iso(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def is_fresh(doc: Dict[str, Any], max_age_seconds: Optional[float] = None) -> bool:
+    if max_age_seconds is None:
+        max_age_seconds = roadmap_max_age_seconds()
+    if max_age_seconds <= 0:
+        return True
+    crawled_at = _parse_iso(doc.get("crawled_at"))
+    if crawled_at is None:
+        return False
+    age = (datetime.now(timezone.utc) - crawled_at).total_seconds()
+    return age <= max_age_seconds
+
+
+# =========================
+# Read-through helpers (pymongo collection `roadmaps`)
+# =========================
+def roadmap_filter(target: str, level: Optional[str]) -> Dict[str, Any]:
+    """
+    Filter theo target đã chuẩn hóa; vẫn match document cũ (chưa có target_normalized)
+    qua `query` hoặc `target` gốc.
+    """
+    return {
+        "$or": [
+            {"target_normalized": normalize_target(target)},
+            {"query": target},
+            {"target": target},
+        ],
+        "level": level,
+    }
+
+
+def find_cached_roadmap(
+    collection: Any,
+    target: str,
+    level: Optional[str],
+    max_age_seconds: Optional[float] = None,
+    projection: Optional[Dict[str, Any]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Trả về roadmap mới nhất còn hạn cho (target, level), hoặc None nếu miss / đã cũ."""
+    doc = collection.find_one(
+        roadmap_filter(target, level),
+        projection=projection or CACHE_PROJECTION,
+        sort=[("crawled_at", -1)],
+    )
+    if doc and is_fresh(doc, max_age_seconds):
+        return doc
+    return None
+
+
+def save_roadmap(collection: Any, roadmap_data: Dict[str, Any], target: str, level: Optional[str]) -> Any:
+    """
+    Upsert roadmap theo (target_normalized, level) thay vì insert_one mỗi lần crawl.
+    Trả về _id của document.
+    """
+    from pymongo import ReturnDocument  # import lười để module không phụ thuộc pymongo khi import
+
+    doc = collection.find_one_and_update(
+        {"target_normalized": normalize_target(target), "level": level},
+        {"$set": {
+            **roadmap_data,
+            "target_normalized": normalize_target(target),
+            "level": level,
+            "content_hash": roadmap_hash(roadmap_data.get("data")),
+            "status": "completed",
+            # TTL index trên expires_at (ENV ROADMAP_EXPIRE_DAYS; không set → giữ vĩnh viễn)
+            "expires_at": ttl_expiry("ROADMAP_EXPIRE_DAYS"),
+        }},
+        upsert=True,
+        projection={"_id": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["_id"] if doc else None
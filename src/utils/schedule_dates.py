@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import copy
+import json
+import math
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional, Sequence, Union
+
+DATE_FMT = "%Y-%m-%d"
+
+# Khoảng thời lượng (tuần) dùng để gom nhóm lịch học: cache, template...
+DURATION_BUCKETS: Sequence[int] = (4, 8, 12, 24)
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """Nhận date / datetime / 'YYYY-MM-DD' (hoặc ISO datetime); sai định dạng → None."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not value:
+        return None
+    text = str(value).strip()
+    try:
+        return datetime.strptime(text[:10], DATE_FMT).date()
+    except ValueError:
+        return None
+
+
+def format_date(value: date) -> str:
+    return value.strftime(DATE_FMT)
+
+
+def weeks_between(start: date, end: date) -> int:
+    """Số tuần (làm tròn lên, tối thiểu 1) từ start tới end."""
+    return max(1, math.ceil(((end - start).days + 1) / 7))
+
+
+def duration_bucket(start: Optional[date], deadline: Optional[date], buckets: Sequence[int] = DURATION_BUCKETS) -> str:
+    """Gom thời lượng vào bucket nhỏ nhất đủ chứa: 'w4' | 'w8' | 'w12' | 'w24' | 'w24+' | 'none'."""
+    if start is None or deadline is None or deadline < start:
+        return "none"
+    weeks = weeks_between(start, deadline)
+    for limit in buckets:
+        if weeks <= limit:
+            return f"w{limit}"
+    return f"w{buckets[-1]}+"
+
+
+# =========================
+# Đọc JSON lịch học từ output LLM
+# =========================
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE | re.MULTILINE)
+
+
+def extract_schedule_json(result: Union[str, Dict[str, Any], None]) -> Optional[Dict[str, Any]]:
+    """
+    Lấy dict {"learning_path": [...], ...} từ kết quả GenSchedule (dict hoặc text có JSON,
+    có thể bọc trong ```json). Không đọc được → None.
+    """
+    if isinstance(result, dict):
+        data = result
+    elif isinstance(result, str):
+        text = _FENCE_RE.sub("", result.strip())
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end <= start:
+            return None
+        try:
+            data = json.loads(text[start:end + 1])
+        except ValueError:
+            return None
+    else:
+        return None
+
+    if not isinstance(data, dict) or not isinstance(data.get("learning_path"), list):
+        return None
+    return data
+
+
+# =========================
+# Dời lịch sang khoảng thời gian mới
+# =========================
+def redate_learning_path(schedule: Dict[str, Any], start: date, deadline: date) -> Dict[str, Any]:
+    """
+    Trả bản sao `schedule` với deadline từng tuần rải đều trong [start, deadline]
+    (mục cuối luôn = deadline). Thứ tự/nội dung objective giữ nguyên.
+    """
+    out = copy.deepcopy(schedule)
+    items = out.get("learning_path") or []
+    n = len(items)
+    if n == 0 or deadline < start:
+        return out
+
+    total_days = (deadline - start).days
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        offset = round((i + 1) * total_days / n)
+        item["deadline"] = format_date(start + timedelta(days=offset))
+    out["start_date"] = format_date(start)
+    out["deadline"] = format_date(deadline)
+    return out
+
+
+def redate_result(result: Union[str, Dict[str, Any]], start: date, deadline: date) -> Union[str, Dict[str, Any]]:
+    """Như redate_learning_path nhưng giữ kiểu kết quả gốc (dict → dict, text JSON → text JSON)."""
+    schedule = extract_schedule_json(result)
+    if schedule is None:
+        return result
+    redated = redate_learning_path(schedule, start, deadline)
+    if isinstance(result, dict):
+        return redated
+    return json.dumps(redated, ensure_ascii=False, indent=2)
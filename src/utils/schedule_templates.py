@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from src.utils.env import get_env_var
+from src.utils.roadmap_cache import normalize_target, roadmap_hash
+from src.utils.schedule_dates import (
+    DURATION_BUCKETS,
+    duration_bucket,
+    extract_schedule_json,
+    format_date,
+    redate_learning_path,
+)
+
+logger = logging.getLogger(__name__)
+
+# (req dict {"query", "level", "deadline", "mode"}, roadmap data) → kết quả GenSchedule
+GenerateFn = Callable[[Dict[str, Any], Dict[str, Any]], Any]
+
+
+# =========================
+# Template store
+# =========================
+class ScheduleTemplateStore:
+    """
+    Learning path dựng sẵn theo (target_normalized, level, bucket) — bucket: w4 | w8 | w12 | w24.
+    Mỗi template lưu kèm `roadmap_hash` của roadmap đã dùng để sinh.
+    """
+
+    def __init__(self, collection: Any, buckets: Sequence[int] = DURATION_BUCKETS):
+        self.collection = collection
+        self.buckets = tuple(buckets)
+
+    @property
+    def bucket_names(self) -> List[str]:
+        return [f"w{weeks}" for weeks in self.buckets]
+
+    @staticmethod
+    def _key(target: str, level: Optional[str], bucket: str) -> Dict[str, Any]:
+        return {"target_normalized": normalize_target(target), "level": level, "bucket": bucket}
+
+    def get(self, target: str, level: Optional[str], bucket: str) -> Optional[Dict[str, Any]]:
+        return self.collection.find_one(self._key(target, level, bucket))
+
+    def put(
+        self,
+        target: str,
+        level: Optional[str],
+        bucket: str,
+        schedule: Dict[str, Any],
+        content_hash: str,
+        mode: Optional[str] = None,
+    ) -> None:
+        self.collection.update_one(
+            self._key(target, level, bucket),
+            {"$set": {
+                "target": target,
+                "schedule": schedule,
+                "roadmap_hash": content_hash,
+                "mode": mode,
+                "updated_at": datetime.now(timezone.utc),
+            }},
+            upsert=True,
+        )
+
+    def has_templates(self, target: str, level: Optional[str]) -> bool:
+        return self.collection.count_documents(
+            {"target_normalized": normalize_target(target), "level": level}, limit=1
+        ) > 0
+
+    def missing_buckets(self, target: str, level: Optional[str], content_hash: str) -> List[str]:
+        """Bucket chưa có template hoặc template sinh từ roadmap cũ (hash khác)."""
+        fresh = {
+            doc["bucket"]
+            for doc in self.collection.find(
+                {"target_normalized": normalize_target(target), "level": level, "roadmap_hash": content_hash},
+                projection={"bucket": 1},
+            )
+        }
+        return [b for b in self.bucket_names if b not in fresh]
+
+    def serve(self, target: str, level: Optional[str], start: date, deadline: Optional[date]) -> Optional[Dict[str, Any]]:
+        """Template theo bucket của [start, deadline], dời deadline từng tuần theo khoảng của user."""
+        bucket = duration_bucket(start, deadline, self.buckets)
+        if bucket not in self.bucket_names:
+            return None
+        doc = self.get(target, level, bucket)
+        if not doc or not doc.get("schedule"):
+            return None
+        return redate_learning_path(doc["schedule"], start, deadline)
+
+
+# =========================
+# Precompute / refresh
+# =========================
+def build_templates(
+    store: ScheduleTemplateStore,
+    roadmap_doc: Dict[str, Any],
+    generate_fn: GenerateFn,
+    *,
+    mode: Optional[str] = None,
+    force: bool = False,
+    start: Optional[date] = None,
+) -> Dict[str, int]:
+    """Sinh template cho 1 roadmap document ở mọi bucket còn thiếu/cũ (force → sinh lại hết)."""
+    data = roadmap_doc.get("data") or {}
+    # Khoá theo target người dùng hỏi (query lúc crawl), không theo title của roadmap.sh
+    target = roadmap_doc.get("query") or roadmap_doc.get("target") or data.get("title") or ""
+    level = roadmap_doc.get("level")
+    content_hash = roadmap_doc.get("content_hash") or roadmap_hash(data)
+
+    buckets = store.bucket_names if force else store.missing_buckets(target, level, content_hash)
+    stats = {"generated": 0, "failed": 0, "skipped": len(store.bucket_names) - len(buckets)}
+    start = start or date.today()
+
+    for bucket in buckets:
+        weeks = int(bucket[1:])
+        deadline = start + timedelta(days=7 * weeks - 1)
+        req = {"query": target, "level": level, "deadline": format_date(deadline), "mode": mode}
+        try:
+            schedule = extract_schedule_json(generate_fn(req, data))
+        except Exception as e:
+            logger.error(f"❌ Template generation failed for '{target}' ({level}, {bucket}): {e}")
+            schedule = None
+        if schedule is None:
+            stats["failed"] += 1
+            continue
+        store.put(target, level, bucket, schedule, content_hash, mode)
+        stats["generated"] += 1
+
+    logger.info(f"✅ Templates for '{target}' ({level}): {stats}")
+    return stats
+
+
+def precompute_templates(
+    roadmaps: Any,
+    store: ScheduleTemplateStore,
+    generate_fn: GenerateFn,
+    *,
+    targets: Optional[Iterable[str]] = None,
+    mode: Optional[str] = None,
+    force: bool = False,
+) -> Dict[str, int]:
+    """Batch offline: mọi roadmap đã lưu (hoặc chỉ `targets`) × bucket."""
+    query: Dict[str, Any] = {"data": {"$ne": None}}
+    if targets:
+        query["target_normalized"] = {"$in": [normalize_target(t) for t in targets]}
+
+    totals = {"roadmaps": 0, "generated": 0, "failed": 0, "skipped": 0}
+    projection = {"data": 1, "query": 1, "target": 1, "level": 1, "content_hash": 1}
+    for doc in roadmaps.find(query, projection=projection):
+        stats = build_templates(store, doc, generate_fn, mode=mode, force=force)
+        totals["roadmaps"] += 1
+        for key, value in stats.items():
+            totals[key] += value
+    return totals
+
+
+def _gen_schedule(req: Dict[str, Any], data: Dict[str, Any]) -> Any:
+    from src.features.ai_schedule.schedule_controller import GenSchedule  # import lười (registry/LLM)
+
+    return GenSchedule(req, data)
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Precompute schedule templates for stored roadmaps")
+    parser.add_argument("--target", action="append", help="Chỉ sinh cho target này (lặp lại được)")
+    parser.add_argument("--mode", default=get_env_var("TEMPLATE_MODE"), help="planner | agent | scheduler")
+    parser.add_argument("--force", action="store_true", help="Sinh lại kể cả template còn mới")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    client = MongoClient(get_env_var("MONGODB_URI"), tls=True, serverSelectionTimeoutMS=8000)
+    db = client[get_env_var("DATABASE_NAME", "eup_ai_tutor")]
+    report = precompute_templates(
+        db["roadmaps"],
+        ScheduleTemplateStore(db["schedule_templates"]),
+        _gen_schedule,
+        targets=args.target,
+        mode=args.mode,
+        force=args.force,
+    )
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    client.close()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from src.utils.roadmap_cache import normalize_target
+
+logger = logging.getLogger(__name__)
+
+EmbedFn = Callable[[str], List[float]]
+
+
+def cache_key_text(query: str, level: Optional[str]) -> str:
+    """Text được embed làm khoá: (query, level) đã chuẩn hóa."""
+    return f"{normalize_target(query)} | {normalize_target(level)}"
+
+
+class SemanticCache:
+    """
+    Cache learning path theo ngữ nghĩa trên 1 collection Mongo.
+
+    Mỗi entry: embedding của (query, level) chuẩn hóa + bucket (mode + duration) → id document trong
+    learning_path_collection. Lookup: khớp chính xác theo hash trước, sau đó cosine trên các entry
+    cùng (bucket, level) còn hạn, lấy entry tốt nhất >= `threshold`.
+    Query ngắn (< `min_semantic_words` từ, vd "frontend developer" vs "backend developer") embed rất
+    gần nhau dù là target khác → chỉ nhận khớp chính xác target_normalized, không dùng cosine.
+    Hết hạn qua TTL index (expires_at); vượt `max_entries` thì xoá entry ít được dùng gần đây nhất.
+    """
+
+    def __init__(
+        self,
+        collection: Any,
+        embed_fn: EmbedFn,
+        *,
+        threshold: float = 0.92,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 5000,
+        min_semantic_words: int = 5,
+    ):
+        self.collection = collection
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.min_semantic_words = min_semantic_words
+
+    @staticmethod
+    def _hash(key_text: str, bucket: str) -> str:
+        return hashlib.sha256(f"{bucket}\x00{key_text}".encode("utf-8")).hexdigest()
+
+    def _touch(self, entry_id: Any, now: datetime) -> None:
+        self.collection.update_one({"_id": entry_id}, {"$set": {"last_hit_at": now}, "$inc": {"hits": 1}})
+
+    def lookup(self, query: str, level: Optional[str], bucket: str) -> Optional[Dict[str, Any]]:
+        """Trả entry khớp (kèm `similarity`) hoặc None."""
+        now = datetime.now(timezone.utc)
+        key_text = cache_key_text(query, level)
+        alive = {"expires_at": {"$gt": now}}
+
+        exact = self.collection.find_one({"key_hash": self._hash(key_text, bucket), **alive})
+        if exact:
+            self._touch(exact["_id"], now)
+            return {**exact, "similarity": 1.0}
+        if len(normalize_target(query).split()) < self.min_semantic_words:
+            return None
+
+        candidates = list(self.collection.find(
+            {"bucket": bucket, "level_normalized": normalize_target(level), **alive},
+            projection={"embedding": 1, "learning_path_id": 1, "start_date": 1, "deadline": 1, "key_text": 1},
+        ))
+        if not candidates:
+            return None
+
+        query_vec = np.asarray(self.embed_fn(key_text), dtype=np.float32)
+        matrix = np.asarray([c["embedding"] for c in candidates], dtype=np.float32)
+        sims = matrix @ query_vec / (
+            np.clip(np.linalg.norm(matrix, axis=1), 1e-12, None) * max(float(np.linalg.norm(query_vec)), 1e-12)
+        )
+        best = int(np.argmax(sims))
+        if float(sims[best]) < self.threshold:
+            return None
+
+        entry = candidates[best]
+        self._touch(entry["_id"], now)
+        return {**entry, "similarity": float(sims[best])}
+
+    def store(
+        self,
+        query: str,
+        level: Optional[str],
+        bucket: str,
+        learning_path_id: Any,
+        start_date: Optional[str] = None,
+        deadline: Optional[str] = None,
+    ) -> None:
+        now = datetime.now(timezone.utc)
+        key_text = cache_key_text(query, level)
+        key_hash = self._hash(key_text, bucket)
+        self.collection.update_one(
+            {"key_hash": key_hash},
+            {"$set": {
+                "key_text": key_text,
+                "bucket": bucket,
+                "level_normalized": normalize_target(level),
+                "embedding": [float(x) for x in self.embed_fn(key_text)],
+                "learning_path_id": learning_path_id,
+                "start_date": start_date,
+                "deadline": deadline,
+                "created_at": now,
+                "last_hit_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds),
+            }, "$setOnInsert": {"hits": 0}},
+            upsert=True,
+        )
+        self._evict()
+
+    def _evict(self) -> None:
+        overflow = self.collection.estimated_document_count() - self.max_entries
+        if overflow <= 0:
+            return
+        stale = [d["_id"] for d in self.collection.find({}, projection={"_id": 1}, sort=[("last_hit_at", 1)], limit=overflow)]
+        if stale:
+            self.collection.delete_many({"_id": {"$in": stale}})
+            logger.info(f"🧹 Evicted {len(stale)} semantic cache entrie(s)")
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from src.utils.executors import run_blocking
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+# =========================
+# In-process single-flight
+# =========================
+class SingleFlight:
+    """
+    Gộp các lời gọi đồng thời cùng `key`: chỉ lời gọi đầu tiên thực sự chạy `fn`,
+    các lời gọi sau await chung kết quả (hoặc exception) của lần chạy đó.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, "asyncio.Task[Any]"] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+
+            def _forget(done: "asyncio.Task[Any]") -> None:
+                if self._inflight.get(key) is done:
+                    self._inflight.pop(key, None)
+
+            task.add_done_callback(_forget)
+        else:
+            logger.info(f"🔁 Joining in-flight call for {key!r}")
+
+        # shield: 1 client huỷ request không được huỷ luôn crawl dùng chung
+        return await asyncio.shield(task)
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+
+# =========================
+# Cross-worker lease (Mongo)
+# =========================
+class MongoLease:
+    """
+    Lease đơn giản trên 1 collection Mongo để nhiều uvicorn worker không cùng crawl 1 key.
+    Document: {_id: key, owner, expires_at}; lease hết hạn tự động được chiếm lại.
+    """
+
+    def __init__(self, collection: Any, ttl_seconds: float = 180.0, owner: Optional[str] = None):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def acquire(self, key: str) -> bool:
+        from pymongo.errors import DuplicateKeyError
+
+        now = datetime.now(timezone.utc)
+        try:
+            # Chỉ match khi lease cũ đã hết hạn; nếu lease còn sống → upsert đụng _id → DuplicateKeyError
+            self.collection.update_one(
+                {"_id": key, "expires_at": {"$lt": now}},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.ttl_seconds)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def renew(self, key: str) -> bool:
+        """Gia hạn lease nếu process này vẫn là owner; False → lease đã mất (hết hạn + bị chiếm)."""
+        result = self.collection.update_one(
+            {"_id": key, "owner": self.owner},
+            {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)}},
+        )
+        return result.matched_count > 0
+
+    def release(self, key: str) -> None:
+        # Chỉ xoá khi còn là owner: lease đã bị worker khác chiếm thì để nguyên
+        self.collection.delete_one({"_id": key, "owner": self.owner})
+
+    async def keep_alive(self, key: str) -> None:
+        """Heartbeat: gia hạn lease mỗi ttl/3 trong lúc holder còn chạy; cancel task khi xong việc."""
+        interval = max(1.0, self.ttl_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await run_blocking("db", self.renew, key):
+                    logger.warning(f"⚠️ Lost lease '{key}' (expired and taken by another worker)")
+                    return
+            except Exception as e:
+                logger.warning(f"⚠️ Lease renewal failed for '{key}': {e}")
+
+    def is_held(self, key: str) -> bool:
+        now = datetime.now(timezone.utc)
+        return self.collection.count_documents({"_id": key, "expires_at": {"$gte": now}}, limit=1) > 0
+
+    async def wait_released(self, key: str, timeout: Optional[float] = None, poll: float = 1.0) -> bool:
+        """
+        Đợi worker khác nhả lease (True) hoặc hết `timeout` (False). `timeout` None → đợi đến khi
+        lease được nhả hoặc hết hạn (holder còn sống thì keep_alive gia hạn liên tục).
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while await run_blocking("db", self.is_held, key):
+            if deadline is not None and loop.time() >= deadline:
+                return False
+            await asyncio.sleep(poll)
+        return True
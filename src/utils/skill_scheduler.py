@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import json
+import logging
+from datetime import date, timedelta
+from typing import Any, Dict, List, Union
+
+from src.utils.schedule_dates import parse_date, redate_learning_path, weeks_between
+
+logger = logging.getLogger(__name__)
+
+# Effort ước lượng (đơn vị tương đối): mỗi subskill = BASE + SUBSUB × số sub-sub-skill
+BASE_EFFORT = 1.0
+SUBSUB_EFFORT = 0.5
+DEFAULT_WEEKS = 8
+
+# Tối đa số topic liệt kê trong 1 objective (phần còn lại rút gọn "+N more")
+MAX_TOPICS_PER_OBJECTIVE = 6
+
+
+# =========================
+# Làm phẳng cây roadmap
+# =========================
+def _name(node: Any) -> str:
+    if isinstance(node, dict):
+        return str(node.get("name") or "").strip()
+    return str(node or "").strip()
+
+
+def flatten_roadmap(roadmap: Union[Dict[str, Any], List[Dict[str, Any]], None]) -> List[Dict[str, Any]]:
+    """
+    Cây skills → subskills → subsubskills thành danh sách unit theo thứ tự roadmap
+    (thứ tự trên roadmap.sh = thứ tự tiên quyết). Mỗi unit: {skill, subskill, topics, effort}.
+    Subskill có thể là str (dữ liệu cũ) hoặc {"name", "subsubskills"}.
+    """
+    items = roadmap if isinstance(roadmap, list) else [roadmap or {}]
+    units: List[Dict[str, Any]] = []
+    for item in items:
+        for skill in (item or {}).get("skills", []) or []:
+            skill_name = _name(skill)
+            subskills = (skill.get("subskills") or []) if isinstance(skill, dict) else []
+            if not subskills:
+                if skill_name:
+                    units.append({"skill": skill_name, "subskill": None, "topics": [], "effort": BASE_EFFORT})
+                continue
+            for sub in subskills:
+                topics = [str(t).strip() for t in ((sub.get("subsubskills") or []) if isinstance(sub, dict) else []) if str(t).strip()]
+                units.append({
+                    "skill": skill_name,
+                    "subskill": _name(sub) or None,
+                    "topics": topics,
+                    "effort": BASE_EFFORT + SUBSUB_EFFORT * len(topics),
+                })
+    return units
+
+
+def _split_units(units: List[Dict[str, Any]], target_count: int) -> List[Dict[str, Any]]:
+    """Ít unit hơn số tuần → tách subskill lớn nhất thành từng sub-sub-skill (giữ thứ tự)."""
+    units = list(units)
+    while len(units) < target_count:
+        idx = max(range(len(units)), key=lambda i: len(units[i]["topics"]), default=None)
+        if idx is None or len(units[idx]["topics"]) < 2:
+            break
+        unit = units[idx]
+        parts = [
+            {"skill": unit["skill"], "subskill": unit["subskill"], "topics": [t], "effort": unit["effort"] / len(unit["topics"])}
+            for t in unit["topics"]
+        ]
+        units[idx:idx + 1] = parts
+    return units
+
+
+# =========================
+# Chia tuần
+# =========================
+def pack_weeks(units: List[Dict[str, Any]], weeks: int) -> List[List[Dict[str, Any]]]:
+    """
+    Chia unit (giữ nguyên thứ tự) thành `weeks` tuần liên tiếp, cân bằng theo effort:
+    unit vào tuần chứa điểm bắt đầu của nó trên trục effort tích lũy. O(n), không đảo thứ tự tiên quyết.
+    """
+    bins: List[List[Dict[str, Any]]] = [[] for _ in range(max(1, weeks))]
+    total = sum(u["effort"] for u in units)
+    if total <= 0:
+        return bins
+    cumulative = 0.0
+    for unit in units:
+        bins[min(len(bins) - 1, int(cumulative / total * len(bins) + 1e-9))].append(unit)
+        cumulative += unit["effort"]
+    return bins
+
+
+def _describe(units: List[Dict[str, Any]]) -> str:
+    """'Skill: Sub (a, b); Skill2: Sub2' — gộp theo skill, giữ thứ tự."""
+    groups: Dict[str, List[str]] = {}
+    for unit in units:
+        label = unit["subskill"] or ""
+        if unit["topics"]:
+            shown = unit["topics"][:MAX_TOPICS_PER_OBJECTIVE]
+            extra = len(unit["topics"]) - len(shown)
+            label = f"{label} ({', '.join(shown)}{f', +{extra} more' if extra else ''})".strip()
+        groups.setdefault(unit["skill"], [])
+        if label and label not in groups[unit["skill"]]:
+            groups[unit["skill"]].append(label)
+    return "; ".join(f"{skill}: {', '.join(labels)}" if labels else skill for skill, labels in groups.items())
+
+
+def build_schedule(
+    roadmap: Union[Dict[str, Any], List[Dict[str, Any]], None],
+    deadline: Any = None,
+    start_date: Any = None,
+    default_weeks: int = DEFAULT_WEEKS,
+) -> Dict[str, Any]:
+    """
+    Sinh lịch học theo tuần không cần LLM:
+    flatten cây → chia tuần theo effort → deadline từng tuần rải đều tới deadline cuối.
+    Tuần trống (unit lớn trải qua nhiều tuần) tiếp tục nội dung tuần trước + thực hành.
+    """
+    start = parse_date(start_date) or date.today()
+    end = parse_date(deadline)
+    if end is None or end < start:
+        end = start + timedelta(weeks=default_weeks) - timedelta(days=1)
+    weeks = weeks_between(start, end)
+
+    units = _split_units(flatten_roadmap(roadmap), weeks)
+    learning_path: List[Dict[str, Any]] = []
+    last_topics = ""
+    for i, bin_units in enumerate(pack_weeks(units, weeks)):
+        if bin_units:
+            last_topics = _describe(bin_units)
+            objective = last_topics
+        else:
+            objective = f"Continue and practice: {last_topics}" if last_topics else "Review and practice"
+        learning_path.append({
+            "week": i + 1,
+            "objective": objective,
+            "deadline": "",
+            "skills": list(dict.fromkeys(u["skill"] for u in bin_units)),
+        })
+
+    return redate_learning_path({"learning_path": learning_path, "source": "scheduler"}, start, end)
+
+
+# =========================
+# Diễn đạt lại objective bằng LLM (tuỳ chọn)
+# =========================
+def phrase_objectives(llm: Any, schedule: Dict[str, Any], learning_goal: str, user_knowledge: str = "") -> Dict[str, Any]:
+    """
+    1 lần gọi LLM viết lại objective từng tuần cho tự nhiên hơn; số tuần/deadline giữ nguyên.
+    Lỗi hoặc output sai dạng → giữ nguyên bản deterministic.
+    """
+    items = schedule.get("learning_path") or []
+    if not items:
+        return schedule
+    drafts = [item["objective"] for item in items]
+    prompt = (
+        f'Rewrite each weekly study objective for a learner whose goal is "{learning_goal}"'
+        + (f' (current level: "{user_knowledge}")' if user_knowledge else "")
+        + ". Keep the same topics and order, one concise sentence each.\n"
+        + "Return ONLY a JSON array of strings with exactly "
+        + f"{len(drafts)} elements.\n\n"
+        + json.dumps(drafts, ensure_ascii=False, indent=2)
+    )
+    try:
+        output = llm.invoke(prompt)
+        text = str(getattr(output, "content", output)).strip()
+        phrased = json.loads(text[text.find("["): text.rfind("]") + 1])
+    except Exception as e:
+        logger.warning(f"⚠️ Objective phrasing failed, keeping generated text: {e}")
+        return schedule
+    if not isinstance(phrased, list) or len(phrased) != len(items):
+        logger.warning("⚠️ Objective phrasing returned wrong shape, keeping generated text")
+        return schedule
+
+    out = {**schedule, "learning_path": [dict(item) for item in items]}
+    for item, text in zip(out["learning_path"], phrased):
+        if isinstance(text, str) and text.strip():
+            item["objective"] = text.strip()
+    return out
+
+
+def schedule_to_text(schedule: Dict[str, Any]) -> str:
+    return json.dumps(schedule, ensure_ascii=False, indent=2)
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, Dict, Optional
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+# Giới hạn độ dài observation gửi về client (kết quả tool có thể rất dài)
+MAX_OBSERVATION_CHARS = 500
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Đóng gói 1 sự kiện Server-Sent Events."""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class QueueCallbackHandler(BaseCallbackHandler):
+    """
+    Callback LangChain đẩy token LLM + bước của agent vào asyncio.Queue.
+    Agent chạy trong thread pool nên mọi put đều đi qua loop.call_soon_threadsafe.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: "asyncio.Queue[Optional[Dict[str, Any]]]"):
+        self.loop = loop
+        self.queue = queue
+
+    def _emit(self, event: str, data: Any) -> None:
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, {"event": event, "data": data})
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if token:
+            self._emit("token", {"text": token})
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: Any, **kwargs: Any) -> None:
+        self._emit("progress", {"stage": "llm_start"})
+
+    def on_agent_action(self, action: Any, **kwargs: Any) -> None:
+        self._emit("progress", {
+            "stage": "agent_action",
+            "tool": getattr(action, "tool", None),
+            "input": str(getattr(action, "tool_input", ""))[:MAX_OBSERVATION_CHARS],
+        })
+
+    def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        self._emit("progress", {"stage": "observation", "output": str(output)[:MAX_OBSERVATION_CHARS]})
+
+    def on_agent_finish(self, finish: Any, **kwargs: Any) -> None:
+        self._emit("progress", {"stage": "agent_finish"})
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import List, Union, Optional, Sequence, Tuple
+from typing import Any, Dict, Iterable, List, Union, Optional, Sequence, Tuple
+import hashlib
 import os
 
 from langchain_community.embeddings import HuggingFaceEmbeddings
@@ -12,24 +13,22 @@ except ImportError:
     from langchain.schema import Document  # fallback cho version cũ
 
 from src.utils.custom_emb import create_embeddings
+from src.utils.env import get_env_var
+from src.utils.numpy_store import NumpyVectorStore
+from src.utils.roadmap_cache import normalize_target
+
+# =========================
+# Backend: "chroma" (mặc định) | "numpy" (NumpyVectorStore, mmap .npy — hợp corpus nhỏ)
+# =========================
+_DEFAULT_DB_PATHS = {"chroma": "./chroma_db", "numpy": "./vector_index"}
 
-# --- Helper load config ---
-def get_env_var(key: str, default: Optional[str] = None) -> Optional[str]:
-    """
-    Lấy biến môi trường ưu tiên theo thứ tự:
-    1. os.environ (Render, Railway... sẽ set ở đây)
-    2. .env (nếu có)
-    3. default (nếu có)
-    """
-    value = os.environ.get(key)
-    if value:
-        return value
-    try:
-        from dotenv import dotenv_values
-        env_values = dotenv_values(".env")
-        return env_values.get(key, default)
-    except Exception:
-        return default
+
+def vector_backend() -> str:
+    return (get_env_var("VECTOR_BACKEND", "chroma") or "chroma").lower()
+
+
+def default_db_path() -> str:
+    return get_env_var("VECTORDB_PATH") or _DEFAULT_DB_PATHS.get(vector_backend(), "./chroma_db")
 
 
 # =========================
@@ -39,6 +38,37 @@ def _is_document_list(items: Sequence) -> bool:
     return len(items) > 0 and isinstance(items[0], Document)
 
 
+# =========================
+# ID ổn định cho chunk (content hash)
+# =========================
+def document_id(doc: Document) -> str:
+    """
+    ID ổn định = sha256(target đã chuẩn hóa [+ level] + nội dung chunk).
+    Cùng nội dung trong cùng (target, level) → cùng ID nên embed lại/ghi trùng được bỏ qua;
+    chunk giống nhau ở 2 level là 2 chunk riêng (mỗi level giữ đủ chunk của mình).
+    """
+    metadata = doc.metadata or {}
+    scope = str(metadata.get("target_normalized") or "")
+    if metadata.get("level"):
+        scope = f"{scope}\x00{metadata['level']}"
+    return hashlib.sha256(f"{scope}\x00{doc.page_content}".encode("utf-8")).hexdigest()
+
+
+def _unique_with_ids(documents: Iterable[Document]) -> Tuple[List[Document], List[str]]:
+    """Bỏ chunk trùng ID trong cùng 1 lô (giữ thứ tự)."""
+    docs: List[Document] = []
+    ids: List[str] = []
+    seen = set()
+    for doc in documents:
+        doc_id = document_id(doc)
+        if doc_id in seen:
+            continue
+        seen.add(doc_id)
+        docs.append(doc)
+        ids.append(doc_id)
+    return docs, ids
+
+
 # =========================
 # Tạo Vector Store
 # =========================
@@ -54,13 +84,22 @@ def create_vector_store(
             embeddings = create_embeddings()
 
         if db_path is None:
-            db_path = get_env_var("VECTORDB_PATH", "./chroma_db")
+            db_path = default_db_path()
 
         os.makedirs(db_path, exist_ok=True)
 
+        if vector_backend() == "numpy":
+            path = os.path.join(db_path, collection_name) if collection_name else db_path
+            dtype = get_env_var("VECTOR_DTYPE", "float32") or "float32"
+            if _is_document_list(texts):
+                docs, ids = _unique_with_ids(texts)
+                return NumpyVectorStore.from_documents(docs, embeddings, ids=ids, path=path, dtype=dtype)
+            return NumpyVectorStore.from_texts(texts, embeddings, path=path, dtype=dtype)
+
         if _is_document_list(texts):
+            docs, ids = _unique_with_ids(texts)
             vector_store = Chroma.from_documents(
-                texts, embedding=embeddings, persist_directory=db_path, collection_name=collection_name
+                docs, embedding=embeddings, ids=ids, persist_directory=db_path, collection_name=collection_name
             )
         else:
             vector_store = Chroma.from_texts(
@@ -88,11 +127,15 @@ def load_vector_store(
             embeddings = create_embeddings()
 
         if db_path is None:
-            db_path = get_env_var("VECTORDB_PATH", "./chroma_db")
+            db_path = default_db_path()
 
         if not os.path.isdir(db_path):
             raise FileNotFoundError(f"Vector DB path không tồn tại: {db_path}")
 
+        if vector_backend() == "numpy":
+            path = os.path.join(db_path, collection_name) if collection_name else db_path
+            return NumpyVectorStore(path, embeddings, dtype=get_env_var("VECTOR_DTYPE", "float32") or "float32")
+
         return Chroma(
             persist_directory=db_path,
             embedding_function=embeddings,
@@ -102,6 +145,64 @@ def load_vector_store(
         raise RuntimeError(f"Error loading vector store: {e}") from e
 
 
+# =========================
+# Ingest tăng dần (upsert theo content hash)
+# =========================
+def upsert_documents(vector_store: Chroma, documents: List[Document], batch_size: int = 256) -> Dict[str, Any]:
+    """
+    Chỉ embed + thêm các chunk chưa có trong store (theo document_id), bỏ qua chunk trùng.
+    Trả về {"ids": [...tất cả id của documents], "added": n, "skipped": m, "added_ids": [...]}.
+    """
+    docs, ids = _unique_with_ids(documents)
+    added_ids: List[str] = []
+    for start in range(0, len(docs), batch_size):
+        batch_docs = docs[start:start + batch_size]
+        batch_ids = ids[start:start + batch_size]
+
+        existing = set(vector_store.get(ids=batch_ids, include=[]).get("ids") or [])
+        new_docs = [d for d, i in zip(batch_docs, batch_ids) if i not in existing]
+        new_ids = [i for i in batch_ids if i not in existing]
+        if new_docs:
+            vector_store.add_documents(new_docs, ids=new_ids)
+            added_ids.extend(new_ids)
+
+    added = len(added_ids)
+    return {"ids": ids, "added": added, "skipped": len(documents) - added, "added_ids": added_ids}
+
+
+def ingest_scope(target_normalized: str, level: Optional[str] = None) -> Dict[str, Any]:
+    """Filter chunk của 1 lần ingest: target, thêm level nếu có (None = mọi level của target)."""
+    if level is None:
+        return {"target_normalized": target_normalized}
+    return {"$and": [{"target_normalized": target_normalized}, {"level": level}]}
+
+
+def delete_stale_chunks(
+    vector_store: Chroma, target_normalized: str, keep_ids: Iterable[str], level: Optional[str] = None
+) -> int:
+    """
+    Xoá các chunk của (`target_normalized`, `level`) không còn trong `keep_ids` (roadmap đã đổi nội dung).
+    Chunk của level khác cùng target không bị đụng tới.
+    """
+    if not target_normalized:
+        return 0
+    current = vector_store.get(where=ingest_scope(target_normalized, level), include=[]).get("ids") or []
+    keep = set(keep_ids)
+    stale = [i for i in current if i not in keep]
+    if stale:
+        vector_store.delete(ids=stale)
+    return len(stale)
+
+
+def sync_target_documents(
+    vector_store: Chroma, documents: List[Document], target_normalized: str, level: Optional[str] = None
+) -> Dict[str, Any]:
+    """Upsert chunk mới của 1 (target, level) rồi xoá chunk cũ không còn dùng của đúng phạm vi đó."""
+    stats = upsert_documents(vector_store, documents)
+    stats["deleted"] = delete_stale_chunks(vector_store, target_normalized, stats["ids"], level)
+    return stats
+
+
 # =========================
 # Truy vấn
 # =========================
@@ -110,11 +211,79 @@ def get_similar_docs(
     vector_store: Chroma,
     k: int = 5,
     with_score: bool = False,
+    filter: Optional[Dict[str, Any]] = None,
 ):
     try:
         if with_score:
-            return vector_store.similarity_search_with_score(query, k=k)
+            return vector_store.similarity_search_with_score(query, k=k, filter=filter)
         else:
-            return vector_store.similarity_search(query, k=k)
+            return vector_store.similarity_search(query, k=k, filter=filter)
     except Exception:
         return []  # Không raise để không vỡ luồng gọi
+
+
+def _where(**fields: Any) -> Optional[Dict[str, Any]]:
+    """Filter metadata kiểu Chroma từ các field có giá trị (nhiều field → $and)."""
+    clauses = [{key: value} for key, value in fields.items() if value]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def retrieval_scopes(
+    target: Optional[str] = None,
+    level: Optional[str] = None,
+    category: Optional[str] = None,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Thứ tự nới rộng phạm vi tìm kiếm:
+      (target, level) → target → category → toàn bộ collection (None)
+    Bỏ bước thiếu dữ liệu và bước trùng.
+    """
+    target_normalized = normalize_target(target) if target else None
+    level_normalized = normalize_target(level) if level else None
+    candidates = [
+        _where(target_normalized=target_normalized, level=level_normalized) if target_normalized and level_normalized else None,
+        _where(target_normalized=target_normalized),
+        _where(category=category),
+        None,
+    ]
+    scopes: List[Optional[Dict[str, Any]]] = []
+    for where in candidates[:-1]:
+        if where is not None and where not in scopes:
+            scopes.append(where)
+    scopes.append(None)
+    return scopes
+
+
+def get_scoped_docs(
+    query: str,
+    vector_store: Chroma,
+    k: int = 5,
+    with_score: bool = False,
+    target: Optional[str] = None,
+    level: Optional[str] = None,
+    category: Optional[str] = None,
+    min_results: Optional[int] = None,
+):
+    """
+    Retrieval giới hạn trong chunk của target được hỏi (lọc metadata trước khi so vector).
+    Phạm vi hẹp trả ít hơn `min_results` (mặc định = k) → nới sang phạm vi rộng hơn và
+    bổ sung kết quả còn thiếu (kết quả phạm vi hẹp luôn đứng trước).
+    """
+    min_results = k if min_results is None else min_results
+    collected: List[Any] = []
+    seen = set()
+    for where in retrieval_scopes(target, level, category):
+        for item in get_similar_docs(query, vector_store, k=k, with_score=True, filter=where):
+            doc = item[0]
+            key = (doc.page_content, str(sorted((doc.metadata or {}).items())))
+            if key in seen:
+                continue
+            seen.add(key)
+            collected.append(item)
+        if len(collected) >= min_results:
+            break
+
+    collected = collected[:k]
+    return collected if with_score else [doc for doc, _ in collected]
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from src.utils.numpy_store import NumpyVectorStore
+
+
+class FakeEmbeddings:
+    """Embedding xác định theo nội dung (đủ để kiểm tra upsert/tìm kiếm, không cần model)."""
+
+    dim = 16
+
+    def _vec(self, text):
+        rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+        return rng.standard_normal(self.dim).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vec(text)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "index")
+
+
+def _contents(store):
+    data = store.get()
+    return dict(zip(data["ids"], data["documents"]))
+
+
+def test_upsert_replaces_existing_id(path):
+    store = NumpyVectorStore(path, FakeEmbeddings())
+    store.add_texts(["a", "b"], ids=["1", "2"])
+    store.add_texts(["b2", "c"], ids=["2", "3"])
+
+    assert _contents(store) == {"1": "a", "2": "b2", "3": "c"}
+    doc, distance = store.similarity_search_with_score("b2", k=1)[0]
+    assert doc.page_content == "b2"
+    assert distance == pytest.approx(0.0, abs=1e-5)
+
+
+def test_duplicate_ids_in_one_batch_last_wins(path):
+    store = NumpyVectorStore(path, FakeEmbeddings())
+    store.add_texts(["x", "y", "z"], ids=["dup", "other", "dup"])
+
+    assert _contents(store) == {"dup": "z", "other": "y"}
+    assert len(store) == 2
+    assert store.similarity_search("z", k=1)[0].page_content == "z"
+
+
+def test_delete(path):
+    store = NumpyVectorStore(path, FakeEmbeddings())
+    store.add_texts(["a", "b", "c"], ids=["1", "2", "3"], metadatas=[{"t": "x"}, {"t": "y"}, {"t": "x"}])
+    store.delete(ids=["2", "missing"])
+
+    assert _contents(store) == {"1": "a", "3": "c"}
+    assert [d.page_content for d in store.similarity_search("a", k=5, filter={"t": "y"})] == []
+
+
+def test_two_instances_do_not_lose_writes(path):
+    first = NumpyVectorStore(path, FakeEmbeddings())
+    second = NumpyVectorStore(path, FakeEmbeddings())
+    first.add_texts(["n1"], ids=["n1"])
+    second.add_texts(["n2"], ids=["n2"])
+    first.delete(ids=["missing"])
+
+    assert _contents(NumpyVectorStore(path, FakeEmbeddings())) == {"n1": "n1", "n2": "n2"}
+    assert _contents(first) == {"n1": "n1", "n2": "n2"}